@@ -0,0 +1,194 @@
+# 生徒のAIクイズ用の問題プール
+# 生徒が「問題を出して」と押すたびにAIを呼ぶと数秒待たせるため、難易度ごとに問題を生成しておき、
+# 出題時はプール（ai_quiz_pool テーブル）から1問取り出して削除するだけにする。
+# 残りが AI_QUIZ_POOL_LOW 問を下回ったら、バックグラウンドのスレッドで AI_QUIZ_POOL_SIZE 問まで補充する。
+# 補充は AI_QUIZ_POOL_BATCH 問ずつまとめて1回のAI呼び出しで生成し、形式を確認した問題だけを追加する。
+# プールが空のときだけ、その場でAIを呼び出して1問作る。
+
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from models import db, AIQuizPoolItem
+from llm import complete
+from generation_jobs import parse_items
+
+# 設定の既定値（設定 AI_QUIZ_POOL_* で変更できる）
+DEFAULT_POOL_SIZE = 20  # 補充後の問題数
+DEFAULT_POOL_LOW = 5  # この問題数を下回ったら補充する
+DEFAULT_BATCH = 10  # 1回のAI呼び出しで生成する問題数
+# 1回の補充でAIを呼び出す回数の上限（形式の合わない応答が続いても呼び続けないため）
+MAX_BATCHES = 4
+
+DIFFICULTIES = {
+    'easy': 'N5レベル（最も簡単）',
+    'medium': 'N4レベル（普通）',
+    'hard': 'N3レベル（難しい）'
+}
+
+# 補充はプロセスごとに1スレッドで順に行う
+_executor = ThreadPoolExecutor(max_workers=1)
+_lock = threading.Lock()
+_refilling = set()  # 補充を予約・実行中の難易度
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def _batch_prompt(difficulty, count):
+    return f"""日本語学習者のために、{DIFFICULTIES[difficulty]}の熟語クイズを{count}問作ってください。
+
+以下のJSON配列形式で回答してください（他のテキストは含めないでください）：
+[
+  {{
+    "word": "熟語（漢字）",
+    "correct_reading": "正しい読み方",
+    "wrong_readings": ["間違い1", "間違い2", "間違い3"],
+    "meaning_chinese": "中国語の意味（ピンイン付き）",
+    "example": "例文"
+  }}
+]
+
+各問題は異なる熟語にしてください。間違い選択肢は、正解と似ているが間違っているものにしてください。"""
+
+
+def _single_prompt(difficulty):
+    return f"""日本語学習者のために、{DIFFICULTIES[difficulty]}の熟語クイズを1問作ってください。
+
+以下のJSON形式で回答してください（他のテキストは含めないでください）：
+{{
+    "word": "熟語（漢字）",
+    "correct_reading": "正しい読み方",
+    "wrong_readings": ["間違い1", "間違い2", "間違い3"],
+    "meaning_chinese": "中国語の意味（ピンイン付き）",
+    "example": "例文"
+}}"""
+
+
+def validate_quiz(data):
+    """AIが生成した問題を出題できる形にそろえる（使えない問題は None）"""
+    if not isinstance(data, dict):
+        return None
+    word = str(data.get('word') or '').strip()
+    correct = str(data.get('correct_reading') or '').strip()
+    if not word or not correct:
+        return None
+    wrong = []
+    for reading in data.get('wrong_readings') or []:
+        reading = str(reading).strip()
+        if reading and reading != correct and reading not in wrong:
+            wrong.append(reading)
+    if len(wrong) < 3:
+        return None
+    return {
+        'word': word,
+        'correct_reading': correct,
+        'wrong_readings': wrong[:3],
+        'meaning_chinese': str(data.get('meaning_chinese') or '').strip(),
+        'example': str(data.get('example') or '').strip(),
+    }
+
+
+def pool_size(difficulty):
+    return db.session.query(db.func.count(AIQuizPoolItem.id)).filter(
+        AIQuizPoolItem.difficulty == difficulty
+    ).scalar()
+
+
+def refill_pool(difficulty):
+    """プールを AI_QUIZ_POOL_SIZE 問まで補充（アプリケーションコンテキスト内で呼ぶ）
+
+    戻り値: 追加した問題数
+    """
+    target = _config('AI_QUIZ_POOL_SIZE', DEFAULT_POOL_SIZE)
+    batch = _config('AI_QUIZ_POOL_BATCH', DEFAULT_BATCH)
+    added = 0
+    for _ in range(MAX_BATCHES):
+        missing = target - pool_size(difficulty)
+        # プールにある熟語とは重ならないようにする（プールは数十問なので全件読む）
+        words = {data.get('word') for data, in db.session.query(AIQuizPoolItem.data).filter(
+            AIQuizPoolItem.difficulty == difficulty
+        )}
+        # AIの応答を待つ間はトランザクションを開いたままにしない
+        db.session.commit()
+        if missing <= 0:
+            break
+        # 毎回違う問題が欲しいのでキャッシュ済みの応答は使わない
+        text = complete(_batch_prompt(difficulty, min(batch, missing)), use_cache=False)
+        items = []
+        for data in parse_items(text):
+            quiz = validate_quiz(data)
+            if quiz and quiz['word'] not in words:
+                words.add(quiz['word'])
+                items.append({'difficulty': difficulty, 'data': quiz})
+        if items:
+            db.session.execute(db.insert(AIQuizPoolItem), items[:missing])
+            db.session.commit()
+            added += len(items[:missing])
+    return added
+
+
+def _refill_in_background(app, difficulty):
+    with app.app_context():
+        try:
+            refill_pool(difficulty)
+        except Exception as e:
+            db.session.rollback()
+            print(f"AI Quiz Pool Refill Error: {e}")
+        finally:
+            db.session.remove()
+            with _lock:
+                _refilling.discard(difficulty)
+
+
+def schedule_refill(difficulty):
+    """プールの補充をバックグラウンドで開始（補充中なら何もしない）"""
+    with _lock:
+        if difficulty in _refilling:
+            return
+        _refilling.add(difficulty)
+    _executor.submit(_refill_in_background, current_app._get_current_object(), difficulty)
+
+
+def _pop(difficulty):
+    """プールの一番古い問題を取り出して削除（他のリクエストに先に取られたら次の問題を試す）"""
+    for _ in range(3):
+        item = db.session.query(AIQuizPoolItem.id, AIQuizPoolItem.data).filter(
+            AIQuizPoolItem.difficulty == difficulty
+        ).order_by(AIQuizPoolItem.id).first()
+        if item is None:
+            return None
+        claimed = db.session.execute(
+            db.delete(AIQuizPoolItem).where(AIQuizPoolItem.id == item.id)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return item.data
+    return None
+
+
+def _generate_one(difficulty):
+    """その場でAIを呼び出して1問作る（プールが空のとき）"""
+    text = complete(_single_prompt(difficulty), max_tokens=500, use_cache=False)
+    json_match = re.search(r'\{[^{}]*\}', text or '', re.DOTALL)
+    return validate_quiz(json.loads(json_match.group())) if json_match else None
+
+
+def get_ai_quiz(difficulty):
+    """AIクイズを1問取得（プールから取り出し、残りが少なければ補充を予約する）
+
+    戻り値: 問題の辞書。生成できなければ None
+    """
+    if difficulty not in DIFFICULTIES:
+        difficulty = 'medium'
+    quiz = _pop(difficulty)
+    if quiz is None or pool_size(difficulty) < _config('AI_QUIZ_POOL_LOW', DEFAULT_POOL_LOW):
+        schedule_refill(difficulty)
+    db.session.commit()
+    if quiz is None:
+        quiz = _generate_one(difficulty)
+    return quiz
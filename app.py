@@ -1,17 +1,17 @@
 # 石川七夢講師専用学習アプリ - メインアプリケーション
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_migrate import Migrate
+from sqlalchemy.orm import joinedload, defer
 from config import Config
-from models import db, User, Problem, Answer, Feedback, Announcement, AnnouncementReaction, ProblemComponent, JapaneseQuiz, JapaneseAnswer, JapaneseAssignment, JapaneseFlashcard, JapaneseWriting, GradeKanji, JapaneseFlashcardAssignment, JapaneseWritingAssignment
+from models import db, User, Problem, Answer, Feedback, Announcement, AnnouncementReaction, ProblemComponent, JapaneseQuiz, JapaneseAnswer, JapaneseAssignment, JapaneseFlashcard, JapaneseWriting, GradeKanji, JapaneseFlashcardAssignment, JapaneseWritingAssignment, JapaneseTaskSummary, InboxVersion, GenerationJob
 from functools import wraps
-import hashlib
 import json
 import os
 import random
 from bs4 import BeautifulSoup
-from groq import Groq
+from llm import complete, stream_cached, get_cache_stats
 from firebase_notifications import (
     send_push_notification, send_push_to_users,
     send_announcement_notification, send_problem_notification,
@@ -20,10 +20,32 @@ from firebase_notifications import (
     send_japanese_assignment_notification, send_japanese_answer_notification,
     send_japanese_feedback_notification
 )
-
-# Groq API設定
-GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "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")
-groq_client = Groq(api_key=GROQ_API_KEY)
+from task_summary import (
+    get_student_japanese_tasks, refresh_task_summaries,
+    summary_key, collect_summary_keys,
+    get_group_navigation, find_next_pending
+)
+from japanese_delivery import deliver_japanese_items, notify_delivery
+from blob_store import save_data_url, parse_key, blob_path
+from image_derivatives import VARIANTS, derivative_format, generate_derivative, schedule_derivatives
+from review_queue import get_review_queue, DEFAULT_PAGE_SIZE
+from listing import get_page, count_items
+from search_index import search as search_documents, index_problem, index_announcement, remove_documents
+from components import save_components_from_html, schedule_component_extraction
+from plain_text import summarize_answer, update_answer_text, update_announcement_text
+from progress import get_student_progress, get_class_matrix, SOURCES, SOURCE_LABELS
+from user_cache import get_user, invalidate_user
+from quiz_sampler import sample_quiz, invalidate_quiz_pool
+from deck import get_deck_page, invalidate_deck, DECKS, MAX_PREFETCH
+from japanese_stats import get_japanese_stats, get_weak_words, record_answer
+from generation_jobs import enqueue_job, job_status, get_active_jobs, expire_if_stale, resume_jobs
+from ai_quiz_pool import get_ai_quiz
+from dashboard_stats import get_dashboard_stats, adjust_stats, pending_answers_query
+from inbox import bump_inbox, bump_role, get_inbox, INBOX_FIELDS
+from live_events import (
+    stream as live_event_stream, release_stream, publish_problem, publish_announcement,
+    publish_feedback, publish_answer
+)
 
 # アプリケーション初期化
 app = Flask(__name__)
@@ -91,6 +113,9 @@ with app.app_context():
 # フィルター定義
 @app.template_filter('from_json_safe')
 def from_json_safe_filter(s):
+    # JSONカラムの値（読み込み済みのリスト・辞書）はそのまま返す
+    if isinstance(s, (list, dict)):
+        return s
     try:
         import json
         return json.loads(s)
@@ -110,31 +135,12 @@ def to_jst_filter(utc_dt, fmt='%Y/%m/%d %H:%M'):
 
 @app.template_filter('format_mixed_answer')
 def format_mixed_answer_filter(content, problem_type='text'):
-    """mixed問題の回答をJSON形式から人が読める形式に変換"""
-    if problem_type != 'mixed':
-        # mixed以外はそのまま返す（HTMLタグを除去）
-        from bs4 import BeautifulSoup
-        return BeautifulSoup(content, 'html.parser').get_text()[:100]
-    
-    try:
-        import json
-        answers = json.loads(content)
-        parts = []
-        for key, answer in answers.items():
-            if answer.get('type') == 'text':
-                val = answer.get('value', '')
-                if val:
-                    parts.append(val[:50])
-            elif answer.get('type') == 'choice':
-                parts.append(f"選択: {answer.get('choice_text', '')}")
-            elif answer.get('type') == 'checkbox':
-                texts = answer.get('choice_text', [])
-                if texts:
-                    parts.append(f"選択: {', '.join(texts[:3])}")
-        return ' / '.join(parts)[:100] if parts else '(回答あり)'
-    except:
-        # JSONパースに失敗した場合はそのまま（truncate）
-        return content[:100] if len(content) > 100 else content
+    """mixed問題の回答をJSON形式から人が読める形式に変換
+
+    回答の保存時に Answer.summary へ保存しているので、一覧では summary を使う
+    （このフィルターは summary が未作成の古い回答用）
+    """
+    return summarize_answer(content, problem_type)
 
 # ログイン管理
 login_manager = LoginManager()
@@ -144,7 +150,17 @@ login_manager.login_message = 'ログインが必要です。'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return get_user(int(user_id))
+
+
+@app.before_request
+def resume_generation_jobs():
+    """前のプロセスで未処理・中断されたAI生成ジョブを処理（プロセスごとに最初のリクエストで1回だけ）"""
+    try:
+        resume_jobs()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Resume Generation Jobs Error: {e}")
 
 
 # 先生専用デコレーター
@@ -203,65 +219,61 @@ def logout():
     return redirect(url_for('login'))
 
 
+@app.route('/api/events')
+@login_required
+def live_events_stream():
+    """リアルタイム更新のSSEストリーム（/api/check-new のポーリングの代わり）"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    events = live_event_stream(current_user.id, current_user.role, last_event_id)
+    # ストリーム中はDBを使わないので、接続をプールに返しておく
+    db.session.remove()
+    if events is None:
+        # 同時接続数の上限に達している（ブラウザは /api/check-new のポーリングに切り替える）
+        return jsonify({'error': 'too many streams', 'poll': url_for('check_new')}), 503
+    response = app.response_class(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    response.call_on_close(release_stream)
+    return response
+
+
 @app.route('/api/check-new')
 @login_required
 def check_new():
-    """新着をチェックするAPI"""
-    import json
-    from datetime import datetime, timedelta
+    """新着をチェックするAPI
+
+    新着カウンターを主キー1回で読み、前回チェック時の値との差を新着件数として返す。
+    ?since=<version> を指定すると、そのバージョン以降に新着があるかも返す。
+    """
     from flask import session
     
-    # 最後のチェック時刻を取得（なければ1時間前）
-    last_check = session.get('last_notification_check')
-    if last_check:
-        last_check = datetime.fromisoformat(last_check)
-    else:
-        last_check = datetime.utcnow() - timedelta(hours=1)
+    inbox = get_inbox(current_user.id)
     
-    # 現在時刻を保存
-    session['last_notification_check'] = datetime.utcnow().isoformat()
+    # 前回チェック時のカウンター（初回は現在値を基準にする）
+    last_seen = session.get('inbox_seen') or inbox
+    session['inbox_seen'] = inbox
+    new = {field: max(inbox[field] - last_seen.get(field, 0), 0) for field in INBOX_FIELDS}
     
     result = {
-        'new_problems': 0,
-        'new_announcements': 0,
-        'new_feedback': 0
+        'version': inbox['version'],
+        'new_problems': new['problems'],
+        'new_announcements': new['announcements'],
+        # 先生は新しい回答、生徒は新しいフィードバック
+        'new_feedback': new['answers'] if current_user.is_teacher() else new['feedback'],
+        'new_japanese': new['japanese'],
     }
     
-    if current_user.is_teacher():
-        # 先生: 新しい回答をチェック
-        result['new_feedback'] = Answer.query.filter(
-            Answer.submitted_at > last_check
-        ).count()
-    else:
-        # 生徒: 新しい問題と連絡事項をチェック
-        from sqlalchemy import or_
-        
-        # 新しい問題
-        new_problems = current_user.assigned_problems.filter(
-            Problem.created_at > last_check
-        ).count()
-        result['new_problems'] = new_problems
-        
-        # 新しい連絡事項
-        new_announcements = Announcement.query.filter(
-            Announcement.is_active == True,
-            Announcement.created_at > last_check
-        ).filter(
-            or_(
-                Announcement.is_global == True,
-                Announcement.recipients.any(id=current_user.id)
-            )
-        ).count()
-        result['new_announcements'] = new_announcements
-        
-        # 新しいフィードバック
-        new_feedback = db.session.query(Feedback).join(Answer).filter(
-            Answer.student_id == current_user.id,
-            Feedback.created_at > last_check
-        ).count()
-        result['new_feedback'] = new_feedback
+    since = request.args.get('since', type=int)
+    if since is not None:
+        result['has_new'] = inbox['version'] > since
     
-    return json.dumps(result), 200, {'Content-Type': 'application/json'}
+    return jsonify(result)
 
 
 @app.route('/api/save-fcm-token', methods=['POST'])
@@ -275,6 +287,7 @@ def save_fcm_token():
     if token:
         current_user.fcm_token = token
         db.session.commit()
+        invalidate_user(current_user.id)
         return json.dumps({'success': True}), 200, {'Content-Type': 'application/json'}
     
     return json.dumps({'success': False}), 400, {'Content-Type': 'application/json'}
@@ -366,6 +379,15 @@ def notify_problem_viewed(problem_id):
     
     return json.dumps({'success': True}), 200, {'Content-Type': 'application/json'}
 
+
+def student_problems_query():
+    """生徒ダッシュボードに表示する問題（全件・新しい順）
+
+    並べ替えは (created_at, id) のインデックスの順に読むだけで済む（check_query_plans.py で確認）
+    """
+    return Problem.query.order_by(Problem.created_at.desc())
+
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
@@ -375,17 +397,8 @@ def dashboard():
         # 最新の問題5件のみ表示
         problems = Problem.query.order_by(Problem.created_at.desc()).limit(5).all()
         
-        # ディスク使用量取得
-        import shutil
-        total, used, free = shutil.disk_usage("/")
-        
-        stats = {
-            'problems': Problem.query.count(),
-            'students': User.query.filter_by(role='student').count(),
-            'pending_answers': Answer.query.filter(Answer.feedback == None).count(),
-            'disk_used_percent': int((used / total) * 100),
-            'disk_free_gb': round(free / (1024**3), 2)
-        }
+        # 件数・容量は集計行から読む（容量はバックグラウンドで計測）
+        stats = get_dashboard_stats()
         from datetime import datetime
         return render_template('dashboard.html', problems=problems, stats=stats, announcements=announcements, now=datetime.utcnow())
     else:
@@ -401,145 +414,10 @@ def dashboard():
         ).order_by(Announcement.created_at.desc()).limit(5).all()
         
         # 通常の問題を取得
-        problems = Problem.query.order_by(Problem.created_at.desc()).all()
-        
-        # 日本語課題の取得と統合
-        japanese_tasks = []
+        problems = student_problems_query().all()
         
-        # クイズ（全てグループ化）
-        quiz_assignments_all = current_user.japanese_assignments.order_by(
-            JapaneseAssignment.assigned_at.desc(),
-            JapaneseAssignment.id
-        ).all()
-        
-        from itertools import groupby
-        # 分単位でグルーピングするためのキー関数
-        def get_quiz_group_key(q):
-            return q.assigned_at.strftime('%Y-%m-%d %H:%M')
-        
-        for key, group in groupby(quiz_assignments_all, key=get_quiz_group_key):
-            items = list(group)
-            if not items:
-                continue
-                
-            # グループ内の最新の日時を使用
-            group_date = items[0].assigned_at
-            count = len(items)
-            
-            # ソート順を古い順（解く順番）にするためにIDでソートし直す
-            items.sort(key=lambda x: x.id)
-            first_item = items[0]
-            
-            # グループ内の完了状況を計算
-            completed_count = sum(1 for item in items if item.completed)
-            all_completed = (completed_count == count)
-            
-            # フィードバックがあるかチェック
-            has_feedback = any(item.teacher_feedback for item in items)
-            has_unseen_feedback = any(item.teacher_feedback and not item.feedback_seen for item in items)
-            
-            # 未完了のものがあれば最初の未完了を、なければ最初の完了を表示
-            next_item = next((item for item in items if not item.completed), first_item)
-            
-            japanese_tasks.append({
-                'type': 'quiz_group',
-                'title': f"熟語クイズ ({completed_count}/{count}問完了)" if all_completed else f"熟語クイズ ({count}問)",
-                'id': next_item.quiz.id,
-                'assignment_id': next_item.id,
-                'created_at': group_date,
-                'completed': all_completed,
-                'feedback': has_feedback,
-                'unseen_feedback': has_unseen_feedback,
-                'count': count,
-                'items': items
-            })
-            
-        # フラッシュカード（全てグループ化）
-        flashcard_assignments = current_user.japanese_flashcard_assignments.order_by(
-            JapaneseFlashcardAssignment.assigned_at.desc(), 
-            JapaneseFlashcardAssignment.id
-        ).all()
-        
-        def get_flashcard_group_key(fa):
-            return fa.assigned_at.strftime('%Y-%m-%d %H:%M')
-        
-        for key, group in groupby(flashcard_assignments, key=get_flashcard_group_key):
-            items = list(group)
-            if not items:
-                continue
-            group_date = items[0].assigned_at
-            count = len(items)
-            items.sort(key=lambda x: x.id)
-            first_item = items[0]
-            
-            # グループ内の完了状況を計算
-            completed_count = sum(1 for item in items if item.completed)
-            all_completed = (completed_count == count)
-            
-            # フィードバックがあるかチェック
-            has_feedback = any(item.teacher_feedback for item in items)
-            has_unseen_feedback = any(item.teacher_feedback and not item.feedback_seen for item in items)
-            
-            # 未完了のものがあれば最初の未完了を、なければ最初の完了を表示
-            next_item = next((item for item in items if not item.completed), first_item)
-            
-            japanese_tasks.append({
-                'type': 'flashcard_group',
-                'title': f"フラッシュカード ({completed_count}/{count}枚完了)" if all_completed else f"フラッシュカード ({count}枚)",
-                'id': next_item.flashcard.id,
-                'assignment_id': next_item.id,
-                'created_at': group_date,
-                'completed': all_completed,
-                'feedback': has_feedback,
-                'unseen_feedback': has_unseen_feedback,
-                'count': count,
-                'items': items
-            })
-            
-        # 書き取り（全てグループ化）
-        writing_assignments = current_user.japanese_writing_assignments.order_by(
-            JapaneseWritingAssignment.assigned_at.desc(),
-            JapaneseWritingAssignment.id
-        ).all()
-        
-        def get_writing_group_key(wa):
-            return wa.assigned_at.strftime('%Y-%m-%d %H:%M')
-        
-        for key, group in groupby(writing_assignments, key=get_writing_group_key):
-            items = list(group)
-            if not items:
-                continue
-            group_date = items[0].assigned_at
-            count = len(items)
-            items.sort(key=lambda x: x.id)
-            first_item = items[0]
-            
-            # グループ内の完了状況を計算
-            completed_count = sum(1 for item in items if item.completed)
-            all_completed = (completed_count == count)
-            
-            # フィードバックがあるかチェック
-            has_feedback = any(item.teacher_feedback for item in items)
-            has_unseen_feedback = any(item.teacher_feedback and not item.feedback_seen for item in items)
-            
-            # 未完了のものがあれば最初の未完了を、なければ最初の完了を表示
-            next_item = next((item for item in items if not item.completed), first_item)
-            
-            japanese_tasks.append({
-                'type': 'writing_group',
-                'title': f"書き取り練習 ({completed_count}/{count}問完了)" if all_completed else f"書き取り練習 ({count}問)",
-                'id': next_item.writing.id,
-                'assignment_id': next_item.id,
-                'created_at': group_date,
-                'completed': all_completed,
-                'feedback': has_feedback,
-                'unseen_feedback': has_unseen_feedback,
-                'count': count,
-                'items': items
-            })
-            
-        # 日付順にソート（新しい順）
-        japanese_tasks.sort(key=lambda x: x['created_at'], reverse=True)
+        # 日本語課題の取得と統合（集計テーブルから新しい順に取得）
+        japanese_tasks = get_student_japanese_tasks(current_user.id)
         
         # 生徒の学習統計を計算
         total_assigned = len(problems) + len(japanese_tasks)
@@ -571,83 +449,77 @@ def dashboard():
         return render_template('dashboard.html', problems=problems, japanese_tasks=japanese_tasks, announcements=announcements, student_stats=student_stats, now=datetime.utcnow())
 
 
-def save_components_from_html(html_content):
-    """HTMLコンテンツからコンポーネントを抽出して保存"""
-    if not html_content:
-        return
+# ============ 問題管理 ============
+
+@app.route('/teacher/problems')
+@login_required
+@teacher_required
+def manage_problems():
+    # 本文は読まずにプレビュー用の先頭だけを読む。続きは api_list_page から読み込む
+    page = get_page('problems')
+    return render_template('manage_problems.html', page=page, total=count_items('problems'))
+
+
+# 「もっと見る」で読み込む一覧: 種類 -> (listing.py の一覧名, 1件分のテンプレート)
+LIST_VIEWS = {
+    'problems': ('problems', 'partials/problem_item.html'),
+    'past_problems': ('problems', 'partials/past_problem_item.html'),
+    'announcements': ('announcements', 'partials/announcement_item.html'),
+    'flashcards': ('flashcards', 'partials/flashcard_item.html'),
+    'writings': ('writings', 'partials/writing_item.html'),
+    'send_quizzes': ('quizzes', 'partials/send_quiz_item.html'),
+    'send_flashcards': ('flashcards', 'partials/send_flashcard_item.html'),
+    'send_writings': ('writings', 'partials/send_writing_item.html'),
+}
 
+
+@app.route('/api/lists/<view>')
+@login_required
+@teacher_required
+def api_list_page(view):
+    """先生用：一覧の続きのページ（keysetページング）
+
+    items: 項目のデータ、html: ページと同じテンプレートで描画した項目、next_cursor: 次ページのカーソル
+    """
+    if view not in LIST_VIEWS:
+        return jsonify({'error': '不明な一覧です'}), 404
+    name, template = LIST_VIEWS[view]
+    limit = request.args.get('limit', 30, type=int)
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # テキストブロックとウィジェットブロックを抽出
-        # block-text または question-widget を探す
-        # 保存されるHTML構造に依存する
-        
-        # テキストブロック
-        text_blocks = soup.find_all(class_='block-text')
-        for block in text_blocks:
-            content = str(block.decode_contents()).strip() # innerHTML
-            if not content: continue
-            
-            # ハッシュ計算 (type + content)
-            raw_data = f"text:{content}"
-            content_hash = hashlib.sha256(raw_data.encode('utf-8')).hexdigest()
-            
-            # 重複チェック
-            if not ProblemComponent.query.filter_by(content_hash=content_hash).first():
-                comp = ProblemComponent(
-                    content=content,
-                    component_type='text',
-                    content_hash=content_hash,
-                    description=None,
-                    choices_json=None
-                )
-                db.session.add(comp)
+        page = get_page(name, cursor=request.args.get('cursor') or None, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        # ウィジェット
-        widgets = soup.find_all(class_='question-widget')
-        for widget in widgets:
-            w_type = widget.get('data-widget-type', 'unknown')
-            w_choices = widget.get('data-choices', '[]')
-            
-            # 説明文抽出
-            description = ''
-            desc_div = widget.find(class_='widget-description')
-            if desc_div:
-                description = desc_div.get_text("\n", strip=True) # 改行を維持してテキスト化
-            
-            # ハッシュ計算 (type + choices + description)
-            # コンテンツ自体はHTML全体として保存するが、同一性の判定はメタデータで行う
-            raw_data = f"widget:{w_type}:{w_choices}:{description}"
-            content_hash = hashlib.sha256(raw_data.encode('utf-8')).hexdigest()
-            
-            if not ProblemComponent.query.filter_by(content_hash=content_hash).first():
-                # ウィジェット全体をHTMLとして保存（再利用時にそのまま埋め込めるように）
-                # ただし、外側のdivは再生成されることが多いので、widgetの中身だけあるいはwidgetタグそのものを利用
-                comp = ProblemComponent(
-                    content=str(widget), # widgetタグそのもの
-                    component_type=f"widget-{w_type}",
-                    content_hash=content_hash,
-                    description=description,
-                    choices_json=w_choices
-                )
-                db.session.add(comp)
-        
-        db.session.commit()
-            
-    except Exception as e:
-        print(f"Error saving components: {e}")
+    html = ''.join(render_template(template, item=item) for item in page['items'])
+    for item in page['items']:
+        item['created_at'] = item['created_at'].isoformat() if item['created_at'] else None
+    return jsonify({'items': page['items'], 'html': html, 'next_cursor': page['next_cursor']})
 
 
+@app.route('/api/problems/<int:problem_id>/content')
+@login_required
+@teacher_required
+def api_problem_content(problem_id):
+    """先生用：問題の本文HTML（問題作成画面で過去の問題を引用するときに読み込む）"""
+    content = db.session.query(Problem.content).filter(Problem.id == problem_id).scalar()
+    if content is None:
+        return jsonify({'error': '問題が見つかりません'}), 404
+    return jsonify({'content': content})
 
-# ============ 問題管理 ============
 
-@app.route('/teacher/problems')
+@app.route('/api/search')
 @login_required
 @teacher_required
-def manage_problems():
-    problems = Problem.query.order_by(Problem.created_at.desc()).all()
-    return render_template('manage_problems.html', problems=problems)
+def api_search():
+    """先生用：問題・コンポーネント・連絡事項の全文検索（スコア順、ページ単位）
+
+    q: 検索語、types: 'problem,component,announcement' のうち検索する種類（省略時は全種類）
+    """
+    query = request.args.get('q', '').strip()
+    types = [t for t in request.args.get('types', '').split(',') if t]
+    page = request.args.get('page', 1, type=int)
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(search_documents(query, doc_types=types, page=page, limit=limit))
 
 @app.route('/problem/create', methods=['GET', 'POST'])
 @login_required
@@ -688,11 +560,10 @@ def create_problem():
         choices_json = None
         correct_choice = None
         if problem_type == 'choice':
-            import json
             choices = request.form.getlist('choices[]')
             choices = [c for c in choices if c.strip()]
             if choices:
-                choices_json = json.dumps(choices, ensure_ascii=False)
+                choices_json = choices
                 correct_choice = int(request.form.get('correct_choice', 0))
         
         problem = Problem(
@@ -711,12 +582,14 @@ def create_problem():
             if student:
                 problem.assigned_students.append(student)
         
-        
         db.session.add(problem)
+        bump_inbox([s.id for s in problem.assigned_students], 'problems')
+        adjust_stats(problems=1)
+        index_problem(problem)
         db.session.commit()
         
-        # コンポーネント保存
-        save_components_from_html(content)
+        # コンポーネント保存（レスポンスを待たせないようバックグラウンドで行う）
+        schedule_component_extraction(content)
         
         # 配信タイミング処理
         schedule_type = request.form.get('schedule_type', 'immediate')
@@ -750,11 +623,13 @@ def create_problem():
                 send_problem_notification(problem, problem.assigned_students)
             except Exception as e:
                 print(f"通知送信エラー: {e}")
+            publish_problem(problem, [s.id for s in problem.assigned_students])
             
             flash(f'問題を{len(selected_students)}人の生徒に配信しました。', 'success')
         return redirect(url_for('dashboard'))
     
-    past_problems = Problem.query.order_by(Problem.created_at.desc()).limit(20).all()
+    # 過去の問題の本文は引用するときに api_problem_content から読み込む
+    past_problems = get_page('problems', limit=20)
     return render_template('create_problem.html', students=students, past_problems=past_problems)
 
 
@@ -764,7 +639,10 @@ def view_problem(problem_id):
     problem = Problem.query.get_or_404(problem_id)
     
     if current_user.is_teacher():
-        answers = problem.answers.order_by(Answer.submitted_at.desc()).all()
+        # 一覧には保存済みの要約を表示するので、回答本文は読まない
+        answers = problem.answers.options(
+            defer(Answer.content), defer(Answer.plain_text), joinedload(Answer.student), joinedload(Answer.feedback)
+        ).order_by(Answer.submitted_at.desc()).all()
         # 回答済みの生徒IDリスト
         answered_student_ids = [a.student_id for a in answers]
         # 配信先の生徒のうち未回答の生徒
@@ -783,7 +661,10 @@ def view_problem(problem_id):
 @teacher_required
 def delete_problem(problem_id):
     problem = Problem.query.get_or_404(problem_id)
+    pending = pending_answers_query().filter(Answer.problem_id == problem.id).count()
     db.session.delete(problem)
+    adjust_stats(problems=-1, pending_answers=-pending)
+    remove_documents('problem', [problem.id])
     db.session.commit()
     flash('問題を削除しました。', 'success')
     
@@ -803,12 +684,15 @@ def bulk_delete_problems():
         flash('削除する問題が選択されていません。', 'warning')
         return redirect(url_for('manage_problems'))
     
-    count = 0
-    for pid in problem_ids:
-        problem = Problem.query.get(int(pid))
-        if problem:
-            db.session.delete(problem)
-            count += 1
+    problems = [p for p in (Problem.query.get(int(pid)) for pid in problem_ids) if p]
+    count = len(problems)
+    if problems:
+        # 削除前にフィードバック待ちの回答数を数えておく
+        pending = pending_answers_query().filter(Answer.problem_id.in_([p.id for p in problems])).count()
+        adjust_stats(problems=-count, pending_answers=-pending)
+        remove_documents('problem', [p.id for p in problems])
+    for problem in problems:
+        db.session.delete(problem)
     
     db.session.commit()
     flash(f'{count}件の問題を削除しました。', 'success')
@@ -831,10 +715,11 @@ def edit_problem(problem_id):
         
         problem.title = title
         problem.content = content
+        index_problem(problem)
         db.session.commit()
         
-        # コンポーネント保存
-        save_components_from_html(content)
+        # コンポーネント保存（レスポンスを待たせないようバックグラウンドで行う）
+        schedule_component_extraction(content)
         
         flash('問題を更新しました。', 'success')
         return redirect(url_for('view_problem', problem_id=problem_id))
@@ -896,7 +781,10 @@ def submit_answer(problem_id):
         student_id=current_user.id,
         content=content
     )
+    update_answer_text(answer, problem.problem_type)
     db.session.add(answer)
+    bump_role('teacher', 'answers')
+    adjust_stats(pending_answers=1)
     db.session.commit()
     
     # 先生にプッシュ通知を送信
@@ -910,6 +798,7 @@ def submit_answer(problem_id):
         import traceback
         print(f"通知送信エラー: {e}")
         traceback.print_exc()
+    publish_answer(answer, current_user.display_name, problem.title)
     
     # 選択問題は自動採点表示
     if problem.problem_type == 'choice':
@@ -953,6 +842,7 @@ def edit_answer(answer_id):
             return redirect(url_for('edit_answer', answer_id=answer_id))
         
         answer.content = content
+        update_answer_text(answer, answer.problem.problem_type)
         db.session.commit()
         flash('回答を更新しました。', 'success')
         return redirect(url_for('view_problem', problem_id=answer.problem_id))
@@ -977,6 +867,8 @@ def send_feedback(answer_id):
     # 既存のフィードバックがあれば削除
     if answer.feedback:
         db.session.delete(answer.feedback)
+    else:
+        adjust_stats(pending_answers=-1)
     
     feedback = Feedback(
         answer_id=answer_id,
@@ -984,6 +876,7 @@ def send_feedback(answer_id):
         score=int(score) if score else None
     )
     db.session.add(feedback)
+    bump_inbox([answer.student_id], 'feedback')
     db.session.commit()
     
     # 生徒にプッシュ通知を送信
@@ -993,6 +886,7 @@ def send_feedback(answer_id):
         send_feedback_notification(feedback, student)
     except Exception as e:
         print(f"通知送信エラー: {e}")
+    publish_feedback(answer.student_id, answer.problem.title, f'/problem/{answer.problem_id}')
     
     flash('フィードバックを送信しました。', 'success')
     return redirect(url_for('view_answer', answer_id=answer_id))
@@ -1005,6 +899,7 @@ def delete_feedback(feedback_id):
     feedback = Feedback.query.get_or_404(feedback_id)
     answer_id = feedback.answer_id
     db.session.delete(feedback)
+    adjust_stats(pending_answers=1)
     db.session.commit()
     flash('フィードバックを削除しました。', 'success')
     return redirect(url_for('view_answer', answer_id=answer_id))
@@ -1025,6 +920,7 @@ def bulk_delete_announcements():
     for aid in announcement_ids:
         announcement = Announcement.query.get(int(aid))
         if announcement:
+            remove_documents('announcement', [announcement.id])
             db.session.delete(announcement)
             count += 1
     
@@ -1067,6 +963,7 @@ def add_student():
     )
     student.set_password(password)
     db.session.add(student)
+    adjust_stats(students=1)
     db.session.commit()
     
     flash(f'{display_name}さんを追加しました。', 'success')
@@ -1082,8 +979,13 @@ def delete_student(student_id):
         flash('先生は削除できません。', 'error')
         return redirect(url_for('manage_students'))
     
+    pending = pending_answers_query().filter(Answer.student_id == student.id).count()
+    JapaneseTaskSummary.query.filter_by(student_id=student.id).delete()
+    InboxVersion.query.filter_by(user_id=student.id).delete()
     db.session.delete(student)
+    adjust_stats(students=-1, pending_answers=-pending)
     db.session.commit()
+    invalidate_user(student_id)
     flash('生徒を削除しました。', 'success')
     return redirect(url_for('manage_students'))
 
@@ -1099,6 +1001,7 @@ def toggle_chinese_student(student_id):
     
     student.is_chinese_student = not student.is_chinese_student
     db.session.commit()
+    invalidate_user(student.id)
     
     if student.is_chinese_student:
         flash(f'{student.display_name}さんの日本語学習を有効にしました。', 'success')
@@ -1117,50 +1020,43 @@ def student_progress(student_id):
         flash('この機能は生徒専用です。', 'error')
         return redirect(url_for('manage_students'))
     
-    # 割り当てられた問題を取得
-    assigned_problems = student.assigned_problems.all()
-    
-    # 各問題の回答状況を取得
-    problem_stats = []
-    for problem in assigned_problems:
-        answer = Answer.query.filter_by(problem_id=problem.id, student_id=student.id).first()
-        status = 'unanswered'
-        feedback_status = None
-        if answer:
-            status = 'answered'
-            if answer.feedback:
-                status = 'feedback_received'
-                feedback_status = {
-                    'score': answer.feedback.score,
-                    'created_at': answer.feedback.created_at
-                }
-        
-        problem_stats.append({
-            'problem': problem,
-            'answer': answer,
-            'status': status,
-            'feedback_status': feedback_status
-        })
-    
-    # 統計計算
-    total = len(problem_stats)
-    answered = sum(1 for p in problem_stats if p['status'] != 'unanswered')
-    with_feedback = sum(1 for p in problem_stats if p['status'] == 'feedback_received')
-    completion_rate = int((answered / total * 100)) if total > 0 else 0
-    
-    stats = {
-        'total': total,
-        'answered': answered,
-        'unanswered': total - answered,
-        'with_feedback': with_feedback,
-        'pending_feedback': answered - with_feedback,
-        'completion_rate': completion_rate
-    }
+    # 問題・日本語課題の状況をデータ元ごとに1回のクエリで集計
+    progress = get_student_progress(student.id)
     
     return render_template('student_progress.html', 
                            student=student, 
-                           problem_stats=problem_stats, 
-                           stats=stats)
+                           problem_stats=progress['problem_stats'], 
+                           japanese_stats=progress['japanese_stats'],
+                           by_source=progress['by_source'],
+                           source_labels=SOURCE_LABELS,
+                           stats=progress['stats'])
+
+
+@app.route('/students/progress-matrix')
+@login_required
+@teacher_required
+def progress_matrix():
+    """クラス全体の生徒×課題の進捗マトリクス"""
+    source = request.args.get('source')
+    sources = [source] if source in SOURCES else None
+    matrix = get_class_matrix(sources=sources)
+    return render_template('progress_matrix.html', matrix=matrix, source=source,
+                           sources=SOURCES, source_labels=SOURCE_LABELS)
+
+
+@app.route('/api/students/progress-matrix')
+@login_required
+@teacher_required
+def api_progress_matrix():
+    """クラス全体の生徒×課題の進捗マトリクス（JSON）"""
+    student_ids = request.args.getlist('student_id', type=int) or None
+    sources = request.args.getlist('source') or None
+    matrix = get_class_matrix(student_ids=student_ids, sources=sources)
+    for column in matrix['columns']:
+        column['date'] = to_jst_filter(column['date'])
+    # JSONのキーは文字列にする
+    matrix['cells'] = {str(sid): cells for sid, cells in matrix['cells'].items()}
+    return jsonify(matrix)
 
 
 # ============ プロフィール・設定 ============
@@ -1185,6 +1081,7 @@ def settings():
             else:
                 current_user.set_password(new_password)
                 db.session.commit()
+                invalidate_user(current_user.id)
                 flash('パスワードを変更しました。', 'success')
         
         elif action == 'change_display_name':
@@ -1192,6 +1089,7 @@ def settings():
             if new_name and len(new_name) >= 1:
                 current_user.display_name = new_name
                 db.session.commit()
+                invalidate_user(current_user.id)
                 flash('表示名を変更しました。', 'success')
             else:
                 flash('表示名を入力してください。', 'error')
@@ -1207,9 +1105,10 @@ def settings():
 @login_required
 @teacher_required
 def manage_announcements():
-    announcements = Announcement.query.order_by(Announcement.created_at.desc()).all()
+    page = get_page('announcements')
     students = User.query.filter_by(role='student').order_by(User.display_name).all()
-    return render_template('manage_announcements.html', announcements=announcements, students=students)
+    return render_template('manage_announcements.html', page=page, total=count_items('announcements'),
+                           students=students)
 
 
 @app.route('/announcements/create', methods=['POST'])
@@ -1259,6 +1158,12 @@ def create_announcement():
                 announcement.recipients.append(student)
     
     db.session.add(announcement)
+    if is_global:
+        bump_role('student', 'announcements')
+    else:
+        bump_inbox([r.id for r in announcement.recipients], 'announcements')
+    update_announcement_text(announcement)
+    index_announcement(announcement)
     db.session.commit()
     
     # 予約配信の場合
@@ -1304,6 +1209,7 @@ def create_announcement():
             flash('連絡事項を全員に投稿しました。', 'success')
         else:
             flash(f'連絡事項を{len(selected_students)}人の生徒に投稿しました。', 'success')
+    publish_announcement(announcement, None if is_global else [r.id for r in announcement.recipients])
     
     return redirect(url_for('manage_announcements'))
 
@@ -1313,6 +1219,7 @@ def create_announcement():
 @teacher_required
 def delete_announcement(announcement_id):
     announcement = Announcement.query.get_or_404(announcement_id)
+    remove_documents('announcement', [announcement.id])
     db.session.delete(announcement)
     db.session.commit()
     flash('連絡事項を削除しました。', 'success')
@@ -1397,17 +1304,6 @@ def chinese_student_required(f):
     return decorated_function
 
 
-def get_japanese_stats(user_id):
-    """日本語学習の統計を取得"""
-    total = JapaneseAnswer.query.filter_by(user_id=user_id).count()
-    correct = JapaneseAnswer.query.filter_by(user_id=user_id, is_correct=True).count()
-    return {
-        'total': total,
-        'correct': correct,
-        'accuracy': int(correct / total * 100) if total > 0 else 0
-    }
-
-
 # ============================================
 # 日本語学習ルート
 # ============================================
@@ -1416,106 +1312,16 @@ def get_japanese_stats(user_id):
 @login_required
 @chinese_student_required
 def japanese_dashboard():
+    # 統計・苦手な熟語は回答のたびに更新している集計テーブルから読む
     stats = get_japanese_stats(current_user.id)
-    recent_answers = JapaneseAnswer.query.filter_by(user_id=current_user.id).order_by(JapaneseAnswer.answered_at.desc()).limit(10).all()
-    
-    # グループ化された日本語課題を取得（ダッシュボードと同じロジック）
-    from itertools import groupby
-    japanese_tasks = []
-    
-    # クイズ（全てグループ化）
-    quiz_assignments_all = current_user.japanese_assignments.order_by(
-        JapaneseAssignment.assigned_at.desc(),
-        JapaneseAssignment.id
-    ).all()
-    
-    def get_quiz_group_key(q):
-        return q.assigned_at.strftime('%Y-%m-%d %H:%M')
-    
-    for key, group in groupby(quiz_assignments_all, key=get_quiz_group_key):
-        items = list(group)
-        if not items:
-            continue
-        group_date = items[0].assigned_at
-        count = len(items)
-        items.sort(key=lambda x: x.id)
-        first_item = items[0]
-        completed_count = sum(1 for item in items if item.completed)
-        all_completed = (completed_count == count)
-        next_item = next((item for item in items if not item.completed), first_item)
-        
-        japanese_tasks.append({
-            'type': 'quiz_group',
-            'title': f"熟語クイズ ({completed_count}/{count}問完了)" if all_completed else f"熟語クイズ ({count}問)",
-            'assignment_id': next_item.id,
-            'created_at': group_date,
-            'completed': all_completed,
-        })
-    
-    # フラッシュカード（全てグループ化）
-    flashcard_assignments = current_user.japanese_flashcard_assignments.order_by(
-        JapaneseFlashcardAssignment.assigned_at.desc(), 
-        JapaneseFlashcardAssignment.id
-    ).all()
-    
-    def get_flashcard_group_key(fa):
-        return fa.assigned_at.strftime('%Y-%m-%d %H:%M')
-    
-    for key, group in groupby(flashcard_assignments, key=get_flashcard_group_key):
-        items = list(group)
-        if not items:
-            continue
-        group_date = items[0].assigned_at
-        count = len(items)
-        items.sort(key=lambda x: x.id)
-        first_item = items[0]
-        completed_count = sum(1 for item in items if item.completed)
-        all_completed = (completed_count == count)
-        next_item = next((item for item in items if not item.completed), first_item)
-        
-        japanese_tasks.append({
-            'type': 'flashcard_group',
-            'title': f"フラッシュカード ({completed_count}/{count}枚完了)" if all_completed else f"フラッシュカード ({count}枚)",
-            'assignment_id': next_item.id,
-            'created_at': group_date,
-            'completed': all_completed,
-        })
-    
-    # 書き取り（全てグループ化）
-    writing_assignments = current_user.japanese_writing_assignments.order_by(
-        JapaneseWritingAssignment.assigned_at.desc(),
-        JapaneseWritingAssignment.id
-    ).all()
-    
-    def get_writing_group_key(wa):
-        return wa.assigned_at.strftime('%Y-%m-%d %H:%M')
-    
-    for key, group in groupby(writing_assignments, key=get_writing_group_key):
-        items = list(group)
-        if not items:
-            continue
-        group_date = items[0].assigned_at
-        count = len(items)
-        items.sort(key=lambda x: x.id)
-        first_item = items[0]
-        completed_count = sum(1 for item in items if item.completed)
-        all_completed = (completed_count == count)
-        next_item = next((item for item in items if not item.completed), first_item)
-        
-        japanese_tasks.append({
-            'type': 'writing_group',
-            'title': f"書き取り練習 ({completed_count}/{count}問完了)" if all_completed else f"書き取り練習 ({count}問)",
-            'assignment_id': next_item.id,
-            'created_at': group_date,
-            'completed': all_completed,
-        })
+    weak_words = get_weak_words(current_user.id)
     
-    # 日付順にソート（新しい順）
-    japanese_tasks.sort(key=lambda x: x['created_at'], reverse=True)
+    # グループ化された日本語課題を取得（集計テーブルから1回で読む）
+    japanese_tasks = get_student_japanese_tasks(current_user.id)
     
     return render_template('japanese_dashboard.html', 
                            stats=stats, 
-                           recent_answers=recent_answers,
+                           weak_words=weak_words,
                            japanese_tasks=japanese_tasks)
 
 
@@ -1523,10 +1329,9 @@ def japanese_dashboard():
 @login_required
 @chinese_student_required
 def japanese_quiz():
-    # DBから問題を取得、なければデフォルト
-    db_quizzes = JapaneseQuiz.query.all()
-    if db_quizzes:
-        quiz_data = random.choice(db_quizzes)
+    # DBから1問だけ取得、なければデフォルト
+    quiz_data = sample_quiz()
+    if quiz_data:
         quiz = {
             'id': quiz_data.id,
             'word': quiz_data.word,
@@ -1562,6 +1367,7 @@ def japanese_answer():
         is_correct=data.get('is_correct', False)
     )
     db.session.add(answer)
+    record_answer(answer)
     db.session.commit()
     return jsonify({'success': True})
 
@@ -1619,7 +1425,9 @@ def answer_assigned_quiz():
             is_correct=is_correct
         )
         db.session.add(answer)
+        record_answer(answer)
         db.session.commit()
+        refresh_task_summaries([summary_key('quiz', assignment)])
         
         # 通知送信
         try:
@@ -1636,28 +1444,12 @@ def answer_assigned_quiz():
 @login_required
 @chinese_student_required
 def japanese_flashcard():
-    index = request.args.get('index', 0, type=int)
-    
-    # DBから取得、なければデフォルトデータ
-    db_cards = JapaneseFlashcard.query.all()
-    if db_cards:
-        cards = [{'word': c.word, 'reading': c.reading, 'meaning': c.meaning, 'example': c.example or ''} for c in db_cards]
-    else:
-        cards = FLASHCARD_DATA
-    
-    total = len(cards)
-    index = index % total
-    card = cards[index]
-    
-    prev_index = (index - 1) % total
-    next_index = (index + 1) % total
-    
-    return render_template('japanese_flashcard.html', 
-                           card=card, 
-                           current_index=index, 
-                           total=total,
-                           prev_index=prev_index,
-                           next_index=next_index)
+    # 表示するカードだけをDBから取得、なければデフォルトデータ
+    deck = get_deck_page(
+        'flashcards', card_id=request.args.get('id', type=int),
+        index=request.args.get('index', 0, type=int), fallback=FLASHCARD_DATA
+    )
+    return render_template('japanese_flashcard.html', card=deck['cards'][0], deck=deck)
 
 
 # 書き取り練習用データ（デフォルト）
@@ -1680,43 +1472,46 @@ WRITING_DATA = [
 @chinese_student_required
 def japanese_writing():
     """漢字書き取り練習"""
-    index = request.args.get('index', 0, type=int)
-    
-    # DBから取得、なければデフォルトデータ
-    db_kanjis = JapaneseWriting.query.all()
-    if db_kanjis:
-        kanjis = [{'word': k.word, 'reading': k.reading, 'meaning': k.meaning, 'example': k.example or ''} for k in db_kanjis]
-    else:
-        kanjis = WRITING_DATA
-    
-    total = len(kanjis)
-    index = index % total
-    kanji = kanjis[index]
-    
-    prev_index = (index - 1) % total
-    next_index = (index + 1) % total
-    
-    return render_template('japanese_writing.html',
-                           kanji=kanji,
-                           current_index=index,
-                           total=total,
-                           prev_index=prev_index,
-                           next_index=next_index)
+    # 表示する漢字だけをDBから取得、なければデフォルトデータ
+    deck = get_deck_page(
+        'writings', card_id=request.args.get('id', type=int),
+        index=request.args.get('index', 0, type=int), fallback=WRITING_DATA
+    )
+    return render_template('japanese_writing.html', kanji=deck['cards'][0], deck=deck)
 
 
-@app.route('/japanese/ai-tutor', methods=['GET', 'POST'])
+# デッキが空のときに表示する既定のカード
+DECK_FALLBACKS = {
+    'flashcards': FLASHCARD_DATA,
+    'writings': WRITING_DATA,
+}
+
+
+@app.route('/api/japanese/deck/<name>')
 @login_required
 @chinese_student_required
-def japanese_ai_tutor():
-    response = None
-    error = None
-    query = None
-    
-    if request.method == 'POST':
-        query = request.form.get('query', '').strip()
-        if query:
-            try:
-                prompt = f"""あなたは中国の小学生に日本語を教える優しい先生です。
+def api_deck_page(name):
+    """自由練習のデッキの指定位置から数枚のカードを取得（「次へ」の先読み用）
+
+    クエリ: id（カードID）または index（位置）、count（枚数。最大 MAX_PREFETCH）
+    """
+    if name not in DECKS:
+        return jsonify({'error': '不明なデッキです'}), 404
+    deck = get_deck_page(
+        name, card_id=request.args.get('id', type=int), index=request.args.get('index', 0, type=int),
+        count=min(request.args.get('count', 1, type=int), MAX_PREFETCH), fallback=DECK_FALLBACKS[name]
+    )
+    return jsonify(deck)
+
+
+# AIチューターの呼び出し設定（通常表示とストリーミング表示で同じキャッシュを使う）
+TUTOR_MAX_TOKENS = 1000
+TUTOR_TEMPERATURE = 0.7
+
+
+def tutor_prompt(query):
+    """AIチューターへのプロンプト"""
+    return f"""あなたは中国の小学生に日本語を教える優しい先生です。
 以下の漢字または熟語について、中国の小学生にも分かりやすく説明してください。
 
 【質問】{query}
@@ -1728,20 +1523,57 @@ def japanese_ai_tutor():
 4. 覚え方のコツ（あれば）
 
 できるだけ簡単な言葉を使って説明してください。"""
-                
-                completion = groq_client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=1000,
-                    temperature=0.7
-                )
-                response = completion.choices[0].message.content
+
+
+@app.route('/japanese/ai-tutor', methods=['GET', 'POST'])
+@login_required
+@chinese_student_required
+def japanese_ai_tutor():
+    response = None
+    error = None
+    query = None
+    
+    if request.method == 'POST':
+        query = request.form.get('query', '').strip()
+        if query:
+            try:
+                # 同じ質問への回答はキャッシュから返す
+                response = complete(tutor_prompt(query), max_tokens=TUTOR_MAX_TOKENS, temperature=TUTOR_TEMPERATURE)
             except Exception as e:
                 error = f"AIへの接続でエラーが発生しました: {str(e)}"
     
     return render_template('japanese_ai_tutor.html', response=response, error=error, query=query)
 
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/japanese/ai-tutor/stream', methods=['POST'])
+@login_required
+@chinese_student_required
+def japanese_ai_tutor_stream():
+    """AIチューターの回答を生成されたそばから送る（SSE形式: text イベントの連続のあと done または error）"""
+    query = request.form.get('query', '').strip()
+    if not query:
+        return jsonify({'error': '質問を入力してください'}), 400
+    
+    def events():
+        try:
+            for text in stream_cached(tutor_prompt(query), max_tokens=TUTOR_MAX_TOKENS, temperature=TUTOR_TEMPERATURE):
+                yield _sse('text', {'text': text})
+            yield _sse('done', {})
+        except Exception as e:
+            yield _sse('error', {'error': f"AIへの接続でエラーが発生しました: {str(e)}"})
+    
+    # ストリーム中はセッションを使わないので、接続をプールに返しておく
+    db.session.remove()
+    return app.response_class(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
 @app.route('/japanese/ai-quiz', methods=['GET', 'POST'])
 @login_required
 @chinese_student_required
@@ -1752,44 +1584,17 @@ def japanese_ai_quiz():
     if request.method == 'POST':
         difficulty = request.form.get('difficulty', 'medium')
         
-        difficulty_map = {
-            'easy': 'N5レベル（最も簡単）',
-            'medium': 'N4レベル（普通）',
-            'hard': 'N3レベル（難しい）'
-        }
-        
-        prompt = f"""日本語学習者のために、{difficulty_map.get(difficulty, 'N4レベル')}の熟語クイズを1問作ってください。
-
-以下のJSON形式で回答してください（他のテキストは含めないでください）：
-{{
-    "word": "熟語（漢字）",
-    "correct_reading": "正しい読み方",
-    "wrong_readings": ["間違い1", "間違い2", "間違い3"],
-    "meaning_chinese": "中国語の意味（ピンイン付き）",
-    "example": "例文"
-}}"""
-        
         try:
-            completion = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=500,
-                temperature=0.8
-            )
-            response_text = completion.choices[0].message.content
-            
-            # JSON抽出
-            import re
-            json_match = re.search(r'\{[^{}]*\}', response_text, re.DOTALL)
-            if json_match:
-                quiz_data = json.loads(json_match.group())
-                options = [quiz_data['correct_reading']] + quiz_data.get('wrong_readings', [])[:3]
+            # 生成済みの問題から出題する（なければその場でAIが作る）
+            quiz_data = get_ai_quiz(difficulty)
+            if quiz_data:
+                options = [quiz_data['correct_reading']] + quiz_data['wrong_readings'][:3]
                 random.shuffle(options)
                 quiz = {
-                    'word': quiz_data.get('word', ''),
-                    'correct_reading': quiz_data.get('correct_reading', ''),
-                    'meaning_chinese': quiz_data.get('meaning_chinese', ''),
-                    'example': quiz_data.get('example', ''),
+                    'word': quiz_data['word'],
+                    'correct_reading': quiz_data['correct_reading'],
+                    'meaning_chinese': quiz_data['meaning_chinese'],
+                    'example': quiz_data['example'],
                     'options': options
                 }
         except Exception as e:
@@ -1811,149 +1616,84 @@ def teacher_japanese_problems():
     problems = JapaneseQuiz.query.order_by(JapaneseQuiz.created_at.desc()).all()
     chinese_students = User.query.filter_by(role='student', is_chinese_student=True).all()
     
-    # 完了済み課題（フィードバック用）を取得
-    quizzes = db.session.query(JapaneseAssignment, User).join(User).filter(JapaneseAssignment.completed == True).all()
-    flashcards = db.session.query(JapaneseFlashcardAssignment, User).join(User).filter(JapaneseFlashcardAssignment.completed == True).all()
-    writings = db.session.query(JapaneseWritingAssignment, User).join(User).filter(JapaneseWritingAssignment.completed == True).all()
-    
-    tasks = []
-    
-    for q, s in quizzes:
-        tasks.append({
-            'type': 'quiz',
-            'id': q.id,
-            'student_name': s.display_name,
-            'title': f"クイズ: {q.quiz.word}",
-            'assigned_at': q.assigned_at,
-            'completed_at': q.completed_at,
-            'feedback': q.teacher_feedback,
-            'status': '正解' if q.is_correct else '完了',
-            'result_image': None
-        })
-        
-    for f, s in flashcards:
-        tasks.append({
-            'type': 'flashcard',
-            'id': f.id,
-            'student_name': s.display_name,
-            'title': f"カード: {f.flashcard.word}",
-            'assigned_at': f.assigned_at,
-            'completed_at': f.completed_at,
-            'feedback': f.teacher_feedback,
-            'status': '覚えた',
-            'result_image': None
-        })
-        
-    for w, s in writings:
-        tasks.append({
-            'type': 'writing',
-            'id': w.id,
-            'student_name': s.display_name,
-            'title': f"書き取り: {w.writing.word}",
-            'assigned_at': w.assigned_at,
-            'completed_at': w.completed_at,
-            'feedback': w.teacher_feedback,
-            'status': '練習済',
-            'result_image': w.result_image  # 画像データ
-        })
-    
-    # グルーピング処理
-    grouped_tasks = {}
-    for task in tasks:
-        # キー: 生徒名 + 課題配信日時(分まで)
-        key = (task['student_name'], task['assigned_at'].strftime('%Y-%m-%d %H:%M'))
-        if key not in grouped_tasks:
-            grouped_tasks[key] = {
-                'student_name': task['student_name'],
-                'date': task['assigned_at'],
-                'tasks': []
-            }
-        grouped_tasks[key]['tasks'].append(task)
-    
-    # リスト化してソート（新しい順）
-    grouped_list = sorted(grouped_tasks.values(), key=lambda x: x['date'], reverse=True)
-    
-    return render_template('teacher_japanese_problems.html', problems=problems, chinese_students=chinese_students, grouped_tasks=grouped_list)
+    # 完了済み課題（フィードバック用）は api_japanese_review_queue からページ単位で読み込む
+    return render_template('teacher_japanese_problems.html', problems=problems, chinese_students=chinese_students,
+                           generation_jobs=generation_jobs_for(['quiz', 'kanji_quiz']))
+
+
+@app.route('/api/teacher/japanese/review-queue')
+@login_required
+@teacher_required
+def api_japanese_review_queue():
+    """先生用：完了済み日本語課題のレビューキュー（keysetページング）"""
+    student_id = request.args.get('student_id', type=int)
+    needs_feedback = request.args.get('needs_feedback') == '1'
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    try:
+        page = get_review_queue(
+            cursor=request.args.get('cursor') or None,
+            limit=limit,
+            needs_feedback=needs_feedback,
+            student_id=student_id
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    for item in page['items']:
+        item['assigned_at'] = to_jst_filter(item['assigned_at'])
+        item['completed_at'] = to_jst_filter(item['completed_at'], '%H:%M')
+    return jsonify(page)
+
+
+def generation_jobs_for(job_types):
+    """画面に表示する生成ジョブ（未完了のジョブと、?job= で指定された直前のジョブ）"""
+    jobs = get_active_jobs(current_user.id, job_types)
+    job_id = request.args.get('job', type=int)
+    if job_id and job_id not in [job.id for job in jobs]:
+        job = db.session.get(GenerationJob, job_id)
+        if job and job.created_by == current_user.id:
+            jobs.append(job)
+    return [job_status(job) for job in jobs]
+
+
+@app.route('/api/generation-jobs/<int:job_id>')
+@login_required
+@teacher_required
+def api_generation_job(job_id):
+    """AI生成ジョブの状態（生成中の画面から問い合わせる）"""
+    job = db.session.get(GenerationJob, job_id)
+    if job is None or job.created_by != current_user.id:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    return jsonify(job_status(expire_if_stale(job)))
+
+
+@app.route('/api/llm-cache/stats')
+@login_required
+@teacher_required
+def api_llm_cache_stats():
+    """AIの応答キャッシュの利用状況（ヒット率・節約できた呼び出し時間とトークン数）"""
+    return jsonify(get_cache_stats())
 
 
 @app.route('/teacher/japanese/generate', methods=['GET', 'POST'])
 @login_required
 @teacher_required
 def teacher_japanese_generate():
-    """先生用：AIで問題一括生成"""
-    generated_problems = []
-    error = None
-    total_problems = JapaneseQuiz.query.count()
-    
+    """先生用：AIで問題一括生成（生成はバックグラウンドのジョブで行う）"""
     if request.method == 'POST':
         difficulty = request.form.get('difficulty', 'medium')
-        count = int(request.form.get('count', 5))
-        theme = request.form.get('theme', '').strip()
-        
-        difficulty_map = {
-            'easy': 'N5レベル（最も簡単、小学校低学年向け）',
-            'medium': 'N4レベル（普通、小学校高学年向け）',
-            'hard': 'N3レベル（難しい、中学生向け）'
-        }
-        
-        theme_text = f"テーマは「{theme}」に関連する熟語で" if theme else ""
-        
-        prompt = f"""日本語学習者のために、{difficulty_map.get(difficulty, 'N4レベル')}の熟語クイズを{count}問作ってください。
-{theme_text}
-
-以下のJSON配列形式で回答してください（他のテキストは含めないでください）：
-[
-  {{
-    "word": "熟語（漢字）",
-    "correct_reading": "正しい読み方（ひらがな）",
-    "wrong_readings": ["間違い1", "間違い2", "間違い3"],
-    "meaning_chinese": "中国語の意味（ピンイン付き）",
-    "example": "例文"
-  }}
-]
-
-各問題は異なる熟語にしてください。間違い選択肢は、正解と似ているが間違っているものにしてください。"""
-        
-        try:
-            completion = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2000,
-                temperature=0.8
-            )
-            response_text = completion.choices[0].message.content
-            
-            # JSON抽出
-            import re
-            json_match = re.search(r'\[[\s\S]*\]', response_text)
-            if json_match:
-                problems_data = json.loads(json_match.group())
-                
-                for prob in problems_data:
-                    # DBに保存
-                    new_quiz = JapaneseQuiz(
-                        word=prob.get('word', ''),
-                        correct_reading=prob.get('correct_reading', ''),
-                        wrong_readings=json.dumps(prob.get('wrong_readings', []), ensure_ascii=False),
-                        meaning_chinese=prob.get('meaning_chinese', ''),
-                        example=prob.get('example', ''),
-                        category=difficulty,
-                        created_by=current_user.id
-                    )
-                    db.session.add(new_quiz)
-                    generated_problems.append(prob)
-                
-                db.session.commit()
-                total_problems = JapaneseQuiz.query.count()
-                flash(f'{len(generated_problems)}問の問題を生成・保存しました！', 'success')
-            else:
-                error = "AIからの応答にJSONが見つかりませんでした"
-        except Exception as e:
-            error = f"問題の生成に失敗しました: {str(e)}"
+        job = enqueue_job('quiz', {
+            'difficulty': difficulty,
+            'count': int(request.form.get('count', 5)),
+            'theme': request.form.get('theme', '').strip(),
+            'category': difficulty,
+            'reuse_cached': request.form.get('reuse_cached') == '1',
+        }, current_user.id)
+        return redirect(url_for('teacher_japanese_generate', job=job.id))
     
+    total_problems = JapaneseQuiz.query.count()
     return render_template('teacher_japanese_generate.html', 
-                           generated_problems=generated_problems, 
-                           error=error,
+                           generation_jobs=generation_jobs_for(['quiz']),
                            total_problems=total_problems)
 
 
@@ -1977,7 +1717,7 @@ def add_japanese_problem():
     new_quiz = JapaneseQuiz(
         word=word,
         correct_reading=correct_reading,
-        wrong_readings=json.dumps([wrong1, wrong2, wrong3], ensure_ascii=False),
+        wrong_readings=[wrong1, wrong2, wrong3],
         meaning_chinese=meaning_chinese,
         example=example,
         category='manual',
@@ -1985,6 +1725,7 @@ def add_japanese_problem():
     )
     db.session.add(new_quiz)
     db.session.commit()
+    invalidate_quiz_pool()
     
     flash(f'問題「{word}」を追加しました！', 'success')
     return redirect(url_for('teacher_japanese_problems'))
@@ -1997,8 +1738,11 @@ def delete_japanese_problem(problem_id):
     """先生用：問題を削除"""
     problem = JapaneseQuiz.query.get_or_404(problem_id)
     word = problem.word
+    summary_keys = collect_summary_keys('quiz', problem.assignments)
     db.session.delete(problem)
     db.session.commit()
+    invalidate_quiz_pool()
+    refresh_task_summaries(summary_keys)
     flash(f'問題「{word}」を削除しました。', 'success')
     return redirect(url_for('teacher_japanese_problems'))
 
@@ -2038,13 +1782,17 @@ def bulk_delete_japanese_problems():
     
     ids = [int(id) for id in problem_ids.split(',') if id]
     count = 0
+    summary_keys = set()
     for problem_id in ids:
         problem = JapaneseQuiz.query.get(problem_id)
         if problem:
+            summary_keys |= collect_summary_keys('quiz', problem.assignments)
             db.session.delete(problem)
             count += 1
     
     db.session.commit()
+    invalidate_quiz_pool()
+    refresh_task_summaries(summary_keys)
     flash(f'{count}問の問題を削除しました。', 'success')
     return redirect(url_for('teacher_japanese_problems'))
 
@@ -2063,32 +1811,13 @@ def bulk_send_japanese_quiz():
     
     quiz_id_list = [int(id) for id in quiz_ids.split(',') if id]
     
-    count = 0
-    for quiz_id in quiz_id_list:
-        for student_id in student_ids:
-            existing = JapaneseAssignment.query.filter_by(
-                quiz_id=quiz_id,
-                student_id=int(student_id)
-            ).first()
-            
-            if not existing:
-                assignment = JapaneseAssignment(
-                    quiz_id=quiz_id,
-                    student_id=int(student_id)
-                )
-                db.session.add(assignment)
-                count += 1
-    
-    db.session.commit()
+    # 未配信の組み合わせだけをまとめて配信
+    result = deliver_japanese_items(current_user.id, student_ids, quiz_ids=quiz_id_list)
+    count = result['total']
     
     # 通知送信
     if count > 0:
-        recipients = [User.query.get(int(sid)) for sid in quiz_ids and student_ids] # Simplification error prevention
-        # Re-fetch is safer or just use the IDs. send_japanese_assignment_notification expects User objects.
-        # Let's do it properly inside the block or fetched before.
-        # Since I can't easily insert code before the loop without replacing the whole function, I will do it here.
-        recipients = [User.query.get(int(sid)) for sid in student_ids]
-        send_japanese_assignment_notification(count, recipients, "クイズ")
+        notify_delivery(result, "クイズ")
 
     flash(f'{len(quiz_id_list)}問を{len(student_ids)}人の生徒に配信しました！（計{count}件）', 'success')
     return redirect(url_for('teacher_japanese_problems'))
@@ -2099,21 +1828,22 @@ def bulk_send_japanese_quiz():
 @teacher_required
 def teacher_japanese_send():
     """先生用：問題を生徒に配信する画面（全タイプ対応）"""
-    # クイズ
-    quizzes = JapaneseQuiz.query.order_by(JapaneseQuiz.created_at.desc()).all()
-    # フラッシュカード
-    flashcards = JapaneseFlashcard.query.order_by(JapaneseFlashcard.created_at.desc()).all()
-    # 書き取り
-    writings = JapaneseWriting.query.order_by(JapaneseWriting.created_at.desc()).all()
+    # 各タイプとも最初のページだけ表示し、続きは「もっと見る」で読み込む
+    quizzes = get_page('quizzes')
+    flashcards = get_page('flashcards')
+    writings = get_page('writings')
     # 配信対象の生徒
     chinese_students = User.query.filter_by(role='student', is_chinese_student=True).all()
     # 最近の配信履歴（クイズのみ表示）
-    recent_assignments = JapaneseAssignment.query.order_by(JapaneseAssignment.assigned_at.desc()).limit(20).all()
+    recent_assignments = JapaneseAssignment.query.options(
+        joinedload(JapaneseAssignment.student), joinedload(JapaneseAssignment.quiz)
+    ).order_by(JapaneseAssignment.assigned_at.desc()).limit(20).all()
     
     return render_template('teacher_japanese_send.html',
                            quizzes=quizzes,
                            flashcards=flashcards,
                            writings=writings,
+                           totals={name: count_items(name) for name in ('quizzes', 'flashcards', 'writings')},
                            chinese_students=chinese_students,
                            recent_assignments=recent_assignments)
 
@@ -2136,59 +1866,18 @@ def send_japanese_quiz():
         flash('配信する問題を選択してください。', 'error')
         return redirect(url_for('teacher_japanese_send'))
     
-    count = 0
-    
-    # クイズの配信
-    for quiz_id in quiz_ids:
-        for student_id in student_ids:
-            existing = JapaneseAssignment.query.filter_by(
-                quiz_id=int(quiz_id),
-                student_id=int(student_id)
-            ).first()
-            if not existing:
-                assignment = JapaneseAssignment(
-                    quiz_id=int(quiz_id),
-                    student_id=int(student_id)
-                )
-                db.session.add(assignment)
-                count += 1
-    
-    # フラッシュカードの配信
-    for flashcard_id in flashcard_ids:
-        for student_id in student_ids:
-            existing = JapaneseFlashcardAssignment.query.filter_by(
-                flashcard_id=int(flashcard_id),
-                student_id=int(student_id)
-            ).first()
-            if not existing:
-                assignment = JapaneseFlashcardAssignment(
-                    flashcard_id=int(flashcard_id),
-                    student_id=int(student_id)
-                )
-                db.session.add(assignment)
-                count += 1
-    
-    # 書き取りの配信
-    for writing_id in writing_ids:
-        for student_id in student_ids:
-            existing = JapaneseWritingAssignment.query.filter_by(
-                writing_id=int(writing_id),
-                student_id=int(student_id)
-            ).first()
-            if not existing:
-                assignment = JapaneseWritingAssignment(
-                    writing_id=int(writing_id),
-                    student_id=int(student_id)
-                )
-                db.session.add(assignment)
-                count += 1
-    
-    db.session.commit()
+    # クイズ・フラッシュカード・書き取りを1つの配信バッチでまとめて配信
+    result = deliver_japanese_items(
+        current_user.id, student_ids,
+        quiz_ids=quiz_ids,
+        flashcard_ids=flashcard_ids,
+        writing_ids=writing_ids
+    )
+    count = result['total']
     
     # 通知送信
     if count > 0:
-        recipients = [User.query.get(int(sid)) for sid in student_ids]
-        send_japanese_assignment_notification(count, recipients, "クイズや書き取り")
+        notify_delivery(result, "クイズや書き取り")
     
     # 詳細メッセージ
     msg_parts = []
@@ -2212,9 +1901,11 @@ def send_japanese_quiz():
 @teacher_required
 def teacher_flashcard_manage():
     """フラッシュカード管理画面"""
-    cards = JapaneseFlashcard.query.order_by(JapaneseFlashcard.created_at.desc()).all()
+    page = get_page('flashcards')
     chinese_students = User.query.filter_by(role='student', is_chinese_student=True).all()
-    return render_template('teacher_flashcard_manage.html', cards=cards, chinese_students=chinese_students)
+    return render_template('teacher_flashcard_manage.html', page=page, total=count_items('flashcards'),
+                           chinese_students=chinese_students,
+                           generation_jobs=generation_jobs_for(['flashcard', 'kanji_flashcard']))
 
 
 @app.route('/teacher/flashcard/edit', methods=['POST'])
@@ -2249,6 +1940,7 @@ def add_flashcard():
     )
     db.session.add(card)
     db.session.commit()
+    invalidate_deck('flashcards')
     flash(f'カード「{card.word}」を追加しました！', 'success')
     return redirect(url_for('teacher_flashcard_manage'))
 
@@ -2259,8 +1951,11 @@ def add_flashcard():
 def delete_flashcard(card_id):
     """フラッシュカード削除"""
     card = JapaneseFlashcard.query.get_or_404(card_id)
+    summary_keys = collect_summary_keys('flashcard', card.assignments)
     db.session.delete(card)
     db.session.commit()
+    invalidate_deck('flashcards')
+    refresh_task_summaries(summary_keys)
     flash('カードを削除しました。', 'success')
     return redirect(url_for('teacher_flashcard_manage'))
 
@@ -2278,13 +1973,17 @@ def bulk_delete_flashcards():
     
     ids = [int(id) for id in card_ids.split(',') if id]
     count = 0
+    summary_keys = set()
     for card_id in ids:
         card = JapaneseFlashcard.query.get(card_id)
         if card:
+            summary_keys |= collect_summary_keys('flashcard', card.assignments)
             db.session.delete(card)
             count += 1
     
     db.session.commit()
+    invalidate_deck('flashcards')
+    refresh_task_summaries(summary_keys)
     flash(f'{count}枚のカードを削除しました。', 'success')
     return redirect(url_for('teacher_flashcard_manage'))
 
@@ -2302,28 +2001,13 @@ def bulk_send_flashcards():
         return redirect(url_for('teacher_flashcard_manage'))
     
     id_list = [int(id) for id in card_ids.split(',') if id]
-    count = 0
-    
-    for card_id in id_list:
-        for student_id in student_ids:
-            existing = JapaneseFlashcardAssignment.query.filter_by(
-                flashcard_id=card_id,
-                student_id=int(student_id)
-            ).first()
-            if not existing:
-                assignment = JapaneseFlashcardAssignment(
-                    flashcard_id=card_id,
-                    student_id=int(student_id)
-                )
-                db.session.add(assignment)
-                count += 1
-                
-    db.session.commit()
+    # 未配信の組み合わせだけをまとめて配信
+    result = deliver_japanese_items(current_user.id, student_ids, flashcard_ids=id_list)
+    count = result['total']
     
     # 通知送信
     if count > 0:
-        recipients = [User.query.get(int(sid)) for sid in student_ids]
-        send_japanese_assignment_notification(count, recipients, "フラッシュカード")
+        notify_delivery(result, "フラッシュカード")
 
     flash(f'{len(id_list)}枚のカードを{len(student_ids)}人の生徒に配信しました！（計{count}件）', 'success')
     return redirect(url_for('teacher_flashcard_manage'))
@@ -2333,48 +2017,13 @@ def bulk_send_flashcards():
 @login_required
 @teacher_required
 def generate_flashcards():
-    """AIでフラッシュカード生成"""
-    theme = request.form.get('theme', '').strip()
-    count = int(request.form.get('count', 10))
-    
-    theme_text = f"テーマは「{theme}」に関連する単語で" if theme else ""
-    
-    prompt = f"""中国の小学生のための日本語学習フラッシュカードを{count}枚作ってください。
-{theme_text}
-
-JSON配列形式で回答してください：
-[
-  {{"word": "漢字/熟語", "reading": "読み方", "meaning": "中国語の意味（ピンイン付き）", "example": "例文"}}
-]"""
-    
-    try:
-        completion = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=2000,
-            temperature=0.8
-        )
-        response_text = completion.choices[0].message.content
-        
-        import re
-        json_match = re.search(r'\[[\s\S]*\]', response_text)
-        if json_match:
-            cards_data = json.loads(json_match.group())
-            for card_data in cards_data:
-                card = JapaneseFlashcard(
-                    word=card_data.get('word', ''),
-                    reading=card_data.get('reading', ''),
-                    meaning=card_data.get('meaning', ''),
-                    example=card_data.get('example', ''),
-                    created_by=current_user.id
-                )
-                db.session.add(card)
-            db.session.commit()
-            flash(f'{len(cards_data)}枚のカードを生成しました！', 'success')
-    except Exception as e:
-        flash(f'生成に失敗しました: {str(e)}', 'error')
-    
-    return redirect(url_for('teacher_flashcard_manage'))
+    """AIでフラッシュカード生成（生成はバックグラウンドのジョブで行う）"""
+    job = enqueue_job('flashcard', {
+        'theme': request.form.get('theme', '').strip(),
+        'count': int(request.form.get('count', 10)),
+        'reuse_cached': request.form.get('reuse_cached') == '1',
+    }, current_user.id)
+    return redirect(url_for('teacher_flashcard_manage', job=job.id))
 
 
 # ============================================
@@ -2386,9 +2035,11 @@ JSON配列形式で回答してください：
 @teacher_required
 def teacher_writing_manage():
     """書き取り練習管理画面"""
-    writings = JapaneseWriting.query.order_by(JapaneseWriting.created_at.desc()).all()
+    page = get_page('writings')
     chinese_students = User.query.filter_by(role='student', is_chinese_student=True).all()
-    return render_template('teacher_writing_manage.html', writings=writings, chinese_students=chinese_students)
+    return render_template('teacher_writing_manage.html', page=page, total=count_items('writings'),
+                           chinese_students=chinese_students,
+                           generation_jobs=generation_jobs_for(['writing', 'kanji_writing']))
 
 
 @app.route('/teacher/writing/edit', methods=['POST'])
@@ -2429,6 +2080,7 @@ def add_writing():
     )
     db.session.add(writing)
     db.session.commit()
+    invalidate_deck('writings')
     flash(f'書き取り「{writing.word}」を追加しました！', 'success')
     return redirect(url_for('teacher_writing_manage'))
 
@@ -2439,8 +2091,11 @@ def add_writing():
 def delete_writing(writing_id):
     """書き取り練習削除"""
     writing = JapaneseWriting.query.get_or_404(writing_id)
+    summary_keys = collect_summary_keys('writing', writing.assignments)
     db.session.delete(writing)
     db.session.commit()
+    invalidate_deck('writings')
+    refresh_task_summaries(summary_keys)
     flash('書き取り練習を削除しました。', 'success')
     return redirect(url_for('teacher_writing_manage'))
 
@@ -2458,13 +2113,17 @@ def bulk_delete_writings():
     
     ids = [int(id) for id in writing_ids.split(',') if id]
     count = 0
+    summary_keys = set()
     for w_id in ids:
         writing = JapaneseWriting.query.get(w_id)
         if writing:
+            summary_keys |= collect_summary_keys('writing', writing.assignments)
             db.session.delete(writing)
             count += 1
     
     db.session.commit()
+    invalidate_deck('writings')
+    refresh_task_summaries(summary_keys)
     flash(f'{count}問の書き取り練習を削除しました。', 'success')
     return redirect(url_for('teacher_writing_manage'))
 
@@ -2482,28 +2141,13 @@ def bulk_send_writings():
         return redirect(url_for('teacher_writing_manage'))
     
     id_list = [int(id) for id in writing_ids.split(',') if id]
-    count = 0
+    # 未配信の組み合わせだけをまとめて配信
+    result = deliver_japanese_items(current_user.id, student_ids, writing_ids=id_list)
+    count = result['total']
     
-    for w_id in id_list:
-        for student_id in student_ids:
-            existing = JapaneseWritingAssignment.query.filter_by(
-                writing_id=w_id,
-                student_id=int(student_id)
-            ).first()
-            if not existing:
-                assignment = JapaneseWritingAssignment(
-                    writing_id=w_id,
-                    student_id=int(student_id)
-                )
-                db.session.add(assignment)
-                count += 1
-                
-    db.session.commit()
-
     # 通知送信
     if count > 0:
-        recipients = [User.query.get(int(sid)) for sid in student_ids]
-        send_japanese_assignment_notification(count, recipients, "書き取り練習")
+        notify_delivery(result, "書き取り練習")
 
     flash(f'{len(id_list)}問の書き取り練習を{len(student_ids)}人の生徒に配信しました！（計{count}件）', 'success')
     return redirect(url_for('teacher_writing_manage'))
@@ -2513,53 +2157,13 @@ def bulk_send_writings():
 @login_required
 @teacher_required
 def generate_writings():
-    """AIで書き取り漢字生成"""
-    level = request.form.get('level', 'medium')
-    count = int(request.form.get('count', 10))
-    
-    level_map = {
-        'easy': '小学1-2年生レベル（画数が少なく簡単な漢字）',
-        'medium': '小学3-4年生レベル（よく使う基本的な漢字）',
-        'hard': '小学5-6年生レベル（少し難しい漢字）'
-    }
-    
-    prompt = f"""中国の小学生が練習するための日本語の漢字を{count}字選んでください。
-レベル: {level_map.get(level, '小学3-4年生レベル')}
-
-JSON配列形式で回答してください：
-[
-  {{"word": "漢字1文字", "reading": "読み方（音読み/訓読み）", "meaning": "中国語の意味（ピンイン付き）", "example": "例文", "stroke_count": 画数}}
-]"""
-    
-    try:
-        completion = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=2000,
-            temperature=0.8
-        )
-        response_text = completion.choices[0].message.content
-        
-        import re
-        json_match = re.search(r'\[[\s\S]*\]', response_text)
-        if json_match:
-            kanjis_data = json.loads(json_match.group())
-            for kanji_data in kanjis_data:
-                kanji = JapaneseWriting(
-                    word=kanji_data.get('word', '')[:2],
-                    reading=kanji_data.get('reading', ''),
-                    meaning=kanji_data.get('meaning', ''),
-                    example=kanji_data.get('example', ''),
-                    stroke_count=kanji_data.get('stroke_count'),
-                    created_by=current_user.id
-                )
-                db.session.add(kanji)
-            db.session.commit()
-            flash(f'{len(kanjis_data)}字の漢字を生成しました！', 'success')
-    except Exception as e:
-        flash(f'生成に失敗しました: {str(e)}', 'error')
-    
-    return redirect(url_for('teacher_writing_manage'))
+    """AIで書き取り漢字生成（生成はバックグラウンドのジョブで行う）"""
+    job = enqueue_job('writing', {
+        'level': request.form.get('level', 'medium'),
+        'count': int(request.form.get('count', 10)),
+        'reuse_cached': request.form.get('reuse_cached') == '1',
+    }, current_user.id)
+    return redirect(url_for('teacher_writing_manage', job=job.id))
 
 
 # ============================================
@@ -2652,255 +2256,21 @@ def teacher_kanji_generate():
     
     # ランダムに選択
     selected = random.sample(kanji_list, count) if count < len(kanji_list) else kanji_list
-    kanji_str = '、'.join(selected)
-    
-    # 即時配信用：中国人生徒を取得
-    chinese_students = []
-    if send_immediately:
-        chinese_students = User.query.filter_by(role='student', is_chinese_student=True).all()
     
+    # 生成と即時配信はバックグラウンドのジョブで行い、生成結果は各管理画面に表示する
+    job_types = {
+        'quiz': ('kanji_quiz', 'teacher_japanese_problems'),
+        'flashcard': ('kanji_flashcard', 'teacher_flashcard_manage'),
+        'writing': ('kanji_writing', 'teacher_writing_manage'),
+    }
+    if problem_type not in job_types:
+        return redirect(url_for('teacher_kanji_list'))
+    job_type, endpoint = job_types[problem_type]
+    params = {'kanji': selected, 'send_immediately': send_immediately, 'reuse_cached': request.form.get('reuse_cached') == '1'}
     if problem_type == 'quiz':
-        # 読み方クイズ生成
-        prompt = f"""以下の漢字について、読み方クイズを作ってください。
-
-対象漢字: {kanji_str}
-
-以下のJSON配列形式で回答してください（他のテキストは含めないでください）：
-[
-  {{
-    "word": "漢字を使った熟語（2-3字）",
-    "correct_reading": "正しい読み方（ひらがな）",
-    "wrong_readings": ["間違い1", "間違い2", "間違い3"],
-    "meaning_chinese": "中国語の意味（ピンイン付き）",
-    "example": "例文"
-  }}
-]
-
-各漢字について1問ずつ作成してください。間違い選択肢は正解と似ているが間違っているものにしてください。"""
-        
-        try:
-            completion = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2000,
-                temperature=0.8
-            )
-            response_text = completion.choices[0].message.content
-            
-            import re
-            json_match = re.search(r'\[[\s\S]*\]', response_text)
-            if json_match:
-                problems_data = json.loads(json_match.group())
-                
-                generated_quiz_ids = []
-                for prob in problems_data:
-                    new_quiz = JapaneseQuiz(
-                        word=prob.get('word', ''),
-                        correct_reading=prob.get('correct_reading', ''),
-                        wrong_readings=json.dumps(prob.get('wrong_readings', []), ensure_ascii=False),
-                        meaning_chinese=prob.get('meaning_chinese', ''),
-                        example=prob.get('example', ''),
-                        category='kanji_grade',
-                        created_by=current_user.id
-                    )
-                    db.session.add(new_quiz)
-                    db.session.flush()  # IDを取得
-                    generated_quiz_ids.append(new_quiz.id)
-                
-                db.session.commit()
-                
-                # 即時配信
-                if send_immediately and chinese_students and generated_quiz_ids:
-                    send_count = 0
-                    for quiz_id in generated_quiz_ids:
-                        for student in chinese_students:
-                            existing = JapaneseAssignment.query.filter_by(
-                                quiz_id=quiz_id,
-                                student_id=student.id
-                            ).first()
-                            if not existing:
-                                assignment = JapaneseAssignment(
-                                    quiz_id=quiz_id,
-                                    student_id=student.id
-                                )
-                                db.session.add(assignment)
-                                send_count += 1
-                    db.session.commit()
-                    db.session.commit()
-                    if send_count > 0:
-                        send_japanese_assignment_notification(send_count, chinese_students, "読み方クイズ")
-                    flash(f'{len(problems_data)}問の読み方クイズを生成し、{len(chinese_students)}人の生徒に配信しました！', 'success')
-                else:
-                    flash(f'{len(problems_data)}問の読み方クイズを生成しました！', 'success')
-                return redirect(url_for('teacher_japanese_problems'))
-            else:
-                flash('AIからの応答にJSONが見つかりませんでした', 'error')
-        except Exception as e:
-            flash(f'問題の生成に失敗しました: {str(e)}', 'error')
-    
-    elif problem_type == 'flashcard':
-        # フラッシュカード生成
-        prompt = f"""以下の漢字について、フラッシュカード用のデータを作ってください。
-
-対象漢字: {kanji_str}
-
-以下のJSON配列形式で回答してください（他のテキストは含めないでください）：
-[
-  {{
-    "word": "漢字を含む熟語",
-    "reading": "読み方（ひらがな）",
-    "meaning": "中国語の意味",
-    "example": "例文（日本語）"
-  }}
-]
-
-各漢字について1つずつ作成してください。"""
-
-        try:
-            completion = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2000,
-                temperature=0.8
-            )
-            response_text = completion.choices[0].message.content
-            
-            import re
-            json_match = re.search(r'\[[\s\S]*\]', response_text)
-            if json_match:
-                cards_data = json.loads(json_match.group())
-                
-                generated_ids = []
-                for card in cards_data:
-                    new_card = JapaneseFlashcard(
-                        word=card.get('word', ''),
-                        reading=card.get('reading', ''),
-                        meaning=card.get('meaning', ''),
-                        example=card.get('example', ''),
-                        created_by=current_user.id
-                    )
-                    db.session.add(new_card)
-                    db.session.flush()
-                    generated_ids.append(new_card.id)
-                
-                db.session.commit()
-                
-                # 即時配信
-                if send_immediately and chinese_students and generated_ids:
-                    send_count = 0
-                    for card_id in generated_ids:
-                        for student in chinese_students:
-                            existing = JapaneseFlashcardAssignment.query.filter_by(
-                                flashcard_id=card_id,
-                                student_id=student.id
-                            ).first()
-                            if not existing:
-                                assignment = JapaneseFlashcardAssignment(
-                                    flashcard_id=card_id,
-                                    student_id=student.id
-                                )
-                                db.session.add(assignment)
-                                send_count += 1
-                    db.session.commit()
-                    db.session.commit()
-                    if send_count > 0:
-                        send_japanese_assignment_notification(send_count, chinese_students, "フラッシュカード")
-                    flash(f'{len(cards_data)}枚のフラッシュカードを生成し、{len(chinese_students)}人の生徒に配信しました！', 'success')
-                else:
-                    flash(f'{len(cards_data)}枚のフラッシュカードを生成しました！', 'success')
-                return redirect(url_for('teacher_flashcard_manage'))
-            else:
-                flash('AIからの応答にJSONが見つかりませんでした', 'error')
-        except Exception as e:
-            flash(f'フラッシュカードの生成に失敗しました: {str(e)}', 'error')
-
-    elif problem_type == 'writing':
-        # 書き取り練習生成
-        prompt = f"""以下の漢字について、書き取り練習用のデータを作ってください。
-
-対象漢字: {kanji_str}
-
-以下のJSON配列形式で回答してください（他のテキストは含めないでください）：
-[
-  {{
-    "word": "漢字（対象の1文字）",
-    "reading": "読み方（音読み・訓読み）",
-    "meaning": "中国語の意味",
-    "example": "その漢字を使った短い例文",
-    "stroke_count": 画数（数値）
-  }}
-]"""
-
-        try:
-            completion = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2000,
-                temperature=0.8
-            )
-            response_text = completion.choices[0].message.content
-            
-            import re
-            json_match = re.search(r'\[[\s\S]*\]', response_text)
-            if json_match:
-                writings_data = json.loads(json_match.group())
-                
-                generated_ids = []
-                for item in writings_data:
-                    # 漢字1文字であることを確認
-                    word = item.get('word', '')
-                    if len(word) > 1:
-                        # 漢字の部分だけ抽出を試みる、またはそのまま使う
-                        pass 
-                        
-                    new_writing = JapaneseWriting(
-                        word=word,
-                        reading=item.get('reading', ''),
-                        meaning=item.get('meaning', ''),
-                        example=item.get('example', ''),
-                        stroke_count=item.get('stroke_count', 0),
-                        created_by=current_user.id
-                    )
-                    db.session.add(new_writing)
-                    db.session.flush()
-                    generated_ids.append(new_writing.id)
-                
-                db.session.commit()
-                
-                # 即時配信
-                if send_immediately and chinese_students and generated_ids:
-                    send_count = 0
-                    for writing_id in generated_ids:
-                        for student in chinese_students:
-                            existing = JapaneseWritingAssignment.query.filter_by(
-                                writing_id=writing_id,
-                                student_id=student.id
-                            ).first()
-                            if not existing:
-                                assignment = JapaneseWritingAssignment(
-                                    writing_id=writing_id,
-                                    student_id=student.id
-                                )
-                                db.session.add(assignment)
-                                send_count += 1
-                    db.session.commit()
-                    db.session.commit()
-                    if send_count > 0:
-                        send_japanese_assignment_notification(send_count, chinese_students, "書き取り練習")
-                    flash(f'{len(writings_data)}問の書き取り練習を生成し、{len(chinese_students)}人の生徒に配信しました！', 'success')
-                else:
-                    flash(f'{len(writings_data)}問の書き取り練習を生成しました！', 'success')
-                return redirect(url_for('teacher_writing_manage'))
-            else:
-                flash('AIからの応答にJSONが見つかりませんでした', 'error')
-        except Exception as e:
-            flash(f'書き取り練習の生成に失敗しました: {str(e)}', 'error')
-
-    return redirect(url_for('teacher_kanji_list'))
-
-
-
-
+        params['category'] = 'kanji_grade'
+    job = enqueue_job(job_type, params, current_user.id)
+    return redirect(url_for(endpoint, job=job.id))
 
 
 # ============================================
@@ -2927,7 +2297,9 @@ def save_feedback():
         
     if assignment:
         assignment.teacher_feedback = feedback
+        bump_inbox([assignment.student_id], 'feedback')
         db.session.commit()
+        refresh_task_summaries([summary_key(task_type, assignment)])
         
         # 通知送信
         try:
@@ -2938,6 +2310,7 @@ def save_feedback():
             elif task_type == 'writing': task_label = f"書き取り: {assignment.writing.word}"
             
             send_japanese_feedback_notification(student, task_label)
+            publish_feedback(assignment.student_id, task_label, '/japanese')
         except Exception as e:
             print(f"Notification Error: {e}")
 
@@ -2956,6 +2329,8 @@ def save_feedback_bulk():
     feedbacks = data.get('feedbacks', [])
     
     count = 0
+    summary_keys = set()
+    live_feedbacks = []
     try:
         for item in feedbacks:
             task_type = item.get('type')
@@ -2972,6 +2347,8 @@ def save_feedback_bulk():
                 
             if assignment:
                 assignment.teacher_feedback = feedback_text
+                summary_keys.add(summary_key(task_type, assignment))
+                bump_inbox([assignment.student_id], 'feedback')
                 count += 1
                 
                 # 通知送信
@@ -2983,10 +2360,15 @@ def save_feedback_bulk():
                     elif task_type == 'writing': task_label = f"書き取り: {assignment.writing.word}"
                     
                     send_japanese_feedback_notification(student, task_label)
+                    live_feedbacks.append((assignment.student_id, task_label))
                 except Exception as e:
                     print(f"Notification Error: {e}")
                 
         db.session.commit()
+        refresh_task_summaries(summary_keys)
+        # イベント発行はコミットを伴うため、保存が終わってからまとめて行う
+        for student_id, task_label in live_feedbacks:
+            publish_feedback(student_id, task_label, '/japanese')
         return jsonify({'success': True, 'count': count})
     except Exception as e:
         db.session.rollback()
@@ -3009,6 +2391,7 @@ def student_quiz_assignment(assignment_id):
     if assignment.teacher_feedback and not assignment.feedback_seen:
         assignment.feedback_seen = True
         db.session.commit()
+        refresh_task_summaries([summary_key('quiz', assignment)])
         
     if request.method == 'POST':
         action = request.form.get('action')
@@ -3022,6 +2405,7 @@ def student_quiz_assignment(assignment_id):
                 assignment.completed_at = datetime.utcnow()
                 assignment.is_correct = True
                 db.session.commit()
+                refresh_task_summaries([summary_key('quiz', assignment)])
                 
                 # 通知送信
                 try:
@@ -3034,19 +2418,10 @@ def student_quiz_assignment(assignment_id):
                 flash('正解です！完了しました！', 'success')
                 
                 # 次の未完了問題を探す（連続実施のため）
-                # 同じ配信グループ（同じ分）の未完了問題を優先的に探す
-                group_time_str = assignment.assigned_at.strftime('%Y-%m-%d %H:%M')
-                
-                next_assignment = JapaneseAssignment.query.filter(
-                    JapaneseAssignment.student_id == current_user.id,
-                    JapaneseAssignment.completed == False,
-                    JapaneseAssignment.id != assignment.id
-                ).order_by(JapaneseAssignment.id).first()
+                # 同じ配信バッチのものがあればそれを、なければどれでも古い順（ID順）
+                next_assignment = find_next_pending('quiz', assignment)
                 
-                # 同じグループのものがあればそれを、なければどれでも古い順（ID順）
                 if next_assignment:
-                    # グループ内のものかチェック（厳密でなくてもいいが、近い時間のものを優先したいならここでフィルタしてもいい）
-                    # 今回は単純に未完了があれば次へ、とする
                      flash('正解！次の問題に進みます。', 'success')
                      return redirect(url_for('student_quiz_assignment', assignment_id=next_assignment.id))
                 
@@ -3057,42 +2432,16 @@ def student_quiz_assignment(assignment_id):
             assignment.completed = True
             assignment.completed_at = datetime.utcnow()
             db.session.commit()
+            refresh_task_summaries([summary_key('quiz', assignment)])
             flash('完了しました！', 'success')
             return redirect(url_for('dashboard'))
     
-    import json
     import random
-    options = [assignment.quiz.correct_reading]
-    try:
-        if assignment.quiz.wrong_readings:
-            wrongs = json.loads(assignment.quiz.wrong_readings)
-            options.extend(wrongs)
-    except:
-        pass
+    options = [assignment.quiz.correct_reading] + assignment.quiz.get_wrong_readings()
     random.shuffle(options)
     
-    # 同じグループ（同じ配信時間）の課題リストを取得してナビゲーション情報を作成
-    group_time_str = assignment.assigned_at.strftime('%Y-%m-%d %H:%M')
-    group_assignments = JapaneseAssignment.query.filter(
-        JapaneseAssignment.student_id == current_user.id
-    ).order_by(JapaneseAssignment.id).all()
-    
-    # 同じ分のものだけフィルタ
-    same_group = [a for a in group_assignments if a.assigned_at.strftime('%Y-%m-%d %H:%M') == group_time_str]
-    
-    # 現在位置と前後のIDを計算
-    current_index = next((i for i, a in enumerate(same_group) if a.id == assignment.id), 0)
-    total_count = len(same_group)
-    prev_id = same_group[current_index - 1].id if current_index > 0 else None
-    next_id = same_group[current_index + 1].id if current_index < total_count - 1 else None
-    
-    nav_info = {
-        'current': current_index + 1,
-        'total': total_count,
-        'prev_id': prev_id,
-        'next_id': next_id,
-        'group_items': same_group
-    }
+    # 同じ配信バッチの課題リストを取得してナビゲーション情報を作成
+    nav_info = get_group_navigation('quiz', assignment)
             
     return render_template('student_japanese_quiz.html', assignment=assignment, options=options, nav=nav_info)
 
@@ -3110,6 +2459,7 @@ def student_flashcard(assignment_id):
     if assignment.teacher_feedback and not assignment.feedback_seen:
         assignment.feedback_seen = True
         db.session.commit()
+        refresh_task_summaries([summary_key('flashcard', assignment)])
     
     if request.method == 'POST':
         action = request.form.get('action')
@@ -3117,6 +2467,7 @@ def student_flashcard(assignment_id):
             assignment.completed = True
             assignment.completed_at = datetime.utcnow()
             db.session.commit()
+            refresh_task_summaries([summary_key('flashcard', assignment)])
             
             # 通知送信
             try:
@@ -3128,49 +2479,14 @@ def student_flashcard(assignment_id):
 
             flash('フラッシュカード学習を完了しました！', 'success')
             
-            # 次の未完了フラッシュカードを探す（同じグループ優先）
-            group_time_str = assignment.assigned_at.strftime('%Y-%m-%d %H:%M')
-            
-            # 同じ配信時間のものを優先
-            all_pending = JapaneseFlashcardAssignment.query.filter(
-                JapaneseFlashcardAssignment.student_id == current_user.id,
-                JapaneseFlashcardAssignment.completed == False,
-                JapaneseFlashcardAssignment.id != assignment.id
-            ).order_by(JapaneseFlashcardAssignment.id).all()
-            
-            # 同じグループのものを探す
-            same_group = [a for a in all_pending if a.assigned_at.strftime('%Y-%m-%d %H:%M') == group_time_str]
-            
-            if same_group:
-                return redirect(url_for('student_flashcard', assignment_id=same_group[0].id))
-            elif all_pending:
-                # グループ外でも未完了があれば続ける（オプション）
-                return redirect(url_for('dashboard'))
-            else:
-                return redirect(url_for('dashboard'))
-
-    # 同じグループ（同じ配信時間）の課題リストを取得してナビゲーション情報を作成
-    group_time_str = assignment.assigned_at.strftime('%Y-%m-%d %H:%M')
-    group_assignments = JapaneseFlashcardAssignment.query.filter(
-        JapaneseFlashcardAssignment.student_id == current_user.id
-    ).order_by(JapaneseFlashcardAssignment.id).all()
-    
-    # 同じ分のものだけフィルタ
-    same_group = [a for a in group_assignments if a.assigned_at.strftime('%Y-%m-%d %H:%M') == group_time_str]
-    
-    # 現在位置と前後のIDを計算
-    current_index = next((i for i, a in enumerate(same_group) if a.id == assignment.id), 0)
-    total_count = len(same_group)
-    prev_id = same_group[current_index - 1].id if current_index > 0 else None
-    next_id = same_group[current_index + 1].id if current_index < total_count - 1 else None
-    
-    nav_info = {
-        'current': current_index + 1,
-        'total': total_count,
-        'prev_id': prev_id,
-        'next_id': next_id,
-        'group_items': same_group
-    }
+            # 次の未完了フラッシュカードを探す（同じ配信バッチのみ）
+            next_assignment = find_next_pending('flashcard', assignment, same_group_only=True)
+            if next_assignment:
+                return redirect(url_for('student_flashcard', assignment_id=next_assignment.id))
+            return redirect(url_for('dashboard'))
+
+    # 同じ配信バッチの課題リストを取得してナビゲーション情報を作成
+    nav_info = get_group_navigation('flashcard', assignment)
 
     return render_template('student_flashcard.html', assignment=assignment, nav=nav_info)
 
@@ -3188,6 +2504,7 @@ def student_writing(assignment_id):
     if assignment.teacher_feedback and not assignment.feedback_seen:
         assignment.feedback_seen = True
         db.session.commit()
+        refresh_task_summaries([summary_key('writing', assignment)])
     
     if request.method == 'POST':
         action = request.form.get('action')
@@ -3195,12 +2512,21 @@ def student_writing(assignment_id):
             assignment.completed = True
             assignment.completed_at = datetime.utcnow()
             
-            # 画像データの保存
+            # 画像データの保存（BLOBストアに保存し、DBにはキーのみ持たせる。
+            # 永続ディスクのない環境では BLOB_KEEP_DB_COPY でBase64も残す）
             result_image = request.form.get('result_image')
             if result_image:
-                assignment.result_image = result_image
+                try:
+                    assignment.result_image_key = save_data_url(result_image)
+                    assignment.result_image = result_image if app.config['BLOB_KEEP_DB_COPY'] else None
+                    # 一覧表示用のサムネイルをバックグラウンドで作成
+                    schedule_derivatives(assignment.result_image_key)
+                except (ValueError, OSError) as e:
+                    print(f"Blob Save Error: {e}")
+                    assignment.result_image = result_image
                 
             db.session.commit()
+            refresh_task_summaries([summary_key('writing', assignment)])
             
             # 通知送信
             try:
@@ -3212,53 +2538,73 @@ def student_writing(assignment_id):
 
             flash('書き取り練習を完了しました！', 'success')
             
-            # 次の未完了書き取りを探す（同じグループ優先）
-            group_time_str = assignment.assigned_at.strftime('%Y-%m-%d %H:%M')
-            
-            # 同じ配信時間のものを優先
-            all_pending = JapaneseWritingAssignment.query.filter(
-                JapaneseWritingAssignment.student_id == current_user.id,
-                JapaneseWritingAssignment.completed == False,
-                JapaneseWritingAssignment.id != assignment.id
-            ).order_by(JapaneseWritingAssignment.id).all()
-            
-            # 同じグループのものを探す
-            same_group = [a for a in all_pending if a.assigned_at.strftime('%Y-%m-%d %H:%M') == group_time_str]
-            
-            if same_group:
-                return redirect(url_for('student_writing', assignment_id=same_group[0].id))
-            elif all_pending:
-                # グループ外でも未完了があれば続ける（オプション）
-                return redirect(url_for('dashboard'))
-            else:
-                return redirect(url_for('dashboard'))
-
-    # 同じグループ（同じ配信時間）の課題リストを取得してナビゲーション情報を作成
-    group_time_str = assignment.assigned_at.strftime('%Y-%m-%d %H:%M')
-    group_assignments = JapaneseWritingAssignment.query.filter(
-        JapaneseWritingAssignment.student_id == current_user.id
-    ).order_by(JapaneseWritingAssignment.id).all()
-    
-    # 同じ分のものだけフィルタ
-    same_group = [a for a in group_assignments if a.assigned_at.strftime('%Y-%m-%d %H:%M') == group_time_str]
-    
-    # 現在位置と前後のIDを計算
-    current_index = next((i for i, a in enumerate(same_group) if a.id == assignment.id), 0)
-    total_count = len(same_group)
-    prev_id = same_group[current_index - 1].id if current_index > 0 else None
-    next_id = same_group[current_index + 1].id if current_index < total_count - 1 else None
-    
-    nav_info = {
-        'current': current_index + 1,
-        'total': total_count,
-        'prev_id': prev_id,
-        'next_id': next_id,
-        'group_items': same_group
-    }
+            # 次の未完了書き取りを探す（同じ配信バッチのみ）
+            next_assignment = find_next_pending('writing', assignment, same_group_only=True)
+            if next_assignment:
+                return redirect(url_for('student_writing', assignment_id=next_assignment.id))
+            return redirect(url_for('dashboard'))
+
+    # 同じ配信バッチの課題リストを取得してナビゲーション情報を作成
+    nav_info = get_group_navigation('writing', assignment)
 
     return render_template('student_writing.html', assignment=assignment, nav=nav_info)
 
 
+def can_view_blob(key):
+    """先生、またはその画像を提出した生徒のみ閲覧可能"""
+    if current_user.is_teacher():
+        return True
+    return JapaneseWritingAssignment.query.filter_by(
+        result_image_key=key, student_id=current_user.id
+    ).first() is not None
+
+
+def send_immutable_file(path, content_type, etag):
+    """内容が変わらないファイルを長期キャッシュ付きで配信（If-None-Match には304を返す）"""
+    from flask import send_file
+    response = send_file(path, mimetype=content_type, etag=etag,
+                         conditional=True, max_age=31536000)
+    response.cache_control.private = True
+    response.cache_control.public = False
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route('/blobs/<key>')
+@login_required
+def serve_blob(key):
+    """BLOBストアのファイルを配信（ETagはSHA-256そのもの）"""
+    from flask import abort
+    parsed = parse_key(key)
+    if not parsed or not can_view_blob(key):
+        abort(404)
+
+    path = blob_path(key)
+    if not os.path.exists(path):
+        abort(404)
+
+    digest, content_type = parsed
+    return send_immutable_file(path, content_type, digest)
+
+
+@app.route('/blobs/<key>/<variant>')
+@login_required
+def serve_blob_derivative(key, variant):
+    """BLOBストアの画像のサムネイルを配信（未作成ならその場で作成）"""
+    from flask import abort
+    parsed = parse_key(key)
+    if not parsed or variant not in VARIANTS or not can_view_blob(key):
+        abort(404)
+
+    path = generate_derivative(key, variant)
+    if not path:
+        # サムネイルを作れない場合は原寸画像を返す
+        return redirect(url_for('serve_blob', key=key))
+
+    digest = parsed[0]
+    return send_immutable_file(path, derivative_format()[1], f'{digest}-{variant}')
+
+
 
 if __name__ == '__main__':
     init_db()
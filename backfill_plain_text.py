@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+回答・連絡事項のプレーンテキスト作成スクリプト
+plain_text / summary が未作成の回答と連絡事項を本文から変換して保存します。
+実行方法: python backfill_plain_text.py
+"""
+
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from plain_text import backfill_plain_text
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        answers, announcements = backfill_plain_text()
+        print(f'✅ プレーンテキストを作成しました（回答 {answers}件 / 連絡事項 {announcements}件）')
@@ -0,0 +1,102 @@
+# BLOBストアモジュール
+# 書き取り結果画像などの大きなバイナリをDBではなくディスクに保存する。
+# ファイルは内容のSHA-256で管理し（同じ内容は1ファイルのみ）、DBには短いキーだけを持たせる
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+from flask import current_app
+
+# 対応するContent-Typeと拡張子
+CONTENT_TYPES = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+}
+EXTENSION_TYPES = {ext: content_type for content_type, ext in CONTENT_TYPES.items()}
+
+# キーの形式: <SHA-256の16進64文字>.<拡張子>
+KEY_PATTERN = re.compile(r'^([0-9a-f]{64})\.(png|jpg|webp)$')
+DATA_URL_PATTERN = re.compile(r'^data:(image/[a-z+.-]+);base64,(.*)$', re.DOTALL)
+
+
+def _storage_dir():
+    return current_app.config['BLOB_STORAGE_DIR']
+
+
+def parse_key(key):
+    """キーを (digest, content_type) に分解（不正なキーはNone）"""
+    match = KEY_PATTERN.match(key or '')
+    if not match:
+        return None
+    return match.group(1), EXTENSION_TYPES[match.group(2)]
+
+
+def blob_path(key):
+    """キーに対応するファイルパス（先頭2文字ずつでディレクトリを分ける）"""
+    parsed = parse_key(key)
+    if not parsed:
+        raise ValueError(f'不正なBLOBキーです: {key}')
+    digest = parsed[0]
+    return os.path.join(_storage_dir(), digest[:2], digest[2:4], key)
+
+
+def verify_blob(key):
+    """キーのファイルが保存されていて、内容がキーのSHA-256と一致するか"""
+    parsed = parse_key(key)
+    if not parsed:
+        return False
+    try:
+        with open(blob_path(key), 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return False
+    return digest == parsed[0]
+
+
+def save_blob(data, content_type):
+    """バイナリを保存してキーを返す（同じ内容が保存済みなら書き込まない）"""
+    extension = CONTENT_TYPES.get(content_type)
+    if not extension:
+        raise ValueError(f'未対応のContent-Typeです: {content_type}')
+
+    key = f'{hashlib.sha256(data).hexdigest()}.{extension}'
+    path = blob_path(key)
+    if os.path.exists(path):
+        return key
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # 一時ファイルに書いてからリネームし、書きかけのファイルが見えないようにする
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return key
+
+
+def decode_data_url(data_url):
+    """Base64のデータURLを (バイナリ, content_type) に変換"""
+    match = DATA_URL_PATTERN.match((data_url or '').strip())
+    if not match:
+        raise ValueError('データURLの形式ではありません')
+    try:
+        data = base64.b64decode(match.group(2), validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError('Base64のデコードに失敗しました')
+    return data, match.group(1)
+
+
+def save_data_url(data_url):
+    """Base64のデータURLを保存してキーを返す"""
+    data, content_type = decode_data_url(data_url)
+    return save_blob(data, content_type)
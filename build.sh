@@ -10,5 +10,12 @@ pip install -r requirements.txt
 # データベースの初期設定、漢字データの投入、管理者ユーザーの作成を順次実行
 # 注意: ビルド時にDBに接続できない場合があるため、失敗してもエラーにしない (|| true)
 python -c "from app import app, db; app.app_context().push(); db.create_all()" || true
+# 既存テーブルへの列・インデックスの追加は db.create_all() では行われないため、マイグレーションを適用する
+# （失敗したままデプロイすると新しい列を参照するページがエラーになるので、失敗したらビルドを止める）
+python stamp_legacy_db.py
+FLASK_APP=app.py flask db upgrade
 python -c "from app import app; from seed_kanji import seed_kanji; app.app_context().push(); seed_kanji()" || true
 python create_admin.py || true
+python rebuild_task_summaries.py || true
+python backfill_plain_text.py || true
+python rebuild_search_index.py || true
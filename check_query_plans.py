@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+クエリ実行計画のチェックスクリプト
+ダッシュボード・学習状況の主要クエリに EXPLAIN を実行し、
+テーブルの全件スキャンが含まれていれば終了コード1で失敗します。
+画面の仕様で全件を読むクエリは、インデックスの順に読めていること
+（全件を読んでから並べ替えていないこと）を確認します。
+実行方法: python check_query_plans.py
+"""
+
+import os
+import re
+import sys
+from datetime import datetime
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func
+
+from app import app, db, student_problems_query
+from models import (
+    User, Problem, Answer, Feedback, ScheduledNotification, JapaneseStats, JapaneseWordStats,
+    JapaneseTaskSummary
+)
+from task_summary import ASSIGNMENT_MODELS
+from japanese_delivery import ITEM_COLUMNS
+
+
+def _sample_id(model, **filters):
+    """EXPLAIN 用のサンプルID（データがなければ1）"""
+    row = db.session.query(model.id).filter_by(**filters).first()
+    return row[0] if row else 1
+
+
+def build_queries():
+    """チェック対象のクエリ一覧 (ラベル, SELECT文) を作成"""
+    student_id = _sample_id(User, role='student')
+    problem_id = _sample_id(Problem)
+    answer_id = _sample_id(Answer)
+    now = datetime.utcnow()
+
+    queries = [
+        ('生徒ダッシュボード: 日本語課題集計',
+         JapaneseTaskSummary.query.filter_by(student_id=student_id)
+         .order_by(JapaneseTaskSummary.group_date.desc())),
+        ('生徒ダッシュボード: 回答数',
+         db.session.query(func.count(Answer.id)).filter(Answer.student_id == student_id)),
+        ('学習状況: 問題ごとの回答',
+         Answer.query.filter_by(problem_id=problem_id, student_id=student_id)),
+        ('学習状況: 回答へのフィードバック',
+         Feedback.query.filter_by(answer_id=answer_id)),
+        ('日本語ダッシュボード: 回答統計',
+         JapaneseStats.query.filter_by(user_id=student_id)),
+        ('日本語ダッシュボード: 苦手な熟語',
+         JapaneseWordStats.query.filter(
+             JapaneseWordStats.user_id == student_id,
+             JapaneseWordStats.correct < JapaneseWordStats.attempts)),
+        ('予約通知: 送信待ち',
+         ScheduledNotification.query.filter(
+             ScheduledNotification.is_sent == False,
+             ScheduledNotification.scheduled_at <= now)),
+    ]
+
+    for task_type, model in ASSIGNMENT_MODELS.items():
+        item_column = getattr(model, ITEM_COLUMNS[task_type])
+        queries.append((f'{task_type}: 未完了の課題',
+                        model.query.filter(model.student_id == student_id,
+                                           model.completed == False)
+                        .order_by(model.id)))
+        queries.append((f'{task_type}: 配信済みチェック',
+                        db.session.query(item_column, model.student_id).filter(
+                            item_column.in_([1, 2]),
+                            model.student_id.in_([student_id]))))
+    return queries
+
+
+def build_ordered_reads():
+    """全件を読むクエリの一覧 (ラベル, SELECT文)"""
+    return [
+        ('生徒ダッシュボード: 問題一覧', student_problems_query()),
+    ]
+
+
+def explain(statement):
+    """実行計画の各行を文字列のリストで取得"""
+    bind = db.session.get_bind()
+    # IN (...) のパラメータを展開してコンパイル
+    compiled = statement.compile(dialect=bind.dialect,
+                                 compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if bind.dialect.name == 'sqlite':
+        rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params)
+        # (id, parent, notused, detail) の detail のみ使う
+        return [row[-1] for row in rows]
+
+    if bind.dialect.name == 'postgresql':
+        # 行数の少ないテーブルでは常に Seq Scan が選ばれるため、
+        # インデックスが使えるかどうかだけを確認する
+        connection = db.session.connection()
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        rows = connection.exec_driver_sql(f'EXPLAIN {compiled}', params)
+        return [row[0] for row in rows]
+
+    raise RuntimeError(f'未対応のデータベースです: {bind.dialect.name}')
+
+
+def is_full_scan(line):
+    """実行計画の行がテーブルの全件スキャンかどうか"""
+    line = line.strip()
+    if 'Seq Scan' in line:  # PostgreSQL
+        return True
+    # SQLite: SEARCH はインデックス検索、SCAN は全件スキャン
+    return line.startswith('SCAN ') and not line.startswith('SCAN CONSTANT ROW')
+
+
+def is_unordered_read(line):
+    """実行計画の行が、インデックスを使わずに全件を読む・並べ替える処理かどうか"""
+    line = line.strip()
+    if 'Seq Scan' in line or re.search(r'(^|-> +)Sort\b', line):  # PostgreSQL
+        return True
+    # SQLite: ORDER BY のための一時B-treeは並べ替え、USING のない SCAN はテーブル順の全件読み込み
+    if 'TEMP B-TREE' in line:
+        return True
+    return line.startswith('SCAN ') and ' USING ' not in line
+
+
+def check_query_plans():
+    """全クエリをチェックし、全件スキャンを含むクエリのラベルを返す"""
+    failures = []
+    checks = [(label, query, is_full_scan) for label, query in build_queries()]
+    checks += [(label, query, is_unordered_read) for label, query in build_ordered_reads()]
+    for label, query, is_bad in checks:
+        statement = getattr(query, 'statement', query)
+        plan = explain(statement)
+        scans = [line for line in plan if is_bad(line)]
+        mark = '❌' if scans else '✅'
+        print(f'{mark} {label}')
+        for line in plan:
+            print(f'    {line}')
+        if scans:
+            failures.append(label)
+    db.session.rollback()
+    return failures
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        failures = check_query_plans()
+        if failures:
+            print(f'\n❌ 全件スキャンを含むクエリが{len(failures)}件あります:')
+            for label in failures:
+                print(f'  - {label}')
+            sys.exit(1)
+        print('\n✅ すべてのクエリでインデックスが使われています。')
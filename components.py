@@ -0,0 +1,128 @@
+# 問題コンポーネント（再利用できるテキストブロック・回答欄ウィジェット）の抽出と保存
+# 問題の作成・編集時に本文HTMLからブロックを取り出し、未登録のものだけを保存する。
+# 大きな問題でも先生の保存操作を待たせないよう、抽出はレスポンスとは別のスレッドで行う。
+
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from bs4 import BeautifulSoup
+from flask import current_app
+
+from models import db, ProblemComponent
+from search_index import index_components
+
+# テキストブロックのハッシュはパーサーが書き出したHTMLから計算するため、
+# 登録済みのコンポーネントと同じハッシュになるよう標準のパーサーを使い続ける
+# （lxmlなどは入れ子の崩れたタグを別の形に直すので、ハッシュが変わって重複登録になる）
+HTML_PARSER = 'html.parser'
+
+# コンポーネント抽出用のバックグラウンドスレッド（1本で順に処理し、同じブロックの二重登録を防ぐ）
+_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def _hash(raw_data):
+    return hashlib.sha256(raw_data.encode('utf-8')).hexdigest()
+
+
+def _parse_choices(raw_choices):
+    """ウィジェットの data-choices 属性（JSON文字列）を選択肢のリストにする"""
+    try:
+        choices = json.loads(raw_choices)
+    except ValueError:
+        return []
+    return choices if isinstance(choices, list) else []
+
+
+def extract_components(html_content):
+    """HTMLからコンポーネントを抽出（同じハッシュのものは1つにまとめる）
+
+    戻り値: ProblemComponent の列の値の辞書のリスト
+    """
+    if not html_content:
+        return []
+    soup = BeautifulSoup(html_content, HTML_PARSER)
+    components = {}
+
+    # テキストブロック（block-text の中身）
+    for block in soup.find_all(class_='block-text'):
+        content = str(block.decode_contents()).strip()  # innerHTML
+        if not content:
+            continue
+        # ハッシュ計算 (type + content)
+        content_hash = _hash(f"text:{content}")
+        components.setdefault(content_hash, {
+            'content': content,
+            'component_type': 'text',
+            'content_hash': content_hash,
+            'description': None,
+            'choices_json': None,
+        })
+
+    # ウィジェット
+    for widget in soup.find_all(class_='question-widget'):
+        w_type = widget.get('data-widget-type', 'unknown')
+        w_choices = widget.get('data-choices', '[]')
+
+        # 説明文抽出（改行を維持してテキスト化）
+        description = ''
+        desc_div = widget.find(class_='widget-description')
+        if desc_div:
+            description = desc_div.get_text("\n", strip=True)
+
+        # コンテンツ自体はwidgetタグ全体を保存するが（再利用時にそのまま埋め込めるように）、
+        # 同一性の判定はメタデータ (type + choices + description) で行う
+        content_hash = _hash(f"widget:{w_type}:{w_choices}:{description}")
+        components.setdefault(content_hash, {
+            'content': str(widget),
+            'component_type': f"widget-{w_type}",
+            'content_hash': content_hash,
+            'description': description,
+            'choices_json': _parse_choices(w_choices),
+        })
+
+    return list(components.values())
+
+
+def save_components_from_html(html_content):
+    """HTMLコンテンツからコンポーネントを抽出して、未登録のものを保存
+
+    既存のハッシュは1回の IN クエリで確認し、新しいコンポーネントはまとめて INSERT する。
+    戻り値: 新しく保存したコンポーネント数
+    """
+    components = extract_components(html_content)
+    if not components:
+        return 0
+
+    hashes = [c['content_hash'] for c in components]
+    existing = set(db.session.scalars(
+        db.select(ProblemComponent.content_hash).where(ProblemComponent.content_hash.in_(hashes))
+    ))
+    new_rows = [c for c in components if c['content_hash'] not in existing]
+    if not new_rows:
+        return 0
+
+    created = db.session.scalars(
+        db.insert(ProblemComponent).returning(ProblemComponent), new_rows
+    ).all()
+    index_components(created)
+    db.session.commit()
+    return len(created)
+
+
+def _save_in_background(app, html_content):
+    with app.app_context():
+        try:
+            save_components_from_html(html_content)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error saving components: {e}")
+        finally:
+            db.session.remove()
+
+
+def schedule_component_extraction(html_content):
+    """コンポーネントの抽出・保存をバックグラウンドで開始（問題のコミット後に呼ぶ）"""
+    if not html_content:
+        return
+    _executor.submit(_save_in_background, current_app._get_current_object(), html_content)
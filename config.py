@@ -1,5 +1,6 @@
 # 石川七夢講師専用学習アプリ - 設定
 
+import json
 import os
 
 class Config:
@@ -18,6 +19,52 @@ class Config:
         _database_url = _database_url.replace('postgres://', 'postgresql://', 1)
     SQLALCHEMY_DATABASE_URI = _database_url or 'sqlite:///nanami_learning.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # JSONカラム（選択肢など）は日本語をエスケープせずに保存する
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'json_serializer': lambda value: json.dumps(value, ensure_ascii=False),
+    }
     
     # セッション設定
     PERMANENT_SESSION_LIFETIME = 86400  # 24時間
+    
+    # 書き取り画像などのファイル保存先（SHA-256で管理するBLOBストア）
+    # 本番では永続ディスクのパスを環境変数で指定する
+    BLOB_STORAGE_DIR = os.environ.get('BLOB_STORAGE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'blobs')
+    # 書き取り画像のBase64をDBにも残すか（既定ではDBにはキーのみ持たせる）
+    # BLOB_STORAGE_DIR が永続ディスクでない環境（デプロイごとにファイルが消える）でだけ 1 にする
+    BLOB_KEEP_DB_COPY = os.environ.get('BLOB_KEEP_DB_COPY', '0') == '1'
+    
+    # 1プロセスで同時に開いておくリアルタイム更新（/api/events）の接続数の上限
+    # 接続中はgunicornのスレッドを1本使うので、通常のリクエスト用のスレッドを残しておく
+    # 上限を超えたブラウザは /api/check-new のポーリングで新着を確認する
+    LIVE_EVENTS_MAX_STREAMS = int(os.environ.get('LIVE_EVENTS_MAX_STREAMS', 4))
+    
+    # ログインユーザーのキャッシュ有効期間（秒）。0でキャッシュしない
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+    
+    # 自由練習の出題に使う問題ID一覧のキャッシュ有効期間（秒）。0でキャッシュしない
+    QUIZ_POOL_TTL = int(os.environ.get('QUIZ_POOL_TTL', 300))
+    
+    # AIの応答キャッシュ（同じモデル・プロンプト・パラメータの呼び出しを再利用）
+    LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', '1') != '0'
+    # 応答の有効期間（秒）
+    LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 30 * 24 * 3600))
+    # プロセス内に保持する件数（0でプロセス内には保持しない）
+    LLM_CACHE_MEMORY_SIZE = int(os.environ.get('LLM_CACHE_MEMORY_SIZE', 256))
+    # llm_cache テーブルに保持する件数
+    LLM_CACHE_MAX_ROWS = int(os.environ.get('LLM_CACHE_MAX_ROWS', 5000))
+    
+    # 生徒のAIクイズ用に生成しておく問題数（難易度ごと）。残りが LOW を下回ったら SIZE まで補充する
+    AI_QUIZ_POOL_SIZE = int(os.environ.get('AI_QUIZ_POOL_SIZE', 20))
+    AI_QUIZ_POOL_LOW = int(os.environ.get('AI_QUIZ_POOL_LOW', 5))
+    # 補充時に1回のAI呼び出しで生成する問題数
+    AI_QUIZ_POOL_BATCH = int(os.environ.get('AI_QUIZ_POOL_BATCH', 10))
+    
+    # 自由練習のカテゴリ別の出やすさ（例: "manual:2,kanji_grade:0.5"）。指定のないカテゴリは1
+    QUIZ_CATEGORY_WEIGHTS = {
+        name.strip(): float(weight)
+        for name, _, weight in (
+            item.partition(':') for item in os.environ.get('QUIZ_CATEGORY_WEIGHTS', '').split(',') if ':' in item
+        )
+    }
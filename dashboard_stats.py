@@ -0,0 +1,153 @@
+# 先生ダッシュボードの集計
+# 問題数・生徒数・フィードバック待ちの回答数を dashboard_stats の1行に保持し、
+# 作成・削除の処理で増減させる（ダッシュボード表示は主キー1回の参照だけで済む）。
+# 増減の取りこぼしは定期的な再集計で補正し、ディスク使用量とDBサイズは
+# リクエストとは別のスレッドで定期的に計測する。
+
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Problem, Answer, Feedback, DashboardStats
+
+# 集計行のID（1行のみ）
+STATS_ID = 1
+# ディスク使用量・DBサイズを計測する間隔（秒）
+SAMPLE_INTERVAL = 300
+# 実データから再集計する間隔（秒）
+RECONCILE_INTERVAL = 3600
+
+COUNT_FIELDS = ('problems', 'students', 'pending_answers')
+
+_sampler_lock = threading.Lock()
+_sampler_pid = None
+
+
+def pending_answers_query():
+    """フィードバック待ちの回答（NOT EXISTS で数える）"""
+    return Answer.query.filter(~db.exists().where(Feedback.answer_id == Answer.id))
+
+
+def adjust_stats(**deltas):
+    """件数を増減（呼び出し元のトランザクション内で実行し、コミットは呼び出し元で行う）
+
+    例: adjust_stats(problems=1), adjust_stats(pending_answers=-3)
+    集計行がまだない場合は何もしない（初回表示時の再集計で作成される）
+    """
+    values = {}
+    for field, delta in deltas.items():
+        if field not in COUNT_FIELDS:
+            raise ValueError(f'不明な集計項目です: {field}')
+        if delta:
+            column = getattr(DashboardStats, field)
+            values[column] = column + delta
+    if not values:
+        return
+    db.session.execute(
+        db.update(DashboardStats).where(DashboardStats.id == STATS_ID).values(values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _get_or_create_row():
+    row = db.session.get(DashboardStats, STATS_ID)
+    if row is None:
+        row = DashboardStats(id=STATS_ID)
+        db.session.add(row)
+    return row
+
+
+def reconcile_stats():
+    """件数を実データから数え直して保存"""
+    row = _get_or_create_row()
+    row.problems = Problem.query.count()
+    row.students = User.query.filter_by(role='student').count()
+    row.pending_answers = pending_answers_query().count()
+    row.reconciled_at = datetime.utcnow()
+    db.session.commit()
+    return row
+
+
+def _database_size():
+    """データベースのサイズ（バイト）。取得できない場合はNone"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return db.session.execute(text('SELECT pg_database_size(current_database())')).scalar()
+    if dialect == 'sqlite':
+        page_count = db.session.execute(text('PRAGMA page_count')).scalar()
+        page_size = db.session.execute(text('PRAGMA page_size')).scalar()
+        return page_count * page_size
+    return None
+
+
+def sample_system_metrics():
+    """ディスク使用量とDBサイズを計測して保存"""
+    total, used, free = shutil.disk_usage('/')
+    row = _get_or_create_row()
+    row.disk_used_percent = int((used / total) * 100)
+    row.disk_free_gb = round(free / (1024**3), 2)
+    try:
+        row.db_size_bytes = _database_size()
+    except Exception as e:
+        print(f"DB Size Error: {e}")
+    row.sampled_at = datetime.utcnow()
+    db.session.commit()
+    return row
+
+
+def _run_sampler(app):
+    last_reconcile = time.time()
+    while True:
+        with app.app_context():
+            try:
+                sample_system_metrics()
+                if time.time() - last_reconcile >= RECONCILE_INTERVAL:
+                    reconcile_stats()
+                    last_reconcile = time.time()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Dashboard Stats Error: {e}")
+            finally:
+                db.session.remove()
+        time.sleep(SAMPLE_INTERVAL)
+
+
+def start_sampler():
+    """計測スレッドをプロセスごとに1本だけ起動（fork後のワーカーでも起動し直す）"""
+    global _sampler_pid
+    if _sampler_pid == os.getpid():
+        return
+    with _sampler_lock:
+        if _sampler_pid == os.getpid():
+            return
+        app = current_app._get_current_object()
+        threading.Thread(target=_run_sampler, args=(app,), daemon=True).start()
+        _sampler_pid = os.getpid()
+
+
+def get_dashboard_stats():
+    """ダッシュボード用の集計（集計行がまだなければ作成する）"""
+    row = db.session.get(DashboardStats, STATS_ID)
+    if row is None:
+        try:
+            row = reconcile_stats()
+        except IntegrityError:
+            # 同時に別のリクエストが作成した場合はそちらを使う
+            db.session.rollback()
+            row = db.session.get(DashboardStats, STATS_ID)
+    start_sampler()
+    return {
+        'problems': row.problems,
+        'students': row.students,
+        'pending_answers': row.pending_answers,
+        'disk_used_percent': row.disk_used_percent,
+        'disk_free_gb': row.disk_free_gb,
+        'db_size_mb': round(row.db_size_bytes / (1024**2), 1) if row.db_size_bytes is not None else None,
+        'sampled_at': row.sampled_at,
+    }
@@ -0,0 +1,18 @@
+# データベース操作の共通ヘルパー
+
+from sqlalchemy import insert
+
+from models import db
+
+
+def insert_ignore(table):
+    """重複時は何もしないINSERT文を作成（SQLite / PostgreSQL）"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        # その他のDBでは事前の存在チェックのみで重複を防ぐ
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing()
@@ -0,0 +1,135 @@
+# 自由練習（フラッシュカード・漢字書き取り）のデッキ移動
+# デッキ内の並び順（ID順）のID一覧と ID→位置 の対応をプロセス内へキャッシュしておき、
+# ページをめくるたびに全件を読み込まずに、表示するカードだけを主キーで取得する。
+# カードを追加・削除する処理では invalidate_deck() を呼び、古いID一覧を使わないようにする。
+# （無効化は同じプロセス内のみ。他ワーカーでの追加は最大で有効期間だけ遅れてデッキに入る。
+#  他ワーカーで削除されたカードに当たった場合は、その場でID一覧を読み直す）
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy.orm import load_only
+
+from models import db, JapaneseFlashcard, JapaneseWriting
+
+# ID一覧のキャッシュの有効期間（秒）の既定値。設定 DECK_INDEX_TTL で変更できる
+DEFAULT_TTL = 300
+
+# 一度に先読みできるカードの枚数
+MAX_PREFETCH = 20
+
+# カードとして返すカラム
+CARD_FIELDS = ('word', 'reading', 'meaning', 'example')
+
+# デッキの種類: モデル
+DECKS = {
+    'flashcards': JapaneseFlashcard,
+    'writings': JapaneseWriting,
+}
+
+_lock = threading.Lock()
+_indexes = {}  # デッキ名 -> (有効期限, ID一覧, {ID: 位置})
+_versions = {}  # デッキ名 -> 無効化の回数（読み込み中に無効化された一覧を保存しないため）
+
+
+def _ttl():
+    return current_app.config.get('DECK_INDEX_TTL', DEFAULT_TTL)
+
+
+def get_deck_index(name):
+    """デッキの (ID一覧, {ID: 位置})（有効期間内ならキャッシュから）"""
+    now = time.monotonic()
+    with _lock:
+        entry = _indexes.get(name)
+        version = _versions.get(name, 0)
+    if entry and entry[0] > now:
+        return entry[1], entry[2]
+
+    model = DECKS[name]
+    ids = tuple(db.session.scalars(db.select(model.id).order_by(model.id)))
+    positions = {card_id: position for position, card_id in enumerate(ids)}
+    ttl = _ttl()
+    if ttl > 0:
+        with _lock:
+            # 読み込み中に invalidate_deck() された場合は古い一覧を保存しない
+            if _versions.get(name, 0) == version:
+                _indexes[name] = (now + ttl, ids, positions)
+    return ids, positions
+
+
+def invalidate_deck(name):
+    """カードの追加・削除のコミット後に呼び出し、デッキのID一覧のキャッシュを破棄する"""
+    with _lock:
+        _indexes.pop(name, None)
+        _versions[name] = _versions.get(name, 0) + 1
+
+
+def _card(values, index, card_id=None):
+    card = {'id': card_id, 'index': index}
+    for field in CARD_FIELDS:
+        card[field] = values.get(field) or ''
+    return card
+
+
+def _navigation(index, total, ids=None):
+    prev_index = (index - 1) % total
+    next_index = (index + 1) % total
+    return {
+        'index': index,
+        'total': total,
+        'prev_index': prev_index,
+        'next_index': next_index,
+        'prev_id': ids[prev_index] if ids else None,
+        'next_id': ids[next_index] if ids else None,
+    }
+
+
+def _fallback_page(fallback, index, count):
+    total = len(fallback)
+    index = index % total
+    page = _navigation(index, total)
+    page['cards'] = [
+        _card(fallback[(index + offset) % total], (index + offset) % total) for offset in range(min(count, total))
+    ]
+    return page
+
+
+def get_deck_page(name, card_id=None, index=0, count=1, fallback=()):
+    """デッキの指定位置から count 枚のカードを取得（末尾の次は先頭に戻る）
+
+    card_id: 表示するカードのID（指定があれば index より優先。デッキにないIDは index を使う）
+    index: 表示する位置
+    count: 取得する枚数（2枚目以降は先読み用。最大 MAX_PREFETCH + 1 枚）
+    fallback: デッキが空のときに使う既定のカード（辞書のリスト）
+    戻り値: {'index', 'total', 'prev_index', 'next_index', 'prev_id', 'next_id', 'cards': [...]}
+             デッキも fallback も空なら None
+    """
+    count = max(1, min(int(count), MAX_PREFETCH + 1))
+    model = DECKS[name]
+    for _ in range(2):
+        ids, positions = get_deck_index(name)
+        if not ids:
+            return _fallback_page(fallback, index, count) if fallback else None
+
+        total = len(ids)
+        if card_id is not None and card_id in positions:
+            index = positions[card_id]
+        index = index % total
+        page_ids = [ids[(index + offset) % total] for offset in range(min(count, total))]
+
+        rows = {row.id: row for row in model.query.options(
+            load_only(*(getattr(model, field) for field in CARD_FIELDS))
+        ).filter(model.id.in_(page_ids))}
+        if len(rows) < len(page_ids):
+            # 他のワーカーで削除されたカード：ID一覧を読み直す
+            invalidate_deck(name)
+            continue
+
+        page = _navigation(index, total, ids)
+        page['cards'] = [
+            _card({field: getattr(rows[page_id], field) for field in CARD_FIELDS}, (index + offset) % total, page_id)
+            for offset, page_id in enumerate(page_ids)
+        ]
+        return page
+    return None
@@ -84,8 +84,9 @@ def send_push_to_users(users, title, body, data=None):
 def send_announcement_notification(announcement, recipients):
     """連絡事項の通知を送信"""
     title = f"📢 {announcement.title}"
-    # HTMLタグを除去してプレーンテキストにする
-    plain_content = strip_html_tags(announcement.content)
+    # 保存時に作成したプレーンテキストを使う（未作成の古い連絡事項はHTMLタグを除去）
+    from plain_text import announcement_text
+    plain_content = announcement_text(announcement)
     body = plain_content[:100] + ("..." if len(plain_content) > 100 else "")
     data = {
         "type": "announcement",
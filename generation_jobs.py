@@ -0,0 +1,487 @@
+# AIによる問題生成のジョブ
+# AIの応答には数秒〜数十秒かかるため、先生の生成操作はジョブとして登録してすぐに画面を返し、
+# 生成はバックグラウンドのスレッドで行う（画面は /api/generation-jobs/<id> で状態を問い合わせる）。
+# ジョブは generation_jobs テーブルに保存するので、処理中にプロセスが再起動しても
+# 未処理のジョブは次に起動したプロセスが最初のリクエストで再開する（resume_jobs）。
+# 実行中のまま STALE_AFTER を過ぎたジョブは、処理していたプロセスが停止したものとして
+# 再開時や状態の問い合わせ時に失敗にする。
+# 同時に生成できるジョブ数はスレッド数で制限し、生成が続いても生徒のリクエストの処理を妨げない。
+# 漢字を選んで作るジョブは、選んだ漢字を KANJI_CHUNK_SIZE 字ずつに分けて並行してAIに送る。
+# 1回の応答が長くなりすぎず（途中で切れてJSONが壊れない）、待ち時間も選んだ字数ではなく区切りの大きさで決まる。
+# 失敗した区切りはやり直し、それでも失敗した区切りがあっても成功した分は保存する。
+
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, User, JapaneseQuiz, JapaneseFlashcard, JapaneseWriting, GenerationJob
+from japanese_delivery import deliver_japanese_items, notify_delivery
+from quiz_sampler import invalidate_quiz_pool
+from deck import invalidate_deck
+from llm import complete_cached
+
+# 同時に実行する生成ジョブの数
+MAX_WORKERS = 2
+# この時間を過ぎても実行中のままのジョブは、処理していたプロセスが停止したものとして失敗にする
+STALE_AFTER = timedelta(minutes=10)
+STALE_ERROR = '生成が中断されました。もう一度お試しください。'
+# 状態の問い合わせで返す生成結果のプレビュー件数
+PREVIEW_LIMIT = 50
+# 漢字を選んで作るジョブで、1回のAIの呼び出しに含める漢字の数
+KANJI_CHUNK_SIZE = 10
+# 区切りごとのAIの呼び出しを同時に行う数（全ジョブで共有）
+CHUNK_WORKERS = 4
+# 区切りごとのやり直しの回数
+CHUNK_RETRIES = 2
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+# ジョブのスレッドから区切りごとの呼び出しを投げるため、ジョブ用とは別のスレッドで実行する
+_chunk_executor = ThreadPoolExecutor(max_workers=CHUNK_WORKERS)
+_resume_lock = threading.Lock()
+_resumed_pid = None
+
+
+class GenerationError(Exception):
+    """生成結果が使えない場合のエラー（メッセージは先生にそのまま表示する）"""
+
+
+# ===== プロンプト =====
+
+QUIZ_DIFFICULTIES = {
+    'easy': 'N5レベル（最も簡単、小学校低学年向け）',
+    'medium': 'N4レベル（普通、小学校高学年向け）',
+    'hard': 'N3レベル（難しい、中学生向け）'
+}
+
+WRITING_LEVELS = {
+    'easy': '小学1-2年生レベル（画数が少なく簡単な漢字）',
+    'medium': '小学3-4年生レベル（よく使う基本的な漢字）',
+    'hard': '小学5-6年生レベル（少し難しい漢字）'
+}
+
+
+def _quiz_prompt(params):
+    theme = params.get('theme')
+    theme_text = f"テーマは「{theme}」に関連する熟語で" if theme else ""
+    return f"""日本語学習者のために、{QUIZ_DIFFICULTIES.get(params.get('difficulty'), 'N4レベル')}の熟語クイズを{params['count']}問作ってください。
+{theme_text}
+
+以下のJSON配列形式で回答してください（他のテキストは含めないでください）：
+[
+  {{
+    "word": "熟語（漢字）",
+    "correct_reading": "正しい読み方（ひらがな）",
+    "wrong_readings": ["間違い1", "間違い2", "間違い3"],
+    "meaning_chinese": "中国語の意味（ピンイン付き）",
+    "example": "例文"
+  }}
+]
+
+各問題は異なる熟語にしてください。間違い選択肢は、正解と似ているが間違っているものにしてください。"""
+
+
+def _flashcard_prompt(params):
+    theme = params.get('theme')
+    theme_text = f"テーマは「{theme}」に関連する単語で" if theme else ""
+    return f"""中国の小学生のための日本語学習フラッシュカードを{params['count']}枚作ってください。
+{theme_text}
+
+JSON配列形式で回答してください：
+[
+  {{"word": "漢字/熟語", "reading": "読み方", "meaning": "中国語の意味（ピンイン付き）", "example": "例文"}}
+]"""
+
+
+def _writing_prompt(params):
+    return f"""中国の小学生が練習するための日本語の漢字を{params['count']}字選んでください。
+レベル: {WRITING_LEVELS.get(params.get('level'), '小学3-4年生レベル')}
+
+JSON配列形式で回答してください：
+[
+  {{"word": "漢字1文字", "reading": "読み方（音読み/訓読み）", "meaning": "中国語の意味（ピンイン付き）", "example": "例文", "stroke_count": 画数}}
+]"""
+
+
+def _kanji_quiz_prompt(params):
+    return f"""以下の漢字について、読み方クイズを作ってください。
+
+対象漢字: {'、'.join(params['kanji'])}
+
+以下のJSON配列形式で回答してください（他のテキストは含めないでください）：
+[
+  {{
+    "word": "漢字を使った熟語（2-3字）",
+    "correct_reading": "正しい読み方（ひらがな）",
+    "wrong_readings": ["間違い1", "間違い2", "間違い3"],
+    "meaning_chinese": "中国語の意味（ピンイン付き）",
+    "example": "例文"
+  }}
+]
+
+各漢字について1問ずつ作成してください。間違い選択肢は正解と似ているが間違っているものにしてください。"""
+
+
+def _kanji_flashcard_prompt(params):
+    return f"""以下の漢字について、フラッシュカード用のデータを作ってください。
+
+対象漢字: {'、'.join(params['kanji'])}
+
+以下のJSON配列形式で回答してください（他のテキストは含めないでください）：
+[
+  {{
+    "word": "漢字を含む熟語",
+    "reading": "読み方（ひらがな）",
+    "meaning": "中国語の意味",
+    "example": "例文（日本語）"
+  }}
+]
+
+各漢字について1つずつ作成してください。"""
+
+
+def _kanji_writing_prompt(params):
+    return f"""以下の漢字について、書き取り練習用のデータを作ってください。
+
+対象漢字: {'、'.join(params['kanji'])}
+
+以下のJSON配列形式で回答してください（他のテキストは含めないでください）：
+[
+  {{
+    "word": "漢字（対象の1文字）",
+    "reading": "読み方（音読み・訓読み）",
+    "meaning": "中国語の意味",
+    "example": "その漢字を使った短い例文",
+    "stroke_count": 画数（数値）
+  }}
+]"""
+
+
+# ===== 生成結果の保存 =====
+
+def _new_quiz(data, params, created_by):
+    return JapaneseQuiz(
+        word=data.get('word', ''),
+        correct_reading=data.get('correct_reading', ''),
+        wrong_readings=data.get('wrong_readings', []),
+        meaning_chinese=data.get('meaning_chinese', ''),
+        example=data.get('example', ''),
+        category=params.get('category', 'general'),
+        created_by=created_by
+    )
+
+
+def _new_flashcard(data, params, created_by):
+    return JapaneseFlashcard(
+        word=data.get('word', ''),
+        reading=data.get('reading', ''),
+        meaning=data.get('meaning', ''),
+        example=data.get('example', ''),
+        created_by=created_by
+    )
+
+
+def _new_writing(data, params, created_by):
+    return JapaneseWriting(
+        word=data.get('word', '')[:2],
+        reading=data.get('reading', ''),
+        meaning=data.get('meaning', ''),
+        example=data.get('example', ''),
+        stroke_count=data.get('stroke_count'),
+        created_by=created_by
+    )
+
+
+# ジョブの種類: (プロンプト, 1件分のモデルを作る関数, 生成後のキャッシュ無効化, 課題の種類, 表示名)
+JOB_TYPES = {
+    'quiz': (_quiz_prompt, _new_quiz, invalidate_quiz_pool, 'quiz', '熟語クイズ'),
+    'flashcard': (_flashcard_prompt, _new_flashcard, lambda: invalidate_deck('flashcards'), 'flashcard',
+                  'フラッシュカード'),
+    'writing': (_writing_prompt, _new_writing, lambda: invalidate_deck('writings'), 'writing', '書き取り練習'),
+    'kanji_quiz': (_kanji_quiz_prompt, _new_quiz, invalidate_quiz_pool, 'quiz', '読み方クイズ'),
+    'kanji_flashcard': (_kanji_flashcard_prompt, _new_flashcard, lambda: invalidate_deck('flashcards'), 'flashcard',
+                        'フラッシュカード'),
+    'kanji_writing': (_kanji_writing_prompt, _new_writing, lambda: invalidate_deck('writings'), 'writing',
+                      '書き取り練習'),
+}
+
+# 課題の種類ごとの deliver_japanese_items の引数名
+DELIVERY_ARGS = {'quiz': 'quiz_ids', 'flashcard': 'flashcard_ids', 'writing': 'writing_ids'}
+
+
+def parse_items(response_text):
+    """AIの応答からJSON配列を取り出す"""
+    json_match = re.search(r'\[[\s\S]*\]', response_text or '')
+    if not json_match:
+        raise GenerationError('AIからの応答にJSONが見つかりませんでした')
+    try:
+        items = json.loads(json_match.group())
+    except ValueError:
+        raise GenerationError('AIからの応答のJSONを読み取れませんでした')
+    return [item for item in items if isinstance(item, dict)]
+
+
+def _save_items(job, items, cached=None, warning=None):
+    """生成結果を保存してコミットし、必要なら生徒に配信する
+
+    cached: AIの応答をすべてキャッシュから取得した場合はその取得元（'memory' / 'db'）
+    warning: 一部の区切りの生成に失敗した場合のメッセージ（job.error に残す）
+    """
+    _, build, invalidate, task_type, label = JOB_TYPES[job.job_type]
+    records = [build(item, job.params, job.created_by) for item in items]
+    db.session.add_all(records)
+    db.session.flush()
+
+    result = {
+        'count': len(records),
+        'item_ids': [record.id for record in records],
+        'items': items[:PREVIEW_LIMIT],
+        'delivered': 0,
+        'cached': cached,
+    }
+    job.status = 'succeeded'
+    job.result = result
+    job.error = warning
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    invalidate()
+
+    if not job.params.get('send_immediately') or not records:
+        return
+    # 即時配信（配信に失敗しても生成した問題は残す）
+    try:
+        student_ids = [uid for uid, in db.session.query(User.id).filter_by(role='student', is_chinese_student=True)]
+        if student_ids:
+            delivery = deliver_japanese_items(
+                job.created_by, student_ids, **{DELIVERY_ARGS[task_type]: result['item_ids']}
+            )
+            if delivery['total'] > 0:
+                notify_delivery(delivery, label)
+            job.result = dict(result, delivered=len(student_ids))
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job.error = '\n'.join(filter(None, [job.error, f'配信に失敗しました: {e}']))
+        db.session.commit()
+
+
+# ===== ジョブの実行 =====
+
+def _claim(job_id):
+    """ジョブを実行中にする（他のスレッド・プロセスが先に取得していれば None）"""
+    claimed = db.session.execute(
+        db.update(GenerationJob).where(
+            GenerationJob.id == job_id, GenerationJob.status == 'queued'
+        ).values(status='running', started_at=datetime.utcnow()).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return db.session.get(GenerationJob, job_id) if claimed else None
+
+
+def _chunks(params):
+    """ジョブの引数をAIの呼び出し1回分ずつに分ける（漢字を選んで作るジョブは KANJI_CHUNK_SIZE 字ずつ）"""
+    kanji = params.get('kanji')
+    if not kanji:
+        return [params]
+    return [dict(params, kanji=kanji[i:i + KANJI_CHUNK_SIZE]) for i in range(0, len(kanji), KANJI_CHUNK_SIZE)]
+
+
+def _generate_chunk(prompt, use_cache):
+    """区切り1つ分を生成（失敗したらキャッシュを使わずにやり直す）
+
+    戻り値: (生成結果, 応答の取得元)
+    """
+    for attempt in range(CHUNK_RETRIES + 1):
+        try:
+            text, cached = complete_cached(prompt, use_cache=use_cache and attempt == 0)
+            return parse_items(text), cached
+        except Exception:
+            if attempt == CHUNK_RETRIES:
+                raise
+
+
+def _generate_chunk_in_app(app, prompt, use_cache):
+    with app.app_context():
+        return _generate_chunk(prompt, use_cache)
+
+
+def _dedupe(items):
+    """区切りをまたいで同じ熟語・漢字が生成された場合は最初の1件だけ残す"""
+    seen = set()
+    unique = []
+    for item in items:
+        word = str(item.get('word', '')).strip()
+        if word and word in seen:
+            continue
+        seen.add(word)
+        unique.append(item)
+    return unique
+
+
+def _generate(chunks, use_cache):
+    """区切りごとに生成して結果をまとめる
+
+    chunks: [(区切りの引数, プロンプト), ...]
+    戻り値: (生成結果, 応答の取得元（すべてキャッシュからならその取得元）, 失敗した区切りのメッセージ)
+    """
+    if len(chunks) == 1:
+        items, cached = _generate_chunk(chunks[0][1], use_cache)
+        return _dedupe(items), cached, None
+
+    app = current_app._get_current_object()
+    futures = [_chunk_executor.submit(_generate_chunk_in_app, app, prompt, use_cache) for _, prompt in chunks]
+    wait(futures)
+    items, tiers, failed, errors = [], set(), [], []
+    for (params, _), future in zip(chunks, futures):
+        try:
+            chunk_items, cached = future.result()
+        except Exception as e:
+            failed.extend(params['kanji'])
+            errors.append(e)
+            continue
+        items.extend(chunk_items)
+        tiers.add(cached)
+
+    if not tiers:
+        # すべての区切りが失敗した
+        e = errors[0]
+        raise e if isinstance(e, GenerationError) else GenerationError(f'生成に失敗しました: {e}')
+    warning = None
+    if failed:
+        warning = (f'{len(errors)}/{len(chunks)}回の生成に失敗したため、'
+                   f'次の漢字の分は作成されませんでした: {"、".join(failed)}')
+    return _dedupe(items), tiers.pop() if len(tiers) == 1 else None, warning
+
+
+def run_job(job_id):
+    """ジョブを1件実行（アプリケーションコンテキスト内で呼ぶ）"""
+    job = _claim(job_id)
+    if job is None:
+        return None
+    build_prompt = JOB_TYPES[job.job_type][0]
+    try:
+        # AIの応答を待つ間はトランザクションを開いたままにしない
+        chunks = [(params, build_prompt(params)) for params in _chunks(job.params)]
+        # 生成結果はそのまま問題として追加されるので、同じ内容が重複しないよう
+        # キャッシュ済みの応答は「以前の生成結果を再利用する」が指定されたジョブでだけ使う
+        use_cache = bool(job.params.get('reuse_cached'))
+        db.session.commit()
+        items, cached, warning = _generate(chunks, use_cache)
+        _save_items(job, items, cached, warning)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(GenerationJob, job_id)
+        job.status = 'failed'
+        job.error = str(e) if isinstance(e, GenerationError) else f'生成に失敗しました: {e}'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    return job
+
+
+def _run_in_background(app, job_id):
+    with app.app_context():
+        try:
+            run_job(job_id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Generation Job Error: {e}")
+        finally:
+            db.session.remove()
+
+
+def _submit(job_id):
+    _executor.submit(_run_in_background, current_app._get_current_object(), job_id)
+
+
+def fail_stale_jobs(*criteria):
+    """実行中のまま STALE_AFTER を過ぎたジョブを失敗にする（コミットする）
+
+    criteria: 対象のジョブを絞り込む条件
+    戻り値: 失敗にしたジョブ数
+    """
+    now = datetime.utcnow()
+    failed = db.session.execute(
+        db.update(GenerationJob).where(
+            GenerationJob.status == 'running', GenerationJob.started_at < now - STALE_AFTER, *criteria
+        ).values(
+            status='failed', error=STALE_ERROR, finished_at=now
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return failed
+
+
+def resume_jobs():
+    """未処理のジョブを再開し、停止したプロセスで実行中のままのジョブを失敗にする
+
+    プロセスごとに1回だけ実行する（fork後のワーカーでも実行し直す）。
+    アプリの最初のリクエストで呼び出す。
+    """
+    global _resumed_pid
+    if _resumed_pid == os.getpid():
+        return
+    with _resume_lock:
+        if _resumed_pid == os.getpid():
+            return
+        fail_stale_jobs()
+        # 他のワーカーも同じジョブを登録するが、実行するのは _claim() で先に取ったワーカーだけ
+        for job_id, in db.session.query(GenerationJob.id).filter(
+            GenerationJob.status == 'queued'
+        ).order_by(GenerationJob.created_at, GenerationJob.id):
+            _submit(job_id)
+        db.session.commit()
+        _resumed_pid = os.getpid()
+
+
+def enqueue_job(job_type, params, created_by):
+    """生成ジョブを登録してバックグラウンドで開始（コミットする）"""
+    if job_type not in JOB_TYPES:
+        raise ValueError(f'不明な生成ジョブの種類です: {job_type}')
+    job = GenerationJob(job_type=job_type, params=params, created_by=created_by)
+    db.session.add(job)
+    db.session.commit()
+    _submit(job.id)
+    return job
+
+
+def expire_if_stale(job):
+    """実行中のまま STALE_AFTER を過ぎたジョブなら失敗にする（状態の問い合わせ用）"""
+    if job.status == 'running':
+        # コミットで job の属性は読み直される
+        fail_stale_jobs(GenerationJob.id == job.id)
+    return job
+
+
+def job_status(job):
+    """状態の問い合わせ用の辞書"""
+    result = job.result or {}
+    return {
+        'id': job.id,
+        'job_type': job.job_type,
+        'label': JOB_TYPES[job.job_type][4],
+        'status': job.status,
+        'count': result.get('count', 0),
+        'delivered': result.get('delivered', 0),
+        'cached': bool(result.get('cached')),
+        'items': result.get('items', []),
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def get_active_jobs(created_by, job_types=None):
+    """先生の未完了のジョブ（古い順）"""
+    fail_stale_jobs(GenerationJob.created_by == created_by)
+    query = GenerationJob.query.filter(
+        GenerationJob.created_by == created_by, GenerationJob.status.in_(ACTIVE_STATUSES)
+    )
+    if job_types:
+        query = query.filter(GenerationJob.job_type.in_(job_types))
+    return query.order_by(GenerationJob.created_at, GenerationJob.id).all()
@@ -0,0 +1,103 @@
+# 画像の派生ファイル（サムネイル）生成モジュール
+# 書き取り結果画像は原寸だと大きいため、一覧表示用に小さなグレースケール画像を作っておく。
+# 派生ファイルも元画像のSHA-256で管理し、一度作れば再生成しない
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from blob_store import parse_key, blob_path
+
+try:
+    from PIL import Image, features
+    WEBP_SUPPORTED = features.check('webp')
+except ImportError:
+    # Pillowがない環境ではサムネイルを作らず原寸画像を使う
+    Image = None
+    WEBP_SUPPORTED = False
+
+# 派生ファイルの種類ごとの最大サイズ (幅, 高さ)
+VARIANTS = {
+    'thumb': (480, 160),
+}
+
+# WebPが使えない場合のPNGの色数（グレースケールを16階調に減色）
+PNG_COLORS = 16
+
+# サムネイル生成用のバックグラウンドスレッド
+_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def derivative_format():
+    """派生ファイルの (拡張子, Content-Type)"""
+    if WEBP_SUPPORTED:
+        return 'webp', 'image/webp'
+    return 'png', 'image/png'
+
+
+def derivative_path(key, variant):
+    """派生ファイルのパス"""
+    digest = parse_key(key)[0]
+    extension = derivative_format()[0]
+    return os.path.join(current_app.config['BLOB_STORAGE_DIR'], 'derived', variant,
+                        digest[:2], digest[2:4], f'{digest}.{extension}')
+
+
+def _render_thumbnail(source_path, size):
+    """元画像を白背景のグレースケールに変換して縮小"""
+    with Image.open(source_path) as image:
+        image.load()
+        # キャンバスの透明部分は黒にならないよう白で塗る
+        if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+            image = image.convert('RGBA')
+            background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+            image = Image.alpha_composite(background, image)
+        image = image.convert('L')
+        image.thumbnail(size)
+        return image
+
+
+def generate_derivative(key, variant):
+    """派生ファイルを作成してパスを返す（作成済みならそのまま返す）
+
+    Pillowがない・元画像がない・変換に失敗した場合はNone
+    """
+    if Image is None or variant not in VARIANTS or not parse_key(key):
+        return None
+    path = derivative_path(key, variant)
+    if os.path.exists(path):
+        return path
+    source_path = blob_path(key)
+    if not os.path.exists(source_path):
+        return None
+
+    try:
+        image = _render_thumbnail(source_path, VARIANTS[variant])
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            if WEBP_SUPPORTED:
+                image.save(f, format='WEBP', quality=60, method=6)
+            else:
+                image.quantize(colors=PNG_COLORS).save(f, format='PNG', optimize=True)
+        os.replace(tmp_path, path)
+    except (OSError, ValueError) as e:
+        print(f"Thumbnail Error ({key}): {e}")
+        return None
+    return path
+
+
+def _generate_all(app, key):
+    with app.app_context():
+        for variant in VARIANTS:
+            generate_derivative(key, variant)
+
+
+def schedule_derivatives(key):
+    """派生ファイルの作成をバックグラウンドで開始"""
+    if Image is None or not parse_key(key):
+        return
+    _executor.submit(_generate_all, current_app._get_current_object(), key)
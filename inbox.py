@@ -0,0 +1,59 @@
+# 新着カウンター（inbox version）
+# 問題・連絡事項・フィードバック・日本語課題・回答が発生したときに、
+# 関係するユーザーの InboxVersion を加算する。
+# 「前回から新着があるか」は時刻範囲のCOUNTではなく、主キー1回の参照で判定できる。
+
+from datetime import datetime
+
+from models import db, User, InboxVersion
+from db_utils import insert_ignore
+
+# 種類別の件数カラム
+INBOX_FIELDS = ('problems', 'announcements', 'feedback', 'japanese', 'answers')
+
+
+def bump_inbox(user_ids, field, amount=1):
+    """ユーザーの新着カウンターを加算（コミットは呼び出し元で行う）
+
+    user_ids: 対象ユーザーID
+    field: INBOX_FIELDS のいずれか
+    amount: 種類別の件数に加算する数（version は常に+1）
+    """
+    if field not in INBOX_FIELDS:
+        raise ValueError(f'不明な新着の種類です: {field}')
+    user_ids = list(dict.fromkeys(int(uid) for uid in user_ids))
+    if not user_ids:
+        return
+
+    # カウンター行がまだないユーザーの分を作成
+    existing = {uid for uid, in db.session.query(InboxVersion.user_id).filter(
+        InboxVersion.user_id.in_(user_ids)
+    ).all()}
+    missing = [{'user_id': uid} for uid in user_ids if uid not in existing]
+    if missing:
+        db.session.execute(insert_ignore(InboxVersion.__table__), missing)
+
+    # 読み取らずにUPDATE内で加算する（同時更新でも値を取りこぼさない）
+    column = getattr(InboxVersion, field)
+    db.session.execute(
+        db.update(InboxVersion).where(InboxVersion.user_id.in_(user_ids)).values({
+            InboxVersion.version: InboxVersion.version + 1,
+            column: column + amount,
+            InboxVersion.updated_at: datetime.utcnow(),
+        }).execution_options(synchronize_session=False)
+    )
+
+
+def bump_role(role, field, amount=1):
+    """指定した役割のユーザー全員の新着カウンターを加算"""
+    user_ids = [uid for uid, in db.session.query(User.id).filter(User.role == role).all()]
+    bump_inbox(user_ids, field, amount)
+
+
+def get_inbox(user_id):
+    """新着カウンターの現在値 {'version': ..., 'problems': ..., ...}（主キー参照1回）"""
+    row = db.session.get(InboxVersion, user_id)
+    counts = {'version': row.version if row else 0}
+    for field in INBOX_FIELDS:
+        counts[field] = getattr(row, field) if row else 0
+    return counts
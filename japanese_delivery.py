@@ -0,0 +1,125 @@
+# 日本語課題の一括配信モジュール
+# (問題, 生徒) の組み合わせごとに存在チェックとINSERTを繰り返すのではなく、
+# 既存の組み合わせを1回のクエリで取得し、未配信分だけをまとめてINSERTする
+
+from itertools import product
+
+from models import db, User, JapaneseDeliveryBatch
+from db_utils import insert_ignore
+from inbox import bump_inbox
+from task_summary import ASSIGNMENT_MODELS, refresh_task_summaries
+from firebase_notifications import send_japanese_assignment_notification
+
+# 課題タイプごとの問題IDカラム名
+ITEM_COLUMNS = {
+    'quiz': 'quiz_id',
+    'flashcard': 'flashcard_id',
+    'writing': 'writing_id',
+}
+
+
+def _to_id_list(ids):
+    """フォーム値などをintのリストに変換（重複除去・順序維持）"""
+    return list(dict.fromkeys(int(i) for i in ids if str(i).strip()))
+
+
+def _assign_type(task_type, item_ids, student_ids, batch):
+    """1種類の課題を一括配信し、作成された (assignment_id, student_id) を返す"""
+    model = ASSIGNMENT_MODELS[task_type]
+    item_column = getattr(model, ITEM_COLUMNS[task_type])
+
+    # 既に配信済みの組み合わせを1回で取得
+    existing = set(db.session.query(item_column, model.student_id).filter(
+        item_column.in_(item_ids),
+        model.student_id.in_(student_ids)
+    ).all())
+
+    rows = [
+        {
+            ITEM_COLUMNS[task_type]: item_id,
+            'student_id': student_id,
+            'assigned_at': batch.created_at,
+            'batch_id': batch.id,
+            'completed': False,
+            'feedback_seen': False,
+        }
+        for item_id, student_id in product(item_ids, student_ids)
+        if (item_id, student_id) not in existing
+    ]
+    if not rows:
+        return []
+
+    # 複数行INSERT（同時配信で重複した行はユニーク制約によりスキップされる）
+    stmt = insert_ignore(model.__table__).returning(model.id, model.student_id)
+    return db.session.execute(stmt, rows).all()
+
+
+def deliver_japanese_items(teacher_id, student_ids, quiz_ids=(), flashcard_ids=(), writing_ids=()):
+    """日本語課題を生徒に一括配信してコミット
+
+    1回の配信は1つの配信バッチにまとめる。
+    戻り値: {
+        'batch_id': 配信バッチID（新規配信がなければNone）,
+        'counts': 課題タイプごとの作成件数,
+        'total': 作成件数の合計,
+        'per_student': 生徒IDごとの作成件数,
+        'recipients': 新しい課題を受け取った生徒(User)のリスト,
+    }
+    """
+    student_ids = _to_id_list(student_ids)
+    items_by_type = {
+        'quiz': _to_id_list(quiz_ids),
+        'flashcard': _to_id_list(flashcard_ids),
+        'writing': _to_id_list(writing_ids),
+    }
+
+    result = {
+        'batch_id': None,
+        'counts': {task_type: 0 for task_type in items_by_type},
+        'total': 0,
+        'per_student': {},
+        'recipients': [],
+    }
+    if not student_ids or not any(items_by_type.values()):
+        return result
+
+    batch = JapaneseDeliveryBatch.start(teacher_id)
+    summary_keys = set()
+    for task_type, item_ids in items_by_type.items():
+        if not item_ids:
+            continue
+        created = _assign_type(task_type, item_ids, student_ids, batch)
+        result['counts'][task_type] = len(created)
+        for _, student_id in created:
+            result['per_student'][student_id] = result['per_student'].get(student_id, 0) + 1
+            summary_keys.add((student_id, task_type, batch.id))
+
+    result['total'] = sum(result['counts'].values())
+    if result['total'] == 0:
+        # すべて配信済みだった場合は空のバッチを残さない
+        db.session.delete(batch)
+        db.session.commit()
+        return result
+
+    result['batch_id'] = batch.id
+    # 新着カウンターは同じ件数の生徒ごとにまとめて加算（集計表と同じコミットで保存）
+    by_count = {}
+    for student_id, count in result['per_student'].items():
+        by_count.setdefault(count, []).append(student_id)
+    for count, ids in by_count.items():
+        bump_inbox(ids, 'japanese', count)
+    refresh_task_summaries(summary_keys)
+    result['recipients'] = User.query.filter(User.id.in_(list(result['per_student']))).all()
+    return result
+
+
+def notify_delivery(result, task_type_label):
+    """配信結果に応じて生徒ごとの件数でプッシュ通知を送信"""
+    # 同じ件数の生徒をまとめて送信
+    by_count = {}
+    for user in result['recipients']:
+        by_count.setdefault(result['per_student'][user.id], []).append(user)
+    sent = 0
+    for count, users in by_count.items():
+        sent += send_japanese_assignment_notification(count, users, task_type_label)
+    return sent
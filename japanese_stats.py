@@ -0,0 +1,155 @@
+# 日本語クイズの学習統計
+# 回答数・正解数・連続正解数・最終回答日時を、生徒ごと（JapaneseStats）と
+# 生徒×熟語ごと（JapaneseWordStats）に保持し、回答を記録するたびに加算する。
+# 統計の表示は主キー1回の参照で済み、苦手な熟語の一覧も回答履歴を走査せずに作れる。
+# 集計の行がない生徒（集計の導入前から回答がある生徒）は、回答履歴から作り直す。
+
+from sqlalchemy import case
+from sqlalchemy.exc import IntegrityError
+
+from models import db, JapaneseAnswer, JapaneseStats, JapaneseWordStats
+from db_utils import insert_ignore
+
+# 苦手な熟語の一覧の件数
+WEAK_WORDS_LIMIT = 5
+
+
+def _counter_values(model, is_correct, answered_at):
+    """回答1件分の加算（UPDATE内で計算し、同時の回答でも値を取りこぼさない）"""
+    values = {
+        model.attempts: model.attempts + 1,
+        model.last_answered_at: answered_at,
+    }
+    if is_correct:
+        values[model.correct] = model.correct + 1
+        values[model.current_streak] = model.current_streak + 1
+    else:
+        values[model.current_streak] = 0
+    return values
+
+
+def _update(model, where, values):
+    return db.session.execute(
+        db.update(model).where(*where).values(values).execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def record_answer(answer):
+    """回答履歴1件を集計に加算（呼び出し元のトランザクション内で実行し、コミットは呼び出し元で行う）
+
+    answer: 追加した JapaneseAnswer（セッションに add 済みのもの）
+    """
+    db.session.flush()  # answered_at の既定値を確定させる
+    user_id = answer.user_id
+    is_correct = bool(answer.is_correct)
+
+    values = _counter_values(JapaneseStats, is_correct, answer.answered_at)
+    if is_correct:
+        next_streak = JapaneseStats.current_streak + 1
+        values[JapaneseStats.best_streak] = case(
+            (next_streak > JapaneseStats.best_streak, next_streak), else_=JapaneseStats.best_streak
+        )
+    if not _update(JapaneseStats, [JapaneseStats.user_id == user_id], values):
+        # 集計の行がない：今回の回答を含めて回答履歴から作る
+        rebuild_user_stats(user_id)
+        return
+
+    where = [JapaneseWordStats.user_id == user_id, JapaneseWordStats.word == answer.quiz_word]
+    values = _counter_values(JapaneseWordStats, is_correct, answer.answered_at)
+    if not _update(JapaneseWordStats, where, values):
+        # 初めて回答した熟語
+        db.session.execute(insert_ignore(JapaneseWordStats.__table__), [{
+            'user_id': user_id, 'word': answer.quiz_word,
+        }])
+        _update(JapaneseWordStats, where, values)
+
+
+def _compute(answers):
+    """回答履歴（古い順）から生徒の集計値と熟語ごとの集計値を計算"""
+    totals = {'attempts': 0, 'correct': 0, 'current_streak': 0, 'best_streak': 0, 'last_answered_at': None}
+    words = {}
+    for word, is_correct, answered_at in answers:
+        entry = words.setdefault(word, {
+            'word': word, 'attempts': 0, 'correct': 0, 'current_streak': 0, 'last_answered_at': None,
+        })
+        for counters in (totals, entry):
+            counters['attempts'] += 1
+            counters['last_answered_at'] = answered_at
+            if is_correct:
+                counters['correct'] += 1
+                counters['current_streak'] += 1
+            else:
+                counters['current_streak'] = 0
+        totals['best_streak'] = max(totals['best_streak'], totals['current_streak'])
+    return totals, list(words.values())
+
+
+def rebuild_user_stats(user_id):
+    """生徒の集計を回答履歴から作り直す（コミットは呼び出し元で行う）"""
+    answers = db.session.query(
+        JapaneseAnswer.quiz_word, JapaneseAnswer.is_correct, JapaneseAnswer.answered_at
+    ).filter(JapaneseAnswer.user_id == user_id).order_by(
+        JapaneseAnswer.answered_at, JapaneseAnswer.id
+    ).all()
+    totals, words = _compute(answers)
+
+    db.session.execute(db.delete(JapaneseWordStats).where(JapaneseWordStats.user_id == user_id))
+    db.session.execute(db.delete(JapaneseStats).where(JapaneseStats.user_id == user_id))
+    db.session.execute(db.insert(JapaneseStats), [dict(totals, user_id=user_id)])
+    if words:
+        db.session.execute(db.insert(JapaneseWordStats), [dict(entry, user_id=user_id) for entry in words])
+
+
+def rebuild_japanese_stats():
+    """全生徒の集計を回答履歴から作り直す
+
+    戻り値: 集計した生徒数
+    """
+    db.session.execute(db.delete(JapaneseWordStats))
+    db.session.execute(db.delete(JapaneseStats))
+    user_ids = [uid for uid, in db.session.query(JapaneseAnswer.user_id).distinct().order_by(JapaneseAnswer.user_id)]
+    for user_id in user_ids:
+        rebuild_user_stats(user_id)
+        db.session.commit()
+    db.session.commit()
+    return len(user_ids)
+
+
+def get_japanese_stats(user_id):
+    """日本語学習の統計を取得（主キー1回の参照。集計の行がなければ回答履歴から作る）"""
+    row = db.session.get(JapaneseStats, user_id)
+    if row is None and db.session.query(JapaneseAnswer.id).filter_by(user_id=user_id).first():
+        try:
+            rebuild_user_stats(user_id)
+            db.session.commit()
+        except IntegrityError:
+            # 同時に別のリクエストが作成した場合はそちらを使う
+            db.session.rollback()
+        row = db.session.get(JapaneseStats, user_id)
+
+    total = row.attempts if row else 0
+    correct = row.correct if row else 0
+    return {
+        'total': total,
+        'correct': correct,
+        'accuracy': int(correct / total * 100) if total > 0 else 0,
+        'current_streak': row.current_streak if row else 0,
+        'best_streak': row.best_streak if row else 0,
+        'last_answered_at': row.last_answered_at if row else None,
+    }
+
+
+def get_weak_words(user_id, limit=WEAK_WORDS_LIMIT):
+    """間違えたことのある熟語を正答率の低い順に取得"""
+    accuracy = JapaneseWordStats.correct * 1.0 / JapaneseWordStats.attempts
+    rows = JapaneseWordStats.query.filter(
+        JapaneseWordStats.user_id == user_id,
+        JapaneseWordStats.correct < JapaneseWordStats.attempts
+    ).order_by(accuracy, JapaneseWordStats.attempts.desc(), JapaneseWordStats.word).limit(limit).all()
+    return [{
+        'word': row.word,
+        'attempts': row.attempts,
+        'correct': row.correct,
+        'accuracy': int(row.correct / row.attempts * 100),
+        'last_answered_at': row.last_answered_at,
+    } for row in rows]
@@ -0,0 +1,154 @@
+# 先生用の一覧ページ（問題・連絡事項・日本語問題）の読み込み
+# 一覧に表示するカラムだけを読み（本文HTMLなどの大きいTextカラムは読まない）、
+# 作成日時の新しい順に keyset ページングで1ページずつ取得する。
+# 最初のページはページ描画時に、続きは「もっと見る」で JSON API から読み込む。
+
+import html
+import re
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import load_only, joinedload
+
+from models import (
+    db, Problem, Announcement, AnnouncementReaction, JapaneseQuiz, JapaneseFlashcard, JapaneseWriting,
+    problem_assignments, announcement_recipients
+)
+from pagination import encode_cursor, decode_cursor, keyset_after
+
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+# 問題の本文プレビュー用に先頭だけ読み込む文字数（HTMLタグを含む）
+PREVIEW_SOURCE_LENGTH = 400
+
+_TAG = re.compile(r'<[^>]*>')
+_UNCLOSED_TAG = re.compile(r'<[^>]*$')
+_SPACES = re.compile(r'\s+')
+
+
+def html_preview(fragment):
+    """HTMLの先頭部分からプレビュー用のプレーンテキストを作成（途中で切れたタグも除く）"""
+    if not fragment:
+        return ''
+    text = _UNCLOSED_TAG.sub('', _TAG.sub(' ', fragment))
+    return _SPACES.sub(' ', html.unescape(text)).strip()
+
+
+def _problem_rows(query_rows):
+    return [{
+        'id': row.id,
+        'title': row.title,
+        'problem_type': row.problem_type,
+        'created_at': row.created_at,
+        'preview': html_preview(row.preview_source),
+        'assigned_count': row.assigned_count,
+    } for row in query_rows]
+
+
+def _problems_query():
+    assigned_count = select(func.count()).select_from(problem_assignments).where(
+        problem_assignments.c.problem_id == Problem.id
+    ).correlate(Problem).scalar_subquery()
+    return db.session.query(
+        Problem.id, Problem.title, Problem.problem_type, Problem.created_at,
+        func.substr(Problem.content, 1, PREVIEW_SOURCE_LENGTH).label('preview_source'),
+        assigned_count.label('assigned_count'),
+    )
+
+
+def _announcements_query():
+    return Announcement.query
+
+
+def _announcement_rows(announcements):
+    """配信先の人数とリアクションは、ページ内の連絡事項分をそれぞれ1回のクエリで読む"""
+    ids = [a.id for a in announcements]
+    counts = {}
+    reactions = {}
+    if ids:
+        counts = dict(db.session.query(
+            announcement_recipients.c.announcement_id, func.count()
+        ).filter(
+            announcement_recipients.c.announcement_id.in_(ids)
+        ).group_by(announcement_recipients.c.announcement_id).all())
+        for reaction in AnnouncementReaction.query.options(joinedload(AnnouncementReaction.student)).filter(
+            AnnouncementReaction.announcement_id.in_(ids)
+        ).order_by(AnnouncementReaction.id):
+            reactions.setdefault(reaction.announcement_id, []).append({
+                'reaction_type': reaction.reaction_type,
+                'student_name': reaction.student.display_name,
+            })
+    return [{
+        'id': a.id,
+        'title': a.title,
+        'content': a.content,
+        'is_global': a.is_global,
+        'is_active': a.is_active,
+        'created_at': a.created_at,
+        'recipient_count': counts.get(a.id, 0),
+        'reactions': reactions.get(a.id, []),
+    } for a in announcements]
+
+
+def _entity_rows(columns):
+    def serialize(rows):
+        return [{column: getattr(row, column) for column in columns} for row in rows]
+    return serialize
+
+
+QUIZ_COLUMNS = ('id', 'word', 'correct_reading', 'meaning_chinese', 'created_at')
+FLASHCARD_COLUMNS = ('id', 'word', 'reading', 'meaning', 'example', 'created_at')
+WRITING_COLUMNS = ('id', 'word', 'reading', 'meaning', 'example', 'stroke_count', 'created_at')
+
+
+def _entity_query(model, columns):
+    return model.query.options(load_only(*(getattr(model, c) for c in columns)))
+
+
+# 一覧の種類: (モデル, クエリを作る関数, 1ページ分の行を辞書に変換する関数)
+LISTINGS = {
+    'problems': (Problem, _problems_query, _problem_rows),
+    'announcements': (Announcement, _announcements_query, _announcement_rows),
+    'quizzes': (JapaneseQuiz, lambda: _entity_query(JapaneseQuiz, QUIZ_COLUMNS), _entity_rows(QUIZ_COLUMNS)),
+    'flashcards': (JapaneseFlashcard, lambda: _entity_query(JapaneseFlashcard, FLASHCARD_COLUMNS),
+                   _entity_rows(FLASHCARD_COLUMNS)),
+    'writings': (JapaneseWriting, lambda: _entity_query(JapaneseWriting, WRITING_COLUMNS),
+                 _entity_rows(WRITING_COLUMNS)),
+}
+
+
+def _decode(cursor):
+    created_at, row_id = decode_cursor(cursor, 2)
+    try:
+        return [datetime.fromisoformat(created_at), int(row_id)]
+    except (TypeError, ValueError):
+        raise ValueError('不正なカーソルです')
+
+
+def get_page(name, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """一覧の1ページを取得
+
+    cursor: 前ページの next_cursor（最初のページはNone。不正な場合は ValueError）
+    戻り値: {'items': [...], 'next_cursor': 次ページのカーソル（最後のページはNone）}
+    """
+    model, build_query, serialize = LISTINGS[name]
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    query = build_query()
+    if cursor:
+        order = [(model.created_at, True), (model.id, True)]
+        query = query.filter(keyset_after(order, _decode(cursor)))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = serialize(rows)
+    next_cursor = encode_cursor([rows[-1].created_at.isoformat(), rows[-1].id]) if has_more else None
+    return {'items': items, 'next_cursor': next_cursor}
+
+
+def count_items(name):
+    """一覧の総件数（見出しの件数表示用）"""
+    model = LISTINGS[name][0]
+    return db.session.query(func.count(model.id)).scalar()
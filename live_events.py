@@ -0,0 +1,286 @@
+# リアルタイム更新（Server-Sent Events）
+# 問題・連絡事項・フィードバック・回答の作成時にイベントを発行し、
+# 接続中のブラウザへ /api/events のストリームで即座に届ける。
+#
+# 同じプロセス内の購読者にはメモリ上のハブから直接配信し、
+# 別のgunicornワーカーや定期実行スクリプトが発行したイベントは
+# live_events テーブルを短い間隔で確認して取り込む（共有DBによるフォールバック）。
+#
+# ストリーム1本がgunicornのスレッドを1本使い続けるため、同時接続数はプロセスごとに
+# LIVE_EVENTS_MAX_STREAMS 本までに制限する。上限を超えた接続は 503 で断り、
+# ブラウザ側（live_events.js）は /api/check-new のポーリングに切り替える。
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, LiveEvent
+
+# ストリーム1本の最大接続時間（秒）。切れたらブラウザが自動で再接続する
+STREAM_LIFETIME = 55
+# 同時接続数の上限の既定値（設定 LIVE_EVENTS_MAX_STREAMS で変更できる）
+DEFAULT_MAX_STREAMS = 4
+# 何も送らない時間がこれを超えたらコメント行を送って接続を維持する（秒）
+HEARTBEAT_INTERVAL = 15
+# ブラウザの再接続待ち時間（ミリ秒）
+RETRY_MS = 3000
+# 共有DBを確認する間隔（秒）
+POLL_INTERVAL = 2
+# 他プロセスのコミット遅れを拾うため、確認済みIDより少し前から読み直す件数
+POLL_LOOKBACK = 50
+# メモリ上に保持するイベント数
+BUFFER_SIZE = 500
+# 古いイベントを削除するまでの時間
+EVENT_RETENTION = timedelta(days=1)
+# 古いイベントを削除する間隔（秒）
+PURGE_INTERVAL = 600
+
+
+class EventHub:
+    """プロセス内のイベント配信ハブ
+
+    イベントには到着順の連番（seq）を振ってリングバッファに保持し、
+    購読者は「最後に受け取ったseq以降」を待つ。DBのIDで重複を除くので、
+    自プロセスで発行したイベントをDB確認で再度取り込んでも二重に配信しない。
+    """
+
+    def __init__(self, size=BUFFER_SIZE):
+        self._condition = threading.Condition()
+        self._buffer = deque(maxlen=size)
+        self._seen_ids = set()
+        self._seq = 0
+        self.subscribers = 0
+
+    @property
+    def last_seq(self):
+        with self._condition:
+            return self._seq
+
+    def push(self, event):
+        """イベントを追加して待機中の購読者を起こす（既出のIDなら無視）"""
+        with self._condition:
+            if event['id'] in self._seen_ids:
+                return False
+            if len(self._buffer) == self._buffer.maxlen:
+                self._seen_ids.discard(self._buffer[0][1]['id'])
+            self._seq += 1
+            self._buffer.append((self._seq, event))
+            self._seen_ids.add(event['id'])
+            self._condition.notify_all()
+            return True
+
+    def wait(self, after_seq, timeout):
+        """after_seq より新しいイベントを待って返す: (最新seq, [event, ...])"""
+        with self._condition:
+            if self._seq <= after_seq:
+                self._condition.wait(timeout)
+            events = [event for seq, event in self._buffer if seq > after_seq]
+            return self._seq, events
+
+    def try_subscribe(self, limit):
+        """購読者数が limit 未満なら購読者として登録して True を返す"""
+        with self._condition:
+            if self.subscribers >= limit:
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._condition:
+            self.subscribers -= 1
+
+
+hub = EventHub()
+
+_poller_lock = threading.Lock()
+_poller_pid = None
+
+
+def _to_dict(row):
+    return {
+        'id': row.id,
+        'type': row.event_type,
+        'user_id': row.target_user_id,
+        'role': row.target_role,
+        'data': json.loads(row.payload) if row.payload else {},
+    }
+
+
+def _poll_shared_events(app):
+    """他プロセスが発行したイベントをDBから取り込む（購読者がいる間だけ確認）"""
+    with app.app_context():
+        last_id = db.session.query(db.func.max(LiveEvent.id)).scalar() or 0
+        last_purge = 0
+        db.session.remove()
+    while True:
+        time.sleep(POLL_INTERVAL)
+        if hub.subscribers <= 0:
+            continue
+        with app.app_context():
+            try:
+                rows = LiveEvent.query.filter(
+                    LiveEvent.id > last_id - POLL_LOOKBACK
+                ).order_by(LiveEvent.id).all()
+                for row in rows:
+                    hub.push(_to_dict(row))
+                    last_id = max(last_id, row.id)
+
+                if time.time() - last_purge > PURGE_INTERVAL:
+                    LiveEvent.query.filter(
+                        LiveEvent.created_at < datetime.utcnow() - EVENT_RETENTION
+                    ).delete(synchronize_session=False)
+                    db.session.commit()
+                    last_purge = time.time()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Live Event Poll Error: {e}")
+            finally:
+                db.session.remove()
+
+
+def _ensure_poller():
+    """DB確認スレッドをプロセスごとに1本だけ起動（fork後のワーカーでも起動し直す）"""
+    global _poller_pid
+    if _poller_pid == os.getpid():
+        return
+    with _poller_lock:
+        if _poller_pid == os.getpid():
+            return
+        app = current_app._get_current_object()
+        threading.Thread(target=_poll_shared_events, args=(app,), daemon=True).start()
+        _poller_pid = os.getpid()
+
+
+def publish(event_type, data, user_ids=(), role=None):
+    """イベントを発行（DBに保存してから、このプロセスの購読者へ配信）
+
+    user_ids: 宛先ユーザーID（個別配信）
+    role: 'teacher' / 'student' を指定するとその役割の全員へ配信
+    配信は補助的な機能なので、失敗しても呼び出し元の処理は止めない
+    """
+    payload = json.dumps(data, ensure_ascii=False)
+    targets = [{'target_user_id': uid, 'target_role': None} for uid in dict.fromkeys(user_ids)]
+    if role:
+        targets.append({'target_user_id': None, 'target_role': role})
+    if not targets:
+        return
+
+    try:
+        rows = [LiveEvent(event_type=event_type, payload=payload, **target) for target in targets]
+        db.session.add_all(rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Live Event Publish Error: {e}")
+        return
+
+    for row in rows:
+        hub.push(_to_dict(row))
+
+
+def _is_for(event, user_id, role):
+    return event['user_id'] == user_id or (event['user_id'] is None and event['role'] == role)
+
+
+def _format(event):
+    data = dict(event['data'], type=event['type'])
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def missed_events(user_id, role, last_event_id):
+    """再接続時、Last-Event-ID より後に発行された自分宛てのイベント"""
+    rows = LiveEvent.query.filter(
+        LiveEvent.id > last_event_id,
+        db.or_(LiveEvent.target_user_id == user_id,
+               db.and_(LiveEvent.target_user_id.is_(None), LiveEvent.target_role == role))
+    ).order_by(LiveEvent.id).limit(BUFFER_SIZE).all()
+    return [_to_dict(row) for row in rows]
+
+
+def stream(user_id, role, last_event_id=None):
+    """SSEストリームのジェネレーターを作成
+
+    取りこぼし分の読み込みはリクエスト処理中に済ませ、
+    ジェネレーター内ではDBに触れない（ハブを待つだけ）
+    同時接続数が上限に達している場合は None を返す。
+    接続枠は確保済みなので、レスポンスを閉じるときに release_stream() を呼ぶこと
+    （ジェネレーターが一度も読まれずに閉じられても枠が戻るように）
+    """
+    _ensure_poller()
+    start_seq = hub.last_seq
+    backlog = missed_events(user_id, role, last_event_id) if last_event_id is not None else []
+    sent_ids = {event['id'] for event in backlog}
+    if not hub.try_subscribe(current_app.config.get('LIVE_EVENTS_MAX_STREAMS', DEFAULT_MAX_STREAMS)):
+        return None
+
+    def generate():
+        yield f"retry: {RETRY_MS}\n\n"
+        for event in backlog:
+            yield _format(event)
+
+        seq = start_seq
+        deadline = time.monotonic() + STREAM_LIFETIME
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            seq, events = hub.wait(seq, timeout=min(HEARTBEAT_INTERVAL, max(deadline - time.monotonic(), 0)))
+            for event in events:
+                if event['id'] in sent_ids or not _is_for(event, user_id, role):
+                    continue
+                sent_ids.add(event['id'])
+                last_sent = time.monotonic()
+                yield _format(event)
+            if time.monotonic() - last_sent >= HEARTBEAT_INTERVAL:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+
+    return generate()
+
+
+def release_stream():
+    """stream() で確保した接続枠を返す"""
+    hub.unsubscribe()
+
+
+# ===== 発行ヘルパー（通知の文言は firebase_notifications.py に合わせる） =====
+
+def publish_problem(problem, student_ids):
+    publish('problem', {
+        'title': '📝 新しい問題が届きました',
+        'body': problem.title,
+        'url': f'/problem/{problem.id}',
+    }, user_ids=student_ids)
+
+
+def publish_announcement(announcement, student_ids=None):
+    """連絡事項を配信（student_ids が None なら生徒全員）"""
+    from plain_text import announcement_text
+    data = {
+        'title': f'📢 {announcement.title}',
+        'body': announcement_text(announcement)[:100],
+        'url': '/dashboard',
+    }
+    if student_ids is None:
+        publish('announcement', data, role='student')
+    else:
+        publish('announcement', data, user_ids=student_ids)
+
+
+def publish_feedback(student_id, title, url):
+    publish('feedback', {
+        'title': '📬 先生からフィードバックが届きました',
+        'body': title,
+        'url': url,
+    }, user_ids=[student_id])
+
+
+def publish_answer(answer, student_name, problem_title):
+    publish('answer', {
+        'title': f'✏️ {student_name}さんが回答しました',
+        'body': problem_title,
+        'url': f'/answer/{answer.id}',
+    }, role='teacher')
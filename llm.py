@@ -0,0 +1,291 @@
+# AI（Groq）の呼び出し
+# 問題生成・AIチューターなどで使うクライアントとモデルの設定をまとめる。
+#
+# 同じ条件の生成や同じ質問は何度も送られるため、応答を2段のキャッシュで再利用する。
+#   1. プロセス内のLRU（件数の上限あり）
+#   2. llm_cache テーブル（ワーカー・再起動をまたいで共有。件数の上限を超えたら使われていないものから削除）
+# キーはモデル・正規化したプロンプト・パラメータのハッシュで、どちらも有効期間を過ぎたら使わない。
+# 新しい応答が欲しいときは use_cache=False で呼ぶ（結果はキャッシュに保存し直す）。
+# stream_cached() は応答を生成されたそばから返し、最後まで受け取った応答を同じキャッシュに保存する。
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from groq import Groq
+
+from models import db, LLMCacheEntry
+from db_utils import insert_ignore
+
+# 使用するモデル
+MODEL = "llama-3.3-70b-versatile"
+
+# キャッシュ設定の既定値（設定 LLM_CACHE_* で変更できる）
+DEFAULT_CACHE_TTL = 30 * 24 * 3600  # 有効期間（秒）
+DEFAULT_MEMORY_SIZE = 256  # プロセス内に保持する件数
+DEFAULT_MAX_ROWS = 5000  # llm_cache テーブルに保持する件数
+# この回数の保存ごとに llm_cache の期限切れ・上限超過の行を削除する
+PRUNE_EVERY = 50
+
+_SPACES = re.compile(r'[ \t　]+')
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+_lock = threading.Lock()
+_client = None
+_memory = OrderedDict()  # キー -> (有効期限のUNIX時刻, 応答テキスト)
+_writes = 0
+_counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'bypassed': 0, 'saved_ms': 0, 'saved_tokens': 0}
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def _groq():
+    """Groqクライアント（APIキーは環境変数 GROQ_API_KEY で指定する。最初の呼び出し時に作成）"""
+    global _client
+    if _client is None:
+        api_key = os.environ.get('GROQ_API_KEY')
+        if not api_key:
+            raise RuntimeError('環境変数 GROQ_API_KEY が設定されていません')
+        _client = Groq(api_key=api_key)
+    return _client
+
+
+def normalize_prompt(prompt):
+    """キャッシュのキー用にプロンプトを正規化（全角・半角、行末や連続する空白・空行の違いをそろえる）"""
+    text = unicodedata.normalize('NFKC', prompt or '').replace('\r\n', '\n')
+    lines = [_SPACES.sub(' ', line).strip() for line in text.split('\n')]
+    return _BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()
+
+
+def cache_key(prompt, model=MODEL, **params):
+    payload = json.dumps({'model': model, 'prompt': normalize_prompt(prompt), 'params': params},
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _count(**amounts):
+    with _lock:
+        for name, amount in amounts.items():
+            _counters[name] += amount
+
+
+# ===== 1段目: プロセス内のLRU =====
+
+def _memory_get(key):
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+        return entry[1]
+
+
+def _memory_put(key, text, expires_at):
+    size = _config('LLM_CACHE_MEMORY_SIZE', DEFAULT_MEMORY_SIZE)
+    if size <= 0:
+        return
+    with _lock:
+        _memory[key] = (expires_at, text)
+        _memory.move_to_end(key)
+        while len(_memory) > size:
+            _memory.popitem(last=False)
+
+
+# ===== 2段目: llm_cache テーブル =====
+# 呼び出し元のセッション（コミット前の変更）に影響しないよう、別の接続・トランザクションで読み書きする
+
+def _db_get(key):
+    table = LLMCacheEntry.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        row = conn.execute(
+            db.select(table.c.response, table.c.expires_at, table.c.total_tokens, table.c.elapsed_ms)
+            .where(table.c.key == key, table.c.expires_at > now)
+        ).first()
+        if row is None:
+            return None
+        conn.execute(
+            db.update(table).where(table.c.key == key).values(hits=table.c.hits + 1, last_used_at=now)
+        )
+    return row
+
+
+def _db_put(key, model, text, total_tokens, elapsed_ms, expires_at):
+    global _writes
+    table = LLMCacheEntry.__table__
+    now = datetime.utcnow()
+    values = {
+        'model': model, 'response': text, 'total_tokens': total_tokens, 'elapsed_ms': elapsed_ms,
+        'hits': 0, 'created_at': now, 'expires_at': expires_at, 'last_used_at': now,
+    }
+    with db.engine.begin() as conn:
+        # 新しい応答で置き換える（use_cache=False の呼び出し・期限切れの行）
+        if conn.execute(db.update(table).where(table.c.key == key).values(values)).rowcount == 0:
+            # 同じキーを同時に保存した場合は先に保存された行を使う
+            conn.execute(insert_ignore(table).values(key=key, **values))
+    with _lock:
+        _writes += 1
+        prune = _writes % PRUNE_EVERY == 0
+    if prune:
+        prune_cache()
+
+
+def prune_cache():
+    """期限切れの行と、件数の上限を超えた使われていない行を削除
+
+    戻り値: 削除した行数
+    """
+    table = LLMCacheEntry.__table__
+    max_rows = _config('LLM_CACHE_MAX_ROWS', DEFAULT_MAX_ROWS)
+    with db.engine.begin() as conn:
+        deleted = conn.execute(db.delete(table).where(table.c.expires_at <= datetime.utcnow())).rowcount
+        keep = db.select(table.c.key).order_by(table.c.last_used_at.desc()).limit(max_rows).scalar_subquery()
+        deleted += conn.execute(db.delete(table).where(table.c.key.not_in(keep))).rowcount
+    return deleted
+
+
+# ===== 呼び出し =====
+
+def _call(prompt, model, max_tokens, temperature):
+    started = time.monotonic()
+    completion = _groq().chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature
+    )
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    usage = getattr(completion, 'usage', None)
+    return completion.choices[0].message.content, getattr(usage, 'total_tokens', None), elapsed_ms
+
+
+def _lookup(key):
+    """キャッシュから応答を探す
+
+    戻り値: (応答テキスト, 取得元 'memory' / 'db')。見つからなければ (None, None)
+    """
+    text = _memory_get(key)
+    if text is not None:
+        _count(memory_hits=1)
+        return text, 'memory'
+    row = _db_get(key)
+    if row is not None:
+        _count(db_hits=1, saved_ms=row.elapsed_ms or 0, saved_tokens=row.total_tokens or 0)
+        remaining = (row.expires_at - datetime.utcnow()).total_seconds()
+        _memory_put(key, row.response, time.time() + remaining)
+        return row.response, 'db'
+    return None, None
+
+
+def _store(key, model, text, total_tokens, elapsed_ms, use_cache):
+    """AIを呼び出して得た応答を記録し、キャッシュに保存する
+
+    応答はすでに得られているので、保存に失敗しても呼び出し元には例外を伝えない
+    （_db_put の接続は engine.begin() を抜けるときにロールバックされる）
+    """
+    _count(**({'misses': 1} if use_cache else {'bypassed': 1}))
+    if _config('LLM_CACHE_ENABLED', True) and text:
+        ttl = _config('LLM_CACHE_TTL', DEFAULT_CACHE_TTL)
+        _memory_put(key, text, time.time() + ttl)
+        try:
+            _db_put(key, model, text, total_tokens, elapsed_ms, datetime.utcnow() + timedelta(seconds=ttl))
+        except Exception as e:
+            print(f"LLM Cache Store Error: {e}")
+
+
+def complete_cached(prompt, max_tokens=2000, temperature=0.8, use_cache=True, model=MODEL):
+    """プロンプト1つに対するAIの応答テキストをキャッシュ経由で取得
+
+    use_cache: False ならキャッシュを読まずにAIを呼び出す（応答はキャッシュに保存し直す）
+    戻り値: (応答テキスト, 応答の取得元 'memory' / 'db' / None（AIを呼び出した）)
+    """
+    key = cache_key(prompt, model=model, max_tokens=max_tokens, temperature=temperature)
+    if use_cache and _config('LLM_CACHE_ENABLED', True):
+        text, tier = _lookup(key)
+        if text is not None:
+            return text, tier
+
+    text, total_tokens, elapsed_ms = _call(prompt, model, max_tokens, temperature)
+    _store(key, model, text, total_tokens, elapsed_ms, use_cache)
+    return text, None
+
+
+def stream_cached(prompt, max_tokens=2000, temperature=0.8, use_cache=True, model=MODEL):
+    """プロンプト1つに対するAIの応答テキストを、生成されたそばから少しずつ返すジェネレータ
+
+    キャッシュにあれば応答全体を1回で返す。最後まで受け取った応答は complete() と同じキーで保存する
+    （途中で接続が切れた場合は保存しない）。
+    """
+    key = cache_key(prompt, model=model, max_tokens=max_tokens, temperature=temperature)
+    if use_cache and _config('LLM_CACHE_ENABLED', True):
+        text, _ = _lookup(key)
+        if text is not None:
+            yield text
+            return
+
+    started = time.monotonic()
+    stream = _groq().chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True
+    )
+    parts = []
+    total_tokens = None
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            yield delta
+        # 使用トークン数は最後のチャンクに付く
+        usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+        if usage is not None:
+            total_tokens = usage.total_tokens
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    _store(key, model, ''.join(parts), total_tokens, elapsed_ms, use_cache)
+
+
+def complete(prompt, max_tokens=2000, temperature=0.8, use_cache=True):
+    """プロンプト1つに対するAIの応答テキストを取得（キャッシュ経由）"""
+    return complete_cached(prompt, max_tokens=max_tokens, temperature=temperature, use_cache=use_cache)[0]
+
+
+def get_cache_stats():
+    """キャッシュの利用状況（このプロセスのヒット数と、llm_cache テーブル全体の集計）"""
+    with _lock:
+        counters = dict(_counters)
+        memory_entries = len(_memory)
+    lookups = counters['memory_hits'] + counters['db_hits'] + counters['misses']
+    table = LLMCacheEntry.__table__
+    with db.engine.connect() as conn:
+        rows, db_hits, saved_ms, saved_tokens = conn.execute(db.select(
+            db.func.count(), db.func.coalesce(db.func.sum(table.c.hits), 0),
+            db.func.coalesce(db.func.sum(table.c.hits * table.c.elapsed_ms), 0),
+            db.func.coalesce(db.func.sum(table.c.hits * table.c.total_tokens), 0),
+        )).one()
+    return {
+        'process': dict(
+            counters,
+            memory_entries=memory_entries,
+            hit_rate=round((counters['memory_hits'] + counters['db_hits']) / lookups, 3) if lookups else None,
+        ),
+        'database': {
+            'entries': rows,
+            'hits': db_hits,
+            'saved_ms': saved_ms,
+            'saved_tokens': saved_tokens,
+        },
+    }
@@ -0,0 +1,47 @@
+"""Add JapaneseTaskSummary model
+
+Revision ID: 1362d8f8c166
+Revises: 04f6311a912a
+Create Date: 2026-10-18 10:12:41.218304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1362d8f8c166'
+down_revision = '04f6311a912a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # アプリ起動時の db.create_all() で作成済みの場合はスキップ
+    if sa.inspect(op.get_bind()).has_table('japanese_task_summaries'):
+        return
+    op.create_table('japanese_task_summaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('task_type', sa.String(length=20), nullable=False),
+    sa.Column('group_key', sa.String(length=32), nullable=False),
+    sa.Column('group_date', sa.DateTime(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('completed_count', sa.Integer(), nullable=False),
+    sa.Column('has_feedback', sa.Boolean(), nullable=True),
+    sa.Column('has_unseen_feedback', sa.Boolean(), nullable=True),
+    sa.Column('next_assignment_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['student_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('student_id', 'task_type', 'group_key')
+    )
+    with op.batch_alter_table('japanese_task_summaries', schema=None) as batch_op:
+        batch_op.create_index('ix_japanese_task_summaries_student_date', ['student_id', 'group_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('japanese_task_summaries', schema=None) as batch_op:
+        batch_op.drop_index('ix_japanese_task_summaries_student_date')
+
+    op.drop_table('japanese_task_summaries')
@@ -0,0 +1,99 @@
+"""Add unique (item, student) constraints on Japanese assignments
+
+Revision ID: 1ecb2e90d97d
+Revises: 9802257e0ead
+Create Date: 2026-10-18 11:48:09.304117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1ecb2e90d97d'
+down_revision = '9802257e0ead'
+branch_labels = None
+depends_on = None
+
+
+# (テーブル名, 問題IDカラム, 制約名)
+UNIQUE_PAIRS = [
+    ('japanese_assignments', 'quiz_id', 'uq_japanese_assignments_quiz_student'),
+    ('japanese_flashcard_assignments', 'flashcard_id', 'uq_japanese_flashcard_assignments_flashcard_student'),
+    ('japanese_writing_assignments', 'writing_id', 'uq_japanese_writing_assignments_writing_student'),
+]
+
+
+def _backup_rows(table_name, ids):
+    """削除する行を <テーブル名>_duplicates_backup に写す（ダウングレードでも削除しない）"""
+    conn = op.get_bind()
+    backup = f'{table_name}_duplicates_backup'
+    if not sa.inspect(conn).has_table(backup):
+        conn.execute(sa.text(f'CREATE TABLE {backup} AS SELECT * FROM {table_name} WHERE 1 = 0'))
+    insert = sa.text(f'INSERT INTO {backup} SELECT * FROM {table_name} WHERE id IN :ids').bindparams(
+        sa.bindparam('ids', expanding=True))
+    for i in range(0, len(ids), 500):
+        conn.execute(insert, {'ids': ids[i:i + 500]})
+    return backup
+
+
+def _remove_duplicates(table_name, item_column):
+    """同じ (問題, 生徒) の重複配信を1件にまとめる
+
+    残す行: フィードバックのある行 → 完了済みの行 → IDが小さい（最初に配信した）行 の順に優先する。
+    フィードバックや完了の記録がある行が、記録のない行の代わりに削除されることはない。
+    削除する行は <テーブル名>_duplicates_backup に写してから削除し、IDを出力する。
+    """
+    conn = op.get_bind()
+    t = sa.table(table_name,
+        sa.column('id', sa.Integer),
+        sa.column(item_column, sa.Integer),
+        sa.column('student_id', sa.Integer),
+        sa.column('completed', sa.Boolean),
+        sa.column('teacher_feedback', sa.Text))
+    rows = conn.execute(sa.select(
+        t.c.id, t.c[item_column], t.c.student_id, t.c.completed, t.c.teacher_feedback
+    ).order_by(t.c.id)).all()
+
+    groups = {}
+    for row in rows:
+        groups.setdefault((row[1], row[2]), []).append(row)
+
+    duplicates = []
+    for (item_id, student_id), group in groups.items():
+        if len(group) < 2:
+            continue
+        keep = min(group, key=lambda row: (not row[4], not row[3], row[0]))
+        dropped = [row for row in group if row[0] != keep[0]]
+        duplicates.extend(row[0] for row in dropped)
+        # 記録のある行を削除する場合は内容を確認できるよう印を付ける
+        details = ', '.join(
+            f"{row[0]}{' (completed)' if row[3] else ''}{' (feedback)' if row[4] else ''}" for row in dropped
+        )
+        print(f'  {table_name}: {item_column}={item_id} student_id={student_id} '
+              f'keep id={keep[0]}, delete id={details}')
+
+    if not duplicates:
+        return
+    backup = _backup_rows(table_name, duplicates)
+    for i in range(0, len(duplicates), 500):
+        conn.execute(t.delete().where(t.c.id.in_(duplicates[i:i + 500])))
+    print(f'  removed {len(duplicates)} duplicate rows from {table_name} (copied to {backup})')
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table_name, item_column, constraint_name in UNIQUE_PAIRS:
+        existing = [c['name'] for c in inspector.get_unique_constraints(table_name)]
+        if constraint_name in existing:
+            # db.create_all() で作成済み
+            continue
+        _remove_duplicates(table_name, item_column)
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.create_unique_constraint(constraint_name, [item_column, 'student_id'])
+
+
+def downgrade():
+    for table_name, item_column, constraint_name in UNIQUE_PAIRS:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_constraint(constraint_name, type_='unique')
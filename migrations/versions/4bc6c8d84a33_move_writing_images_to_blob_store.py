@@ -0,0 +1,125 @@
+"""Move writing result images from Base64 column to the blob store
+
+Revision ID: 4bc6c8d84a33
+Revises: 574bc2b2ed0b
+Create Date: 2026-10-18 13:05:12.640317
+
+"""
+import base64
+import os
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+from blob_store import save_data_url, parse_key, blob_path, verify_blob
+
+
+# revision identifiers, used by Alembic.
+revision = '4bc6c8d84a33'
+down_revision = '574bc2b2ed0b'
+branch_labels = None
+depends_on = None
+
+
+# 1回に読み込む行数（Base64画像は1件数百KBになるため小さめ）
+BATCH_SIZE = 50
+
+writings = sa.table('japanese_writing_assignments',
+    sa.column('id', sa.Integer),
+    sa.column('result_image', sa.Text),
+    sa.column('result_image_key', sa.String))
+
+
+def _move_images_to_blob_store():
+    """Base64画像をBLOBストアに書き出し、行にはキーのみ残す
+
+    Base64の列は、書き出したファイルを読み直して内容（SHA-256）を確認できた行だけ
+    BATCH_SIZE 件ずつまとめて消す。BLOB_KEEP_DB_COPY が有効な環境では消さない。
+    """
+    conn = op.get_bind()
+    keep_db_copy = current_app.config.get('BLOB_KEEP_DB_COPY', False)
+    set_key = writings.update().where(writings.c.id == sa.bindparam('row_id')).values(
+        result_image_key=sa.bindparam('key'))
+    clear_image = writings.update().where(writings.c.id == sa.bindparam('row_id')).values(
+        result_image=None)
+    last_id = 0
+    moved = 0
+    cleared = 0
+    while True:
+        rows = conn.execute(sa.select(writings.c.id, writings.c.result_image, writings.c.result_image_key).where(
+            writings.c.id > last_id,
+            writings.c.result_image.isnot(None)
+        ).order_by(writings.c.id).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+        new_keys = []
+        confirmed = []
+        for row_id, data_url, key in rows:
+            last_id = row_id
+            try:
+                # キーがあってもファイルがない・壊れている行は書き出し直す
+                if not key or not verify_blob(key):
+                    saved = save_data_url(data_url)
+                    if saved != key:
+                        new_keys.append({'row_id': row_id, 'key': saved})
+                    key = saved
+            except (ValueError, OSError) as e:
+                # 変換・書き込みできないデータはそのまま残す
+                print(f'  skip japanese_writing_assignments.id={row_id}: {e}')
+                continue
+            if not verify_blob(key):
+                print(f'  skip japanese_writing_assignments.id={row_id}: could not verify blob {key}')
+                continue
+            confirmed.append({'row_id': row_id})
+        if new_keys:
+            conn.execute(set_key, new_keys)
+            moved += len(new_keys)
+        if confirmed and not keep_db_copy:
+            conn.execute(clear_image, confirmed)
+            cleared += len(confirmed)
+    print(f'  moved {moved} writing images to blob store, cleared {cleared} Base64 columns')
+    if keep_db_copy:
+        print('  BLOB_KEEP_DB_COPY is on: Base64 columns were kept')
+
+
+def _restore_images_from_blob_store():
+    """Base64の列が空の行に、BLOBストアの画像をデータURLで戻す"""
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.select(writings.c.id, writings.c.result_image_key).where(
+            writings.c.id > last_id,
+            writings.c.result_image_key.isnot(None),
+            writings.c.result_image.is_(None)
+        ).order_by(writings.c.id).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+        for row_id, key in rows:
+            last_id = row_id
+            parsed = parse_key(key)
+            if not parsed or not os.path.exists(blob_path(key)):
+                continue
+            with open(blob_path(key), 'rb') as f:
+                encoded = base64.b64encode(f.read()).decode('ascii')
+            conn.execute(writings.update().where(writings.c.id == row_id).values(
+                result_image=f'data:{parsed[1]};base64,{encoded}'))
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = [c['name'] for c in inspector.get_columns('japanese_writing_assignments')]
+    if 'result_image_key' not in columns:
+        with op.batch_alter_table('japanese_writing_assignments', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('result_image_key', sa.String(length=80), nullable=True))
+            batch_op.create_index(batch_op.f('ix_japanese_writing_assignments_result_image_key'), ['result_image_key'], unique=False)
+
+    _move_images_to_blob_store()
+
+
+def downgrade():
+    _restore_images_from_blob_store()
+
+    with op.batch_alter_table('japanese_writing_assignments', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_japanese_writing_assignments_result_image_key'))
+        batch_op.drop_column('result_image_key')
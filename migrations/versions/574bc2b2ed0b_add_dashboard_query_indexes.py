@@ -0,0 +1,123 @@
+"""Add composite indexes for dashboard/progress queries and unique answers
+
+Revision ID: 574bc2b2ed0b
+Revises: 1ecb2e90d97d
+Create Date: 2026-10-18 12:31:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '574bc2b2ed0b'
+down_revision = '1ecb2e90d97d'
+branch_labels = None
+depends_on = None
+
+
+# (テーブル名, インデックス名, カラム)
+INDEXES = [
+    ('japanese_assignments', 'ix_japanese_assignments_student_completed', ['student_id', 'completed']),
+    ('japanese_flashcard_assignments', 'ix_japanese_flashcard_assignments_student_completed', ['student_id', 'completed']),
+    ('japanese_writing_assignments', 'ix_japanese_writing_assignments_student_completed', ['student_id', 'completed']),
+    ('japanese_answers', 'ix_japanese_answers_user_answered', ['user_id', 'answered_at']),
+    ('scheduled_notifications', 'ix_scheduled_notifications_sent_scheduled', ['is_sent', 'scheduled_at']),
+    ('answers', 'ix_answers_student_id', ['student_id']),
+    ('feedbacks', 'ix_feedbacks_answer_id', ['answer_id']),
+    ('problem_assignments', 'ix_problem_assignments_student_id', ['student_id']),
+]
+
+ANSWER_UNIQUE = 'uq_answers_problem_student'
+
+
+def _backup_rows(table_name, column, ids):
+    """削除する行を <テーブル名>_duplicates_backup に写す（ダウングレードでも削除しない）"""
+    conn = op.get_bind()
+    backup = f'{table_name}_duplicates_backup'
+    if not sa.inspect(conn).has_table(backup):
+        conn.execute(sa.text(f'CREATE TABLE {backup} AS SELECT * FROM {table_name} WHERE 1 = 0'))
+    insert = sa.text(f'INSERT INTO {backup} SELECT * FROM {table_name} WHERE {column} IN :ids').bindparams(
+        sa.bindparam('ids', expanding=True))
+    for i in range(0, len(ids), 500):
+        conn.execute(insert, {'ids': ids[i:i + 500]})
+    return backup
+
+
+def _remove_duplicate_answers():
+    """同じ (問題, 生徒) の重複回答を1件にまとめる
+
+    残す回答: フィードバックのある回答 → IDが大きい（最後に提出した）回答 の順に優先する。
+    削除する回答とそのフィードバックは answers_duplicates_backup / feedbacks_duplicates_backup に
+    写してから削除し、IDを出力する。
+    """
+    conn = op.get_bind()
+    answers = sa.table('answers',
+        sa.column('id', sa.Integer),
+        sa.column('problem_id', sa.Integer),
+        sa.column('student_id', sa.Integer))
+    feedbacks = sa.table('feedbacks',
+        sa.column('id', sa.Integer),
+        sa.column('answer_id', sa.Integer))
+
+    feedback_ids = {}
+    for feedback_id, answer_id in conn.execute(sa.select(feedbacks.c.id, feedbacks.c.answer_id)):
+        feedback_ids.setdefault(answer_id, []).append(feedback_id)
+    groups = {}
+    for answer_id, problem_id, student_id in conn.execute(sa.select(
+        answers.c.id, answers.c.problem_id, answers.c.student_id
+    ).order_by(answers.c.id)):
+        groups.setdefault((problem_id, student_id), []).append(answer_id)
+
+    duplicates = []
+    for (problem_id, student_id), answer_ids in groups.items():
+        if len(answer_ids) < 2:
+            continue
+        keep = max(answer_ids, key=lambda answer_id: (answer_id in feedback_ids, answer_id))
+        dropped = [answer_id for answer_id in answer_ids if answer_id != keep]
+        duplicates.extend(dropped)
+        details = ', '.join(
+            f'{answer_id} (feedback id={feedback_ids[answer_id]})' if answer_id in feedback_ids else str(answer_id)
+            for answer_id in dropped
+        )
+        print(f'  answers: problem_id={problem_id} student_id={student_id} '
+              f'keep id={keep}, delete id={details}')
+
+    if not duplicates:
+        return
+    dropped_feedbacks = [i for answer_id in duplicates for i in feedback_ids.get(answer_id, [])]
+    answer_backup = _backup_rows('answers', 'id', duplicates)
+    feedback_backup = _backup_rows('feedbacks', 'answer_id', duplicates)
+    # フィードバックは外部キーで回答を参照しているため先に削除
+    for i in range(0, len(duplicates), 500):
+        chunk = duplicates[i:i + 500]
+        conn.execute(feedbacks.delete().where(feedbacks.c.answer_id.in_(chunk)))
+        conn.execute(answers.delete().where(answers.c.id.in_(chunk)))
+    print(f'  removed {len(duplicates)} duplicate answers and {len(dropped_feedbacks)} feedbacks '
+          f'(copied to {answer_backup} / {feedback_backup})')
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # アプリ起動時の db.create_all() で作成済みのものはスキップ
+    for table_name, index_name, columns in INDEXES:
+        existing = [i['name'] for i in inspector.get_indexes(table_name)]
+        if index_name in existing:
+            continue
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.create_index(index_name, columns, unique=False)
+
+    existing = [c['name'] for c in inspector.get_unique_constraints('answers')]
+    if ANSWER_UNIQUE not in existing:
+        _remove_duplicate_answers()
+        with op.batch_alter_table('answers', schema=None) as batch_op:
+            batch_op.create_unique_constraint(ANSWER_UNIQUE, ['problem_id', 'student_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('answers', schema=None) as batch_op:
+        batch_op.drop_constraint(ANSWER_UNIQUE, type_='unique')
+
+    for table_name, index_name, columns in reversed(INDEXES):
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_index(index_name)
@@ -0,0 +1,40 @@
+"""Add LiveEvent model for server-sent events
+
+Revision ID: 7c1e5a9d2f40
+Revises: 4bc6c8d84a33
+Create Date: 2026-10-18 14:02:27.531904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e5a9d2f40'
+down_revision = '4bc6c8d84a33'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # アプリ起動時の db.create_all() で作成済みの場合はスキップ
+    if sa.inspect(op.get_bind()).has_table('live_events'):
+        return
+    op.create_table('live_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_type', sa.String(length=30), nullable=False),
+    sa.Column('target_user_id', sa.Integer(), nullable=True),
+    sa.Column('target_role', sa.String(length=20), nullable=True),
+    sa.Column('payload', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('live_events', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_live_events_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('live_events', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_live_events_created_at'))
+
+    op.drop_table('live_events')
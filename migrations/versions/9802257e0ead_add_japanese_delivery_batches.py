@@ -0,0 +1,137 @@
+"""Add JapaneseDeliveryBatch and batch_id on Japanese assignments
+
+Revision ID: 9802257e0ead
+Revises: 1362d8f8c166
+Create Date: 2026-10-18 11:03:27.551820
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9802257e0ead'
+down_revision = '1362d8f8c166'
+branch_labels = None
+depends_on = None
+
+
+ASSIGNMENT_TABLES = [
+    'japanese_assignments',
+    'japanese_flashcard_assignments',
+    'japanese_writing_assignments',
+]
+
+
+def _backfill_batches():
+    """既存の課題を配信日時（分単位）ごとに配信バッチへ割り当てる"""
+    conn = op.get_bind()
+    batches = sa.Table('japanese_delivery_batches', sa.MetaData(),
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('created_at', sa.DateTime))
+
+    # 分単位のグループごとに最も早い配信日時を集める
+    minutes = {}
+    for table_name in ASSIGNMENT_TABLES:
+        t = sa.table(table_name,
+            sa.column('assigned_at', sa.DateTime),
+            sa.column('batch_id', sa.Integer))
+        rows = conn.execute(sa.select(t.c.assigned_at).distinct().where(
+            t.c.batch_id.is_(None), t.c.assigned_at.isnot(None)))
+        for (assigned_at,) in rows:
+            start = assigned_at.replace(second=0, microsecond=0)
+            if start not in minutes or assigned_at < minutes[start]:
+                minutes[start] = assigned_at
+
+    for start, created_at in sorted(minutes.items()):
+        result = conn.execute(batches.insert().values(created_at=created_at))
+        batch_id = result.inserted_primary_key[0]
+        for table_name in ASSIGNMENT_TABLES:
+            t = sa.table(table_name,
+                sa.column('assigned_at', sa.DateTime),
+                sa.column('batch_id', sa.Integer))
+            conn.execute(t.update().where(
+                t.c.batch_id.is_(None),
+                t.c.assigned_at >= start,
+                t.c.assigned_at < start + timedelta(minutes=1)
+            ).values(batch_id=batch_id))
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # アプリ起動時の db.create_all() で作成済みの場合はスキップ
+    if not inspector.has_table('japanese_delivery_batches'):
+        op.create_table('japanese_delivery_batches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('teacher_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['teacher_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    for table_name in ASSIGNMENT_TABLES:
+        if 'batch_id' in [c['name'] for c in inspector.get_columns(table_name)]:
+            continue
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('batch_id', sa.Integer(), nullable=True))
+            batch_op.create_index(batch_op.f(f'ix_{table_name}_batch_id'), ['batch_id'], unique=False)
+            batch_op.create_foreign_key(f'fk_{table_name}_batch_id', 'japanese_delivery_batches', ['batch_id'], ['id'])
+
+    _backfill_batches()
+
+    # 集計テーブルは分単位キーからバッチIDキーへ作り直す
+    # （データは rebuild_task_summaries.py で再生成する）
+    summary_columns = [c['name'] for c in inspector.get_columns('japanese_task_summaries')]
+    if 'batch_id' in summary_columns:
+        return
+    op.drop_table('japanese_task_summaries')
+    op.create_table('japanese_task_summaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('task_type', sa.String(length=20), nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('group_date', sa.DateTime(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('completed_count', sa.Integer(), nullable=False),
+    sa.Column('has_feedback', sa.Boolean(), nullable=True),
+    sa.Column('has_unseen_feedback', sa.Boolean(), nullable=True),
+    sa.Column('next_assignment_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['batch_id'], ['japanese_delivery_batches.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('student_id', 'task_type', 'batch_id')
+    )
+    with op.batch_alter_table('japanese_task_summaries', schema=None) as batch_op:
+        batch_op.create_index('ix_japanese_task_summaries_student_date', ['student_id', 'group_date'], unique=False)
+
+
+def downgrade():
+    op.drop_table('japanese_task_summaries')
+    op.create_table('japanese_task_summaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('task_type', sa.String(length=20), nullable=False),
+    sa.Column('group_key', sa.String(length=32), nullable=False),
+    sa.Column('group_date', sa.DateTime(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('completed_count', sa.Integer(), nullable=False),
+    sa.Column('has_feedback', sa.Boolean(), nullable=True),
+    sa.Column('has_unseen_feedback', sa.Boolean(), nullable=True),
+    sa.Column('next_assignment_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['student_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('student_id', 'task_type', 'group_key')
+    )
+    with op.batch_alter_table('japanese_task_summaries', schema=None) as batch_op:
+        batch_op.create_index('ix_japanese_task_summaries_student_date', ['student_id', 'group_date'], unique=False)
+
+    for table_name in ASSIGNMENT_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_constraint(f'fk_{table_name}_batch_id', type_='foreignkey')
+            batch_op.drop_index(batch_op.f(f'ix_{table_name}_batch_id'))
+            batch_op.drop_column('batch_id')
+
+    op.drop_table('japanese_delivery_batches')
@@ -0,0 +1,43 @@
+"""Add (created_at, id) indexes for keyset-paginated teacher listings
+
+Revision ID: 9d4e6b1f3a58
+Revises: e5a2c47b9d13
+Create Date: 2026-10-18 16:02:37.415920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e6b1f3a58'
+down_revision = 'e5a2c47b9d13'
+branch_labels = None
+depends_on = None
+
+
+# (テーブル名, インデックス名, カラム)
+INDEXES = [
+    ('problems', 'ix_problems_created_id', ['created_at', 'id']),
+    ('announcements', 'ix_announcements_created_id', ['created_at', 'id']),
+    ('japanese_quizzes', 'ix_japanese_quizzes_created_id', ['created_at', 'id']),
+    ('japanese_flashcards', 'ix_japanese_flashcards_created_id', ['created_at', 'id']),
+    ('japanese_writings', 'ix_japanese_writings_created_id', ['created_at', 'id']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # アプリ起動時の db.create_all() で作成済みのものはスキップ
+    for table_name, index_name, columns in INDEXES:
+        existing = [i['name'] for i in inspector.get_indexes(table_name)]
+        if index_name in existing:
+            continue
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.create_index(index_name, columns, unique=False)
+
+
+def downgrade():
+    for table_name, index_name, columns in reversed(INDEXES):
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_index(index_name)
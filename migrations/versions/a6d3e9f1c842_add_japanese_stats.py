@@ -0,0 +1,49 @@
+"""Add JapaneseStats and JapaneseWordStats models
+
+Revision ID: a6d3e9f1c842
+Revises: f2c8a61d4b97
+Create Date: 2026-10-18 18:41:27.602193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3e9f1c842'
+down_revision = 'f2c8a61d4b97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # アプリ起動時の db.create_all() で作成済みの場合はスキップ
+    inspector = sa.inspect(op.get_bind())
+    # 既存の回答履歴の集計は、統計の初回表示時（または python rebuild_japanese_stats.py）に作成される
+    if not inspector.has_table('japanese_stats'):
+        op.create_table('japanese_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('correct', sa.Integer(), nullable=False),
+        sa.Column('current_streak', sa.Integer(), nullable=False),
+        sa.Column('best_streak', sa.Integer(), nullable=False),
+        sa.Column('last_answered_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+        )
+    if not inspector.has_table('japanese_word_stats'):
+        op.create_table('japanese_word_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('word', sa.String(length=50), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('correct', sa.Integer(), nullable=False),
+        sa.Column('current_streak', sa.Integer(), nullable=False),
+        sa.Column('last_answered_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'word')
+        )
+
+
+def downgrade():
+    op.drop_table('japanese_word_stats')
+    op.drop_table('japanese_stats')
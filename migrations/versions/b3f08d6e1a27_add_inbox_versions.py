@@ -0,0 +1,39 @@
+"""Add InboxVersion model
+
+Revision ID: b3f08d6e1a27
+Revises: 7c1e5a9d2f40
+Create Date: 2026-10-18 14:48:09.316542
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f08d6e1a27'
+down_revision = '7c1e5a9d2f40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # アプリ起動時の db.create_all() で作成済みの場合はスキップ
+    if sa.inspect(op.get_bind()).has_table('inbox_versions'):
+        return
+    # カウンターは差分だけを使うので、既存ユーザー分の初期値は不要（初回更新時に0から作成）
+    op.create_table('inbox_versions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('problems', sa.Integer(), nullable=False),
+    sa.Column('announcements', sa.Integer(), nullable=False),
+    sa.Column('feedback', sa.Integer(), nullable=False),
+    sa.Column('japanese', sa.Integer(), nullable=False),
+    sa.Column('answers', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('inbox_versions')
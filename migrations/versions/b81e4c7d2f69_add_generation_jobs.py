@@ -0,0 +1,47 @@
+"""Add GenerationJob model for background AI generation
+
+Revision ID: b81e4c7d2f69
+Revises: a6d3e9f1c842
+Create Date: 2026-10-18 19:22:05.817340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81e4c7d2f69'
+down_revision = 'a6d3e9f1c842'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # アプリ起動時の db.create_all() で作成済みの場合はスキップ
+    if sa.inspect(op.get_bind()).has_table('generation_jobs'):
+        return
+    json_type = sa.JSON().with_variant(postgresql.JSONB(), 'postgresql')
+    op.create_table('generation_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job_type', sa.String(length=30), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('params', json_type, nullable=False),
+    sa.Column('result', json_type, nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_by', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('generation_jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_generation_jobs_status_created', ['status', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('generation_jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_generation_jobs_status_created')
+
+    op.drop_table('generation_jobs')
@@ -0,0 +1,45 @@
+"""Add LLMCacheEntry model for caching AI responses
+
+Revision ID: c3f9a2d7e514
+Revises: b81e4c7d2f69
+Create Date: 2026-10-18 20:41:37.204519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f9a2d7e514'
+down_revision = 'b81e4c7d2f69'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # アプリ起動時の db.create_all() で作成済みの場合はスキップ
+    if sa.inspect(op.get_bind()).has_table('llm_cache'):
+        return
+    op.create_table('llm_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('model', sa.String(length=100), nullable=False),
+    sa.Column('response', sa.Text(), nullable=False),
+    sa.Column('total_tokens', sa.Integer(), nullable=True),
+    sa.Column('elapsed_ms', sa.Integer(), nullable=True),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('llm_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_llm_cache_expires_at'), ['expires_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_llm_cache_last_used_at'), ['last_used_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('llm_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_llm_cache_last_used_at'))
+        batch_op.drop_index(batch_op.f('ix_llm_cache_expires_at'))
+
+    op.drop_table('llm_cache')
@@ -0,0 +1,73 @@
+"""Add SearchDocument model with FTS5 / tsvector search index
+
+Revision ID: c81f3e7a5d20
+Revises: 9d4e6b1f3a58
+Create Date: 2026-10-18 16:48:12.662035
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f3e7a5d20'
+down_revision = '9d4e6b1f3a58'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+    "title_tokens, body_tokens, content='search_documents', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+    "INSERT INTO search_fts(rowid, title_tokens, body_tokens) VALUES (new.id, new.title_tokens, new.body_tokens); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+    "INSERT INTO search_fts(search_fts, rowid, title_tokens, body_tokens) "
+    "VALUES ('delete', old.id, old.title_tokens, old.body_tokens); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+    "INSERT INTO search_fts(search_fts, rowid, title_tokens, body_tokens) "
+    "VALUES ('delete', old.id, old.title_tokens, old.body_tokens); "
+    "INSERT INTO search_fts(rowid, title_tokens, body_tokens) VALUES (new.id, new.title_tokens, new.body_tokens); END",
+]
+
+POSTGRESQL_TSVECTOR = [
+    "CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING gin ("
+    "(setweight(to_tsvector('simple'::regconfig, title_tokens), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, body_tokens), 'B')))",
+]
+
+
+def _sqlite_has_fts5(bind):
+    return any('ENABLE_FTS5' in row[0] for row in bind.exec_driver_sql('PRAGMA compile_options'))
+
+
+def upgrade():
+    bind = op.get_bind()
+    # アプリ起動時の db.create_all() で作成済みの場合は表の作成をスキップ
+    # （既存データの登録は python rebuild_search_index.py で行う）
+    if not sa.inspect(bind).has_table('search_documents'):
+        op.create_table('search_documents',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('doc_type', sa.String(length=20), nullable=False),
+        sa.Column('doc_id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('snippet', sa.Text(), nullable=True),
+        sa.Column('title_tokens', sa.Text(), nullable=False),
+        sa.Column('body_tokens', sa.Text(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('doc_type', 'doc_id', name='uq_search_documents_doc')
+        )
+
+    if bind.dialect.name == 'sqlite' and _sqlite_has_fts5(bind):
+        for statement in SQLITE_FTS:
+            op.execute(statement)
+    elif bind.dialect.name == 'postgresql':
+        for statement in POSTGRESQL_TSVECTOR:
+            op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS search_fts')
+    op.drop_table('search_documents')
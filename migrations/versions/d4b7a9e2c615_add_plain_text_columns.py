@@ -0,0 +1,38 @@
+"""Add plain_text and summary columns to Answer and Announcement
+
+Revision ID: d4b7a9e2c615
+Revises: c81f3e7a5d20
+Create Date: 2026-10-18 17:20:44.105318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b7a9e2c615'
+down_revision = 'c81f3e7a5d20'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ('answers', 'announcements')
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # 既存の行の変換は python backfill_plain_text.py で行う
+    for table_name in TABLES:
+        existing = [c['name'] for c in inspector.get_columns(table_name)]
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            if 'plain_text' not in existing:
+                batch_op.add_column(sa.Column('plain_text', sa.Text(), nullable=True))
+            if 'summary' not in existing:
+                batch_op.add_column(sa.Column('summary', sa.String(length=120), nullable=True))
+
+
+def downgrade():
+    for table_name in reversed(TABLES):
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_column('summary')
+            batch_op.drop_column('plain_text')
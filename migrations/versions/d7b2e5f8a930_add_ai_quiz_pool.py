@@ -0,0 +1,39 @@
+"""Add AIQuizPoolItem model for pre-generated AI quizzes
+
+Revision ID: d7b2e5f8a930
+Revises: c3f9a2d7e514
+Create Date: 2026-10-18 22:06:54.913208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7b2e5f8a930'
+down_revision = 'c3f9a2d7e514'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # アプリ起動時の db.create_all() で作成済みの場合はスキップ
+    if sa.inspect(op.get_bind()).has_table('ai_quiz_pool'):
+        return
+    op.create_table('ai_quiz_pool',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('difficulty', sa.String(length=10), nullable=False),
+    sa.Column('data', sa.JSON().with_variant(postgresql.JSONB(), 'postgresql'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ai_quiz_pool', schema=None) as batch_op:
+        batch_op.create_index('ix_ai_quiz_pool_difficulty_id', ['difficulty', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ai_quiz_pool', schema=None) as batch_op:
+        batch_op.drop_index('ix_ai_quiz_pool_difficulty_id')
+
+    op.drop_table('ai_quiz_pool')
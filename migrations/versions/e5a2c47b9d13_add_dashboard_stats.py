@@ -0,0 +1,39 @@
+"""Add DashboardStats model
+
+Revision ID: e5a2c47b9d13
+Revises: b3f08d6e1a27
+Create Date: 2026-10-18 15:21:53.804117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a2c47b9d13'
+down_revision = 'b3f08d6e1a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # アプリ起動時の db.create_all() で作成済みの場合はスキップ
+    # （集計行は初回のダッシュボード表示時に実データから作成される）
+    if sa.inspect(op.get_bind()).has_table('dashboard_stats'):
+        return
+    op.create_table('dashboard_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('problems', sa.Integer(), nullable=False),
+    sa.Column('students', sa.Integer(), nullable=False),
+    sa.Column('pending_answers', sa.Integer(), nullable=False),
+    sa.Column('disk_used_percent', sa.Integer(), nullable=True),
+    sa.Column('disk_free_gb', sa.Float(), nullable=True),
+    sa.Column('db_size_bytes', sa.BigInteger(), nullable=True),
+    sa.Column('reconciled_at', sa.DateTime(), nullable=True),
+    sa.Column('sampled_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('dashboard_stats')
@@ -0,0 +1,32 @@
+"""Add UserCacheVersion model for cross-worker user cache invalidation
+
+Revision ID: e8a1d5c3f726
+Revises: d7b2e5f8a930
+Create Date: 2026-10-18 23:41:17.208315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a1d5c3f726'
+down_revision = 'd7b2e5f8a930'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # アプリ起動時の db.create_all() で作成済みの場合はスキップ
+    if sa.inspect(op.get_bind()).has_table('user_cache_versions'):
+        return
+    # 行は最初のユーザー情報の変更時に作成する（行がなければ世代0として扱う）
+    op.create_table('user_cache_versions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_cache_versions')
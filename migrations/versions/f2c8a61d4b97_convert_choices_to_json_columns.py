@@ -0,0 +1,102 @@
+"""Convert choices_json and wrong_readings to JSON columns
+
+Revision ID: f2c8a61d4b97
+Revises: d4b7a9e2c615
+Create Date: 2026-10-18 18:05:12.430981
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8a61d4b97'
+down_revision = 'd4b7a9e2c615'
+branch_labels = None
+depends_on = None
+
+
+# (テーブル, カラム, 読めない値の置き換え先)
+COLUMNS = (
+    ('problems', 'choices_json', None),
+    ('problem_components', 'choices_json', None),
+    ('japanese_quizzes', 'wrong_readings', '[]'),
+)
+
+
+def _normalize(value):
+    """保存済みの文字列をJSON配列の文字列にそろえる（配列として読めない値は None）"""
+    try:
+        parsed = json.loads(value)
+        # 二重にエンコードされた値（"[...]" という文字列）も配列に戻す
+        if isinstance(parsed, str):
+            parsed = json.loads(parsed)
+    except ValueError:
+        return None
+    if not isinstance(parsed, list):
+        return None
+    return json.dumps(parsed, ensure_ascii=False)
+
+
+def _existing_columns():
+    inspector = sa.inspect(op.get_bind())
+    found = {}
+    for table_name, column_name, _ in COLUMNS:
+        if inspector.has_table(table_name):
+            for column in inspector.get_columns(table_name):
+                if column['name'] == column_name:
+                    found[(table_name, column_name)] = column['type']
+    return found
+
+
+def upgrade():
+    bind = op.get_bind()
+    existing = _existing_columns()
+    for table_name, column_name, fallback in COLUMNS:
+        column_type = existing.get((table_name, column_name))
+        if column_type is None or isinstance(column_type, (sa.JSON, postgresql.JSONB)):
+            continue
+
+        # JSONとして読めない行を先に直す（PostgreSQLの型変換やJSONカラムの読み込みが失敗しないように）
+        table = sa.table(table_name, sa.column('id', sa.Integer), sa.column(column_name, sa.Text))
+        rows = bind.execute(
+            sa.select(table.c.id, table.c[column_name]).where(table.c[column_name].isnot(None))
+        ).all()
+        updates = []
+        for row_id, value in rows:
+            normalized = _normalize(value)
+            if normalized is None:
+                # 読めない値は置き換える（元の値は確認・復旧できるよう出力しておく）
+                print(f'  coerce {table_name}.{column_name} id={row_id}: {value!r} -> {fallback!r}')
+                normalized = fallback
+            if normalized != value:
+                updates.append({'row_id': row_id, 'value': normalized})
+        if updates:
+            print(f'  normalized {len(updates)} rows in {table_name}.{column_name}')
+            bind.execute(
+                table.update().where(table.c.id == sa.bindparam('row_id')).values({column_name: sa.bindparam('value')}),
+                updates
+            )
+
+        # SQLiteのJSON型は文字列で保存されるので、型の変更はPostgreSQLだけ行う
+        if bind.dialect.name == 'postgresql':
+            op.alter_column(
+                table_name, column_name,
+                type_=postgresql.JSONB(),
+                postgresql_using=f'{column_name}::jsonb'
+            )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    for table_name, column_name, _ in reversed(COLUMNS):
+        op.alter_column(
+            table_name, column_name,
+            type_=sa.Text(),
+            postgresql_using=f'{column_name}::text'
+        )
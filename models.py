@@ -3,10 +3,29 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+import json
 from datetime import datetime
+from sqlalchemy import event, DDL
+from sqlalchemy.dialects.postgresql import JSONB
 
 db = SQLAlchemy()
 
+# JSONのカラム（PostgreSQLではJSONB、SQLiteではJSON文字列）
+# 値は読み込み時に一度だけリスト・辞書に変換されてインスタンスに保持されるので、
+# 参照のたびに json.loads し直す必要はない
+JSONType = db.JSON().with_variant(JSONB(), 'postgresql')
+
+
+def _as_list(value):
+    """JSON配列カラムの値をリストとして取得（移行前の文字列の値も読めるようにする）"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return list(value) if isinstance(value, list) else []
+
+
 class User(UserMixin, db.Model):
     """ユーザーモデル（先生/生徒）"""
     __tablename__ = 'users'
@@ -37,7 +56,7 @@ class User(UserMixin, db.Model):
 # 問題と生徒の関連テーブル（多対多）
 problem_assignments = db.Table('problem_assignments',
     db.Column('problem_id', db.Integer, db.ForeignKey('problems.id'), primary_key=True),
-    db.Column('student_id', db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    db.Column('student_id', db.Integer, db.ForeignKey('users.id'), primary_key=True, index=True)  # 生徒ごとの配信問題検索用
 )
 
 
@@ -49,13 +68,16 @@ class Problem(db.Model):
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)  # リッチテキストHTML
     problem_type = db.Column(db.String(20), default='text')  # text, choice
-    choices_json = db.Column(db.Text, nullable=True)  # 選択肢JSON
+    choices_json = db.Column(JSONType, nullable=True)  # 選択肢（JSON配列）
     correct_choice = db.Column(db.Integer, nullable=True)  # 正解インデックス
     teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     deadline = db.Column(db.DateTime, nullable=True)  # 提出期限（任意）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # 一覧（新しい順）の keyset ページング用
+    __table_args__ = (db.Index('ix_problems_created_id', 'created_at', 'id'),)
+    
     # リレーション
     answers = db.relationship('Answer', backref='problem', lazy='dynamic', cascade='all, delete-orphan')
     assigned_students = db.relationship('User', secondary=problem_assignments, 
@@ -69,10 +91,7 @@ class Problem(db.Model):
     
     def get_choices(self):
         """選択肢リストを取得"""
-        if self.choices_json:
-            import json
-            return json.loads(self.choices_json)
-        return []
+        return _as_list(self.choices_json)
 
 
 class Answer(db.Model):
@@ -81,13 +100,18 @@ class Answer(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     problem_id = db.Column(db.Integer, db.ForeignKey('problems.id'), nullable=False)
-    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     content = db.Column(db.Text, nullable=False)  # 生徒の回答HTML
+    plain_text = db.Column(db.Text, nullable=True)  # 回答のプレーンテキスト（保存時に作成）
+    summary = db.Column(db.String(120), nullable=True)  # 回答一覧に表示する要約（保存時に作成）
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # リレーション
     feedback = db.relationship('Feedback', backref='answer', uselist=False, cascade='all, delete-orphan')
+    
+    # ユニーク制約：1つの問題に対して生徒1人につき回答は1件
+    __table_args__ = (db.UniqueConstraint('problem_id', 'student_id', name='uq_answers_problem_student'),)
 
 
 class Feedback(db.Model):
@@ -95,7 +119,7 @@ class Feedback(db.Model):
     __tablename__ = 'feedbacks'
     
     id = db.Column(db.Integer, primary_key=True)
-    answer_id = db.Column(db.Integer, db.ForeignKey('answers.id'), nullable=False)
+    answer_id = db.Column(db.Integer, db.ForeignKey('answers.id'), nullable=False, index=True)
     content = db.Column(db.Text, nullable=False)  # フィードバックHTML
     score = db.Column(db.Integer, nullable=True)  # 任意の点数（0-100）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -115,12 +139,17 @@ class Announcement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    plain_text = db.Column(db.Text, nullable=True)  # 本文のプレーンテキスト（保存時に作成）
+    summary = db.Column(db.String(120), nullable=True)  # 通知に表示する要約（保存時に作成）
     teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     is_active = db.Column(db.Boolean, default=True)  # 表示/非表示
     is_global = db.Column(db.Boolean, default=False)  # 全員向けかどうか
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # 一覧（新しい順）の keyset ページング用
+    __table_args__ = (db.Index('ix_announcements_created_id', 'created_at', 'id'),)
+    
     # リレーション
     author = db.relationship('User', backref='announcements')
     recipients = db.relationship('User', secondary=announcement_recipients,
@@ -153,7 +182,7 @@ class ProblemComponent(db.Model):
     content = db.Column(db.Text, nullable=False)  # HTMLコンテンツ
     component_type = db.Column(db.String(50), nullable=False)  # text, widget-text, widget-choice, widget-checkbox
     description = db.Column(db.Text, nullable=True) # ウィジェットの説明文（検索用・分離保存用）
-    choices_json = db.Column(db.Text, nullable=True) # 選択肢データ（検索用・分離保存用）
+    choices_json = db.Column(JSONType, nullable=True) # 選択肢データ（検索用・分離保存用）
     content_hash = db.Column(db.String(64), nullable=False, index=True) # 重複チェック用ハッシュ (SHA256)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -169,6 +198,131 @@ class ScheduledNotification(db.Model):
     is_sent = db.Column(db.Boolean, default=False)  # 送信済みかどうか
     sent_at = db.Column(db.DateTime, nullable=True)  # 実際に送信した時刻
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # 送信待ち通知の検索用インデックス
+    __table_args__ = (db.Index('ix_scheduled_notifications_sent_scheduled', 'is_sent', 'scheduled_at'),)
+
+
+class DashboardStats(db.Model):
+    """先生ダッシュボードの集計（1行のみ）
+    
+    件数は書き込み時に増減し、定期的に実データから再集計して補正する。
+    ディスク使用量・DBサイズはバックグラウンドで定期的に計測する。
+    """
+    __tablename__ = 'dashboard_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    problems = db.Column(db.Integer, nullable=False, default=0)  # 問題数
+    students = db.Column(db.Integer, nullable=False, default=0)  # 生徒数
+    pending_answers = db.Column(db.Integer, nullable=False, default=0)  # フィードバック待ちの回答数
+    disk_used_percent = db.Column(db.Integer, nullable=True)  # ディスク使用率（%）
+    disk_free_gb = db.Column(db.Float, nullable=True)  # ディスク空き容量（GB）
+    db_size_bytes = db.Column(db.BigInteger, nullable=True)  # データベースのサイズ
+    reconciled_at = db.Column(db.DateTime, nullable=True)  # 最後に再集計した日時
+    sampled_at = db.Column(db.DateTime, nullable=True)  # 最後に容量を計測した日時
+
+
+class InboxVersion(db.Model):
+    """ユーザーごとの新着カウンター（新着の有無を主キー1回の参照で判定する）
+    
+    関係する新着が発生するたびに種類別の件数と全体の version を加算する。
+    値は単調増加なので、前回確認時の値との差がそのまま新着件数になる。
+    """
+    __tablename__ = 'inbox_versions'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)  # 全体のバージョン（更新ごとに+1）
+    problems = db.Column(db.Integer, nullable=False, default=0)  # 配信された問題
+    announcements = db.Column(db.Integer, nullable=False, default=0)  # 連絡事項
+    feedback = db.Column(db.Integer, nullable=False, default=0)  # 回答・日本語課題へのフィードバック
+    japanese = db.Column(db.Integer, nullable=False, default=0)  # 配信された日本語課題
+    answers = db.Column(db.Integer, nullable=False, default=0)  # 生徒の回答（先生用）
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UserCacheVersion(db.Model):
+    """ログインユーザーのキャッシュの世代（1行のみ）
+    
+    ユーザー情報を変更するたびに version を加算する。各ワーカーはキャッシュした値の世代と
+    この値を比べ、違っていればDBから読み直す（user_cache.py）。
+    """
+    __tablename__ = 'user_cache_versions'
+    
+    id = db.Column(db.Integer, primary_key=True)  # 常に1
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class LiveEvent(db.Model):
+    """リアルタイム更新イベント（SSE配信用。gunicornのワーカー間で共有する）"""
+    __tablename__ = 'live_events'
+    
+    id = db.Column(db.Integer, primary_key=True)  # SSEのイベントID（再接続時の再開位置）
+    event_type = db.Column(db.String(30), nullable=False)  # 'problem', 'announcement', 'feedback', 'answer'
+    target_user_id = db.Column(db.Integer, nullable=True)  # 宛先ユーザーID（個別配信）
+    target_role = db.Column(db.String(20), nullable=True)  # 宛先の役割（'teacher' / 'student' 全員向け）
+    payload = db.Column(db.Text, nullable=True)  # 表示内容（JSON）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class SearchDocument(db.Model):
+    """全文検索用のドキュメント（問題・コンポーネント・連絡事項を1行ずつ）
+    
+    title_tokens / body_tokens は search_index.tokenize() で分割した語（空白区切り）。
+    日本語は文字2-gramに分割して保存するので、DB側は空白で区切るだけの検索エンジンで済む。
+    SQLite では FTS5 の search_fts、PostgreSQL では tsvector の GIN インデックスで検索する。
+    """
+    __tablename__ = 'search_documents'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doc_type = db.Column(db.String(20), nullable=False)  # 'problem', 'component', 'announcement'
+    doc_id = db.Column(db.Integer, nullable=False)  # 元データのID
+    title = db.Column(db.String(200), nullable=False)  # 検索結果に表示するタイトル
+    snippet = db.Column(db.Text, nullable=True)  # 検索結果に表示する本文の冒頭（プレーンテキスト）
+    title_tokens = db.Column(db.Text, nullable=False, default='')
+    body_tokens = db.Column(db.Text, nullable=False, default='')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('doc_type', 'doc_id', name='uq_search_documents_doc'),
+    )
+
+
+def _sqlite_has_fts5(ddl, target, bind, **kw):
+    return any('ENABLE_FTS5' in row[0] for row in bind.exec_driver_sql('PRAGMA compile_options'))
+
+
+# 検索インデックス（SQLite: search_documents を外部コンテンツとするFTS5表とトリガー）
+SEARCH_FTS_SQLITE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+    "title_tokens, body_tokens, content='search_documents', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+    "INSERT INTO search_fts(rowid, title_tokens, body_tokens) VALUES (new.id, new.title_tokens, new.body_tokens); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+    "INSERT INTO search_fts(search_fts, rowid, title_tokens, body_tokens) "
+    "VALUES ('delete', old.id, old.title_tokens, old.body_tokens); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+    "INSERT INTO search_fts(search_fts, rowid, title_tokens, body_tokens) "
+    "VALUES ('delete', old.id, old.title_tokens, old.body_tokens); "
+    "INSERT INTO search_fts(rowid, title_tokens, body_tokens) VALUES (new.id, new.title_tokens, new.body_tokens); END",
+]
+
+# 検索インデックス（PostgreSQL: タイトルを重み A、本文を重み B とした tsvector の式インデックス）
+# search_index.py の検索条件はこの式と同じ形で書くこと（一致しないとインデックスが使われない）
+SEARCH_TSVECTOR = (
+    "(setweight(to_tsvector('simple'::regconfig, title_tokens), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, body_tokens), 'B'))"
+)
+SEARCH_TSVECTOR_POSTGRESQL = [
+    f"CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING gin ({SEARCH_TSVECTOR})",
+]
+
+for _statement in SEARCH_FTS_SQLITE:
+    event.listen(SearchDocument.__table__, 'after_create',
+                 DDL(_statement).execute_if(dialect='sqlite', callable_=_sqlite_has_fts5))
+for _statement in SEARCH_TSVECTOR_POSTGRESQL:
+    event.listen(SearchDocument.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+event.listen(SearchDocument.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS search_fts').execute_if(dialect='sqlite'))
 
 
 # ============================================
@@ -182,17 +336,19 @@ class JapaneseQuiz(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     word = db.Column(db.String(50), nullable=False)  # 熟語（漢字）
     correct_reading = db.Column(db.String(50), nullable=False)  # 正しい読み方
-    wrong_readings = db.Column(db.Text, nullable=False)  # 間違い選択肢（JSON配列）
+    wrong_readings = db.Column(JSONType, nullable=False)  # 間違い選択肢（JSON配列）
     meaning_chinese = db.Column(db.String(200), nullable=True)  # 中国語の意味
     example = db.Column(db.String(300), nullable=True)  # 例文
     category = db.Column(db.String(20), default='general')  # カテゴリ
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # 一覧（新しい順）の keyset ページング用
+    __table_args__ = (db.Index('ix_japanese_quizzes_created_id', 'created_at', 'id'),)
+    
     def get_wrong_readings(self):
         """間違い選択肢をリストとして取得"""
-        import json
-        return json.loads(self.wrong_readings) if self.wrong_readings else []
+        return _as_list(self.wrong_readings)
 
 
 class JapaneseAnswer(db.Model):
@@ -209,6 +365,36 @@ class JapaneseAnswer(db.Model):
     # リレーション
     user = db.relationship('User', backref=db.backref('japanese_answers', lazy='dynamic'))
     quiz = db.relationship('JapaneseQuiz', backref='answers')
+    
+    # 生徒ごとの回答履歴（新しい順）の検索用インデックス
+    __table_args__ = (db.Index('ix_japanese_answers_user_answered', 'user_id', 'answered_at'),)
+
+
+class JapaneseStats(db.Model):
+    """生徒ごとの日本語クイズ回答の集計（統計の表示を主キー1回の参照で済ませる）
+    
+    回答を記録するたびに同じトランザクション内で加算する。回答履歴から作り直すこともできる。
+    """
+    __tablename__ = 'japanese_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # 回答数
+    correct = db.Column(db.Integer, nullable=False, default=0)  # 正解数
+    current_streak = db.Column(db.Integer, nullable=False, default=0)  # 現在の連続正解数
+    best_streak = db.Column(db.Integer, nullable=False, default=0)  # 最長の連続正解数
+    last_answered_at = db.Column(db.DateTime, nullable=True)  # 最後に回答した日時
+
+
+class JapaneseWordStats(db.Model):
+    """生徒×熟語ごとの日本語クイズ回答の集計（苦手な熟語の一覧用）"""
+    __tablename__ = 'japanese_word_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    word = db.Column(db.String(50), primary_key=True)  # 熟語（回答履歴の quiz_word）
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # 回答数
+    correct = db.Column(db.Integer, nullable=False, default=0)  # 正解数
+    current_streak = db.Column(db.Integer, nullable=False, default=0)  # 現在の連続正解数
+    last_answered_at = db.Column(db.DateTime, nullable=True)  # 最後に回答した日時
 
 
 # 日本語問題配信用の多対多テーブル
@@ -220,6 +406,23 @@ japanese_quiz_assignments = db.Table('japanese_quiz_assignments',
 )
 
 
+class JapaneseDeliveryBatch(db.Model):
+    """日本語課題配信バッチモデル（1回の配信操作でまとめて送った課題群）"""
+    __tablename__ = 'japanese_delivery_batches'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @classmethod
+    def start(cls, teacher_id):
+        """新しい配信バッチを作成してIDを確定する"""
+        batch = cls(teacher_id=teacher_id, created_at=datetime.utcnow())
+        db.session.add(batch)
+        db.session.flush()
+        return batch
+
+
 class JapaneseAssignment(db.Model):
     """日本語問題配信モデル"""
     __tablename__ = 'japanese_assignments'
@@ -228,6 +431,7 @@ class JapaneseAssignment(db.Model):
     quiz_id = db.Column(db.Integer, db.ForeignKey('japanese_quizzes.id'), nullable=False)
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
+    batch_id = db.Column(db.Integer, db.ForeignKey('japanese_delivery_batches.id'), nullable=True, index=True)  # 配信バッチ
     completed = db.Column(db.Boolean, default=False)
     completed_at = db.Column(db.DateTime, nullable=True)
     is_correct = db.Column(db.Boolean, nullable=True)
@@ -239,6 +443,13 @@ class JapaneseAssignment(db.Model):
     # リレーション
     quiz = db.relationship('JapaneseQuiz', backref=db.backref('assignments', cascade='all, delete-orphan'))
     student = db.relationship('User', backref=db.backref('japanese_assignments', lazy='dynamic'))
+    
+    # ユニーク制約：同じ問題を同じ生徒に二重配信しない
+    # 生徒ごとの未完了課題の検索用インデックス
+    __table_args__ = (
+        db.UniqueConstraint('quiz_id', 'student_id', name='uq_japanese_assignments_quiz_student'),
+        db.Index('ix_japanese_assignments_student_completed', 'student_id', 'completed'),
+    )
 
 
 class JapaneseFlashcard(db.Model):
@@ -252,6 +463,9 @@ class JapaneseFlashcard(db.Model):
     example = db.Column(db.String(300), nullable=True)  # 例文
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # 一覧（新しい順）の keyset ページング用
+    __table_args__ = (db.Index('ix_japanese_flashcards_created_id', 'created_at', 'id'),)
 
 
 class JapaneseFlashcardAssignment(db.Model):
@@ -262,6 +476,7 @@ class JapaneseFlashcardAssignment(db.Model):
     flashcard_id = db.Column(db.Integer, db.ForeignKey('japanese_flashcards.id'), nullable=False)
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
+    batch_id = db.Column(db.Integer, db.ForeignKey('japanese_delivery_batches.id'), nullable=True, index=True)  # 配信バッチ
     completed = db.Column(db.Boolean, default=False)
     completed_at = db.Column(db.DateTime, nullable=True)
     student_comment = db.Column(db.Text, nullable=True)  # 生徒からのコメント
@@ -272,6 +487,13 @@ class JapaneseFlashcardAssignment(db.Model):
     # リレーション
     flashcard = db.relationship('JapaneseFlashcard', backref=db.backref('assignments', cascade='all, delete-orphan'))
     student = db.relationship('User', backref=db.backref('japanese_flashcard_assignments', lazy='dynamic'))
+    
+    # ユニーク制約：同じカードを同じ生徒に二重配信しない
+    # 生徒ごとの未完了課題の検索用インデックス
+    __table_args__ = (
+        db.UniqueConstraint('flashcard_id', 'student_id', name='uq_japanese_flashcard_assignments_flashcard_student'),
+        db.Index('ix_japanese_flashcard_assignments_student_completed', 'student_id', 'completed'),
+    )
 
 
 class JapaneseWriting(db.Model):
@@ -286,6 +508,9 @@ class JapaneseWriting(db.Model):
     stroke_count = db.Column(db.Integer, nullable=True)  # 画数
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # 一覧（新しい順）の keyset ページング用
+    __table_args__ = (db.Index('ix_japanese_writings_created_id', 'created_at', 'id'),)
 
 
 class JapaneseWritingAssignment(db.Model):
@@ -296,9 +521,11 @@ class JapaneseWritingAssignment(db.Model):
     writing_id = db.Column(db.Integer, db.ForeignKey('japanese_writings.id'), nullable=False)
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
+    batch_id = db.Column(db.Integer, db.ForeignKey('japanese_delivery_batches.id'), nullable=True, index=True)  # 配信バッチ
     completed = db.Column(db.Boolean, default=False)
     completed_at = db.Column(db.DateTime, nullable=True)
-    result_image = db.Column(db.Text, nullable=True)  # 書き取り結果画像 (Base64)
+    result_image = db.Column(db.Text, nullable=True)  # 書き取り結果画像 (Base64、旧形式。BLOBストアへ移行済みならNULL)
+    result_image_key = db.Column(db.String(80), nullable=True, index=True)  # 書き取り結果画像のBLOBキー
     student_comment = db.Column(db.Text, nullable=True)  # 生徒からのコメント
     teacher_feedback = db.Column(db.Text, nullable=True)  # 先生からのフィードバック
     feedback_seen = db.Column(db.Boolean, default=False)  # フィードバック既読フラグ
@@ -307,6 +534,13 @@ class JapaneseWritingAssignment(db.Model):
     # リレーション
     writing = db.relationship('JapaneseWriting', backref=db.backref('assignments', cascade='all, delete-orphan'))
     student = db.relationship('User', backref=db.backref('japanese_writing_assignments', lazy='dynamic'))
+    
+    # ユニーク制約：同じ書き取りを同じ生徒に二重配信しない
+    # 生徒ごとの未完了課題の検索用インデックス
+    __table_args__ = (
+        db.UniqueConstraint('writing_id', 'student_id', name='uq_japanese_writing_assignments_writing_student'),
+        db.Index('ix_japanese_writing_assignments_student_completed', 'student_id', 'completed'),
+    )
 
 
 class GradeKanji(db.Model):
@@ -333,3 +567,77 @@ class GradeKanji(db.Model):
             ('grade6', '小学6年生'),
             ('junior_high', '中学校'),
         ]
+
+
+class GenerationJob(db.Model):
+    """AIによる問題生成のジョブ（生成はリクエストとは別のスレッドで行い、画面は状態を問い合わせる）"""
+    __tablename__ = 'generation_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(30), nullable=False)  # quiz, flashcard, writing, kanji_quiz, kanji_flashcard, kanji_writing
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    params = db.Column(JSONType, nullable=False)  # 生成条件（フォームの入力値）
+    result = db.Column(JSONType, nullable=True)  # 生成結果 {'count', 'item_ids', 'items', 'delivered'}
+    error = db.Column(db.Text, nullable=True)  # 失敗時のメッセージ
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # 未処理のジョブの検索用インデックス
+    __table_args__ = (db.Index('ix_generation_jobs_status_created', 'status', 'created_at'),)
+
+
+class LLMCacheEntry(db.Model):
+    """AIの応答のキャッシュ（同じモデル・プロンプト・パラメータの呼び出しを再利用する）"""
+    __tablename__ = 'llm_cache'
+    
+    key = db.Column(db.String(64), primary_key=True)  # モデル・正規化したプロンプト・パラメータのSHA-256
+    model = db.Column(db.String(100), nullable=False)
+    response = db.Column(db.Text, nullable=False)  # 応答テキスト
+    total_tokens = db.Column(db.Integer, nullable=True)  # 元の呼び出しで使ったトークン数
+    elapsed_ms = db.Column(db.Integer, nullable=True)  # 元の呼び出しにかかった時間（ミリ秒）
+    hits = db.Column(db.Integer, nullable=False, default=0)  # DBのキャッシュから返した回数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # 件数の上限を超えたら古いものから削除
+
+
+class AIQuizPoolItem(db.Model):
+    """AIクイズ用に生成しておいた問題（出題したら削除する）"""
+    __tablename__ = 'ai_quiz_pool'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    difficulty = db.Column(db.String(10), nullable=False)  # easy, medium, hard
+    data = db.Column(JSONType, nullable=False)  # {'word', 'correct_reading', 'wrong_readings', 'meaning_chinese', 'example'}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # 難易度ごとに古い順に取り出すためのインデックス
+    __table_args__ = (db.Index('ix_ai_quiz_pool_difficulty_id', 'difficulty', 'id'),)
+
+
+class JapaneseTaskSummary(db.Model):
+    """日本語課題グループ集計モデル（生徒ダッシュボード用）"""
+    __tablename__ = 'japanese_task_summaries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    task_type = db.Column(db.String(20), nullable=False)  # 'quiz', 'flashcard', 'writing'
+    batch_id = db.Column(db.Integer, db.ForeignKey('japanese_delivery_batches.id'), nullable=False)  # 配信バッチ
+    group_date = db.Column(db.DateTime, nullable=False)  # グループ内の最新配信日時
+    count = db.Column(db.Integer, nullable=False, default=0)  # 課題数
+    completed_count = db.Column(db.Integer, nullable=False, default=0)  # 完了数
+    has_feedback = db.Column(db.Boolean, default=False)  # フィードバックあり
+    has_unseen_feedback = db.Column(db.Boolean, default=False)  # 未読フィードバックあり
+    next_assignment_id = db.Column(db.Integer, nullable=False)  # 次に解く課題のID
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # ユニーク制約：1人の生徒の1グループにつき1行
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'task_type', 'batch_id'),
+        db.Index('ix_japanese_task_summaries_student_date', 'student_id', 'group_date'),
+    )
+    
+    @property
+    def all_completed(self):
+        return self.completed_count == self.count
@@ -0,0 +1,41 @@
+# keyset（シーク）ページング用のヘルパー
+# OFFSET は読み飛ばす行数に比例して遅くなるため、前ページ最後の行のソートキーを
+# カーソルとして渡し「それより後の行」だけを取得する
+
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values):
+    """ソートキーの値リストをURLに載せられる文字列に変換"""
+    raw = json.dumps(list(values), separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """カーソル文字列をソートキーの値リストに戻す（不正な場合は ValueError）"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('不正なカーソルです')
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError('不正なカーソルです')
+    return values
+
+
+def keyset_after(order, values):
+    """カーソルより後の行を選ぶ条件を作成
+
+    order: [(カラム式, 降順ならTrue), ...]（ORDER BY と同じ順）
+    values: カーソル（前ページ最後の行のソートキー）
+    降順・昇順が混在していても使えるよう、行値比較ではなくORの連鎖で組み立てる
+    """
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        prefix = [c == v for (c, _), v in zip(order[:i], values[:i])]
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*prefix, beyond))
+    return or_(*clauses)
@@ -0,0 +1,136 @@
+# 回答・連絡事項のプレーンテキスト
+# 一覧表示や通知では本文HTML（複合問題の回答はJSON）からテキストを取り出して使うため、
+# 保存時に一度だけ変換して plain_text / summary カラムに保存しておく。
+# 表示・通知の側は保存済みの文字列を読むだけで済む（未変換の古い行はその場で変換する）。
+
+import json
+
+from bs4 import BeautifulSoup
+from sqlalchemy import bindparam
+
+from models import db, Answer, Announcement, Problem
+
+# 一覧・通知に表示する要約の文字数
+SUMMARY_LENGTH = 100
+
+
+def html_to_text(html_content):
+    """HTMLタグを除去してプレーンテキストを取得"""
+    if not html_content:
+        return ''
+    return BeautifulSoup(html_content, 'html.parser').get_text(separator=' ', strip=True)
+
+
+def _mixed_parts(content, value_length=None):
+    """複合問題の回答（JSON）を項目ごとのテキストにする。JSONでなければ None"""
+    try:
+        answers = json.loads(content)
+        parts = []
+        for answer in answers.values():
+            if answer.get('type') == 'text':
+                val = answer.get('value', '')
+                if val:
+                    parts.append(val[:value_length] if value_length else val)
+            elif answer.get('type') == 'choice':
+                parts.append(f"選択: {answer.get('choice_text', '')}")
+            elif answer.get('type') == 'checkbox':
+                texts = answer.get('choice_text', [])
+                if texts:
+                    texts = texts[:3] if value_length else texts
+                    parts.append(f"選択: {', '.join(texts)}")
+        return parts
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def summarize_answer(content, problem_type='text'):
+    """回答の要約（回答一覧のプレビュー用）"""
+    content = content or ''
+    if problem_type != 'mixed':
+        # mixed以外はHTMLタグを除去
+        return BeautifulSoup(content, 'html.parser').get_text()[:SUMMARY_LENGTH]
+    parts = _mixed_parts(content, value_length=50)
+    if parts is None:
+        # JSONパースに失敗した場合はそのまま（truncate）
+        return content[:SUMMARY_LENGTH]
+    return ' / '.join(parts)[:SUMMARY_LENGTH] if parts else '(回答あり)'
+
+
+def answer_plain_text(content, problem_type='text'):
+    """回答の全文のプレーンテキスト"""
+    content = content or ''
+    if problem_type == 'mixed':
+        parts = _mixed_parts(content)
+        if parts is not None:
+            return '\n'.join(parts)
+    return html_to_text(content)
+
+
+def update_answer_text(answer, problem_type):
+    """回答の plain_text / summary を本文から作り直す（回答の保存時に呼ぶ）"""
+    answer.plain_text = answer_plain_text(answer.content, problem_type)
+    answer.summary = summarize_answer(answer.content, problem_type)
+
+
+def _announcement_summary(plain):
+    return plain[:SUMMARY_LENGTH] + ("..." if len(plain) > SUMMARY_LENGTH else "")
+
+
+def update_announcement_text(announcement):
+    """連絡事項の plain_text / summary を本文から作り直す（連絡事項の保存時に呼ぶ）"""
+    plain = html_to_text(announcement.content)
+    announcement.plain_text = plain
+    announcement.summary = _announcement_summary(plain)
+
+
+def announcement_text(announcement):
+    """連絡事項のプレーンテキスト（未変換の行はその場で変換）"""
+    if announcement.plain_text is not None:
+        return announcement.plain_text
+    return html_to_text(announcement.content)
+
+
+def _backfill(table, rows):
+    # updated_at は生徒・先生の更新日時として表示されるので、変換だけでは変えない
+    db.session.execute(
+        db.update(table).where(table.c.id == bindparam('row_id')).values(
+            plain_text=bindparam('plain_text'), summary=bindparam('summary'), updated_at=table.c.updated_at
+        ),
+        rows
+    )
+    db.session.commit()
+
+
+def backfill_plain_text(batch_size=200):
+    """plain_text / summary が未作成の回答・連絡事項を変換して保存
+
+    戻り値: (回答の件数, 連絡事項の件数)
+    """
+    answers = 0
+    while True:
+        rows = db.session.query(Answer.id, Answer.content, Problem.problem_type).join(
+            Problem, Problem.id == Answer.problem_id
+        ).filter(Answer.summary.is_(None)).order_by(Answer.id).limit(batch_size).all()
+        if not rows:
+            break
+        _backfill(Answer.__table__, [{
+            'row_id': row.id,
+            'plain_text': answer_plain_text(row.content, row.problem_type),
+            'summary': summarize_answer(row.content, row.problem_type),
+        } for row in rows])
+        answers += len(rows)
+
+    announcements = 0
+    while True:
+        rows = db.session.query(Announcement.id, Announcement.content).filter(
+            Announcement.summary.is_(None)
+        ).order_by(Announcement.id).limit(batch_size).all()
+        if not rows:
+            break
+        values = []
+        for row in rows:
+            plain = html_to_text(row.content)
+            values.append({'row_id': row.id, 'plain_text': plain, 'summary': _announcement_summary(plain)})
+        _backfill(Announcement.__table__, values)
+        announcements += len(rows)
+    return answers, announcements
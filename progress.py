@@ -0,0 +1,191 @@
+# 学習進捗エンジン
+# 通常の問題（Problem/Answer）と日本語課題3種類の状況を、データ元ごとに1回のクエリで集計する。
+# 生徒1人の進捗ページと、クラス全体の「生徒×課題」マトリクスの両方で使う
+
+from sqlalchemy import and_
+
+from models import db, User, Problem, Answer, Feedback, problem_assignments
+from task_summary import ASSIGNMENT_MODELS
+from japanese_delivery import ITEM_COLUMNS
+
+# データ元（問題 + 日本語課題3種類）
+SOURCES = ['problem', 'quiz', 'flashcard', 'writing']
+
+SOURCE_LABELS = {
+    'problem': '問題',
+    'quiz': '熟語クイズ',
+    'flashcard': 'フラッシュカード',
+    'writing': '書き取り',
+}
+
+# 状態: 未回答 / 回答済み（確認待ち） / フィードバック済み
+UNANSWERED = 'unanswered'
+ANSWERED = 'answered'
+FEEDBACK_RECEIVED = 'feedback_received'
+
+
+def _status(answered, has_feedback):
+    if not answered:
+        return UNANSWERED
+    return FEEDBACK_RECEIVED if has_feedback else ANSWERED
+
+
+def _has_feedback(column):
+    """フィードバックが入力されているか（空文字は未入力とみなす）"""
+    return and_(column.isnot(None), column != '')
+
+
+def _problem_rows(student_ids, problem_columns):
+    """配信済み問題と回答・フィードバックを1回のクエリで取得
+
+    problem_columns: 問題側で取得するカラム（本文が不要ならエンティティ全体を読まない）
+    各行: (student_id, *problem_columns, answer_id, score, feedback_created_at)
+    """
+    return db.session.query(
+        problem_assignments.c.student_id, *problem_columns, Answer.id, Feedback.score, Feedback.created_at
+    ).join(
+        Problem, Problem.id == problem_assignments.c.problem_id
+    ).outerjoin(
+        Answer, and_(Answer.problem_id == problem_assignments.c.problem_id,
+                     Answer.student_id == problem_assignments.c.student_id)
+    ).outerjoin(
+        Feedback, Feedback.answer_id == Answer.id
+    ).filter(
+        problem_assignments.c.student_id.in_(student_ids)
+    ).order_by(Problem.created_at.desc(), Problem.id.desc()).all()
+
+
+def _japanese_rows(task_type, student_ids):
+    """日本語課題1種類の状況を1回のクエリで取得"""
+    model = ASSIGNMENT_MODELS[task_type]
+    item_model = getattr(model, task_type).property.mapper.class_
+    item_column = getattr(model, ITEM_COLUMNS[task_type])
+    return db.session.query(
+        model.student_id, model.id, item_column, item_model.word, model.assigned_at,
+        model.completed, model.completed_at, _has_feedback(model.teacher_feedback)
+    ).join(
+        item_model, item_model.id == item_column
+    ).filter(
+        model.student_id.in_(student_ids)
+    ).order_by(model.assigned_at.desc(), model.id).all()
+
+
+def _empty_stats():
+    return {'total': 0, 'answered': 0, 'with_feedback': 0}
+
+
+def _count(stats, status):
+    stats['total'] += 1
+    if status != UNANSWERED:
+        stats['answered'] += 1
+    if status == FEEDBACK_RECEIVED:
+        stats['with_feedback'] += 1
+
+
+def _finish_stats(stats):
+    """件数から未回答数・確認待ち数・完了率を計算"""
+    stats['unanswered'] = stats['total'] - stats['answered']
+    stats['pending_feedback'] = stats['answered'] - stats['with_feedback']
+    stats['completion_rate'] = int(stats['answered'] / stats['total'] * 100) if stats['total'] > 0 else 0
+    return stats
+
+
+def get_student_progress(student_id):
+    """生徒1人の進捗（問題別の状況、日本語課題の状況、データ元ごとと全体の統計）"""
+    problem_stats = []
+    for _, problem, answer_id, score, feedback_at in _problem_rows([student_id], (Problem,)):
+        status = _status(answer_id is not None, feedback_at is not None)
+        problem_stats.append({
+            'problem': problem,
+            'answer': {'id': answer_id} if answer_id else None,
+            'status': status,
+            'feedback_status': {'score': score, 'created_at': feedback_at} if feedback_at else None,
+        })
+
+    japanese_stats = []
+    for task_type in ASSIGNMENT_MODELS:
+        for _, assignment_id, item_id, word, assigned_at, completed, completed_at, has_feedback in \
+                _japanese_rows(task_type, [student_id]):
+            japanese_stats.append({
+                'type': task_type,
+                'assignment_id': assignment_id,
+                'item_id': item_id,
+                'word': word,
+                'assigned_at': assigned_at,
+                'completed_at': completed_at,
+                'status': _status(completed, has_feedback),
+            })
+    japanese_stats.sort(key=lambda x: (x['assigned_at'] is not None, x['assigned_at']), reverse=True)
+
+    by_source = {source: _empty_stats() for source in SOURCES}
+    overall = _empty_stats()
+    for item in problem_stats:
+        _count(by_source['problem'], item['status'])
+        _count(overall, item['status'])
+    for item in japanese_stats:
+        _count(by_source[item['type']], item['status'])
+        _count(overall, item['status'])
+
+    return {
+        'problem_stats': problem_stats,
+        'japanese_stats': japanese_stats,
+        'by_source': {source: _finish_stats(stats) for source, stats in by_source.items()},
+        'stats': _finish_stats(overall),
+    }
+
+
+def get_class_matrix(student_ids=None, sources=None):
+    """クラス全体の「生徒×課題」状況マトリクス
+
+    student_ids: 対象の生徒ID（Noneなら全生徒）
+    sources: 対象のデータ元（Noneなら全て）
+    戻り値: {
+        'students': [{'id', 'name', 'stats'}],
+        'columns': [{'key', 'type', 'id', 'title', 'date'}],  # 新しい順
+        'cells': {student_id: {column_key: status}},
+    }
+    """
+    sources = [s for s in (sources or SOURCES) if s in SOURCES]
+    student_query = User.query.filter(User.role == 'student')
+    if student_ids is not None:
+        student_query = student_query.filter(User.id.in_(student_ids))
+    students = student_query.order_by(User.display_name).all()
+    ids = [s.id for s in students]
+
+    columns = {}
+    cells = {sid: {} for sid in ids}
+    stats = {sid: _empty_stats() for sid in ids}
+
+    def add(student_id, task_type, item_id, title, date, status):
+        key = f'{task_type}:{item_id}'
+        column = columns.get(key)
+        if column is None:
+            columns[key] = {'key': key, 'type': task_type, 'id': item_id, 'title': title, 'date': date}
+        elif date and (column['date'] is None or date > column['date']):
+            column['date'] = date
+        cells[student_id][key] = status
+        _count(stats[student_id], status)
+
+    if ids and 'problem' in sources:
+        problem_columns = (Problem.id, Problem.title, Problem.created_at)
+        for student_id, problem_id, title, created_at, answer_id, _, feedback_at in \
+                _problem_rows(ids, problem_columns):
+            add(student_id, 'problem', problem_id, title, created_at,
+                _status(answer_id is not None, feedback_at is not None))
+
+    for task_type in ASSIGNMENT_MODELS:
+        if not ids or task_type not in sources:
+            continue
+        for student_id, _, item_id, word, assigned_at, completed, _, has_feedback in \
+                _japanese_rows(task_type, ids):
+            add(student_id, task_type, item_id, word, assigned_at, _status(completed, has_feedback))
+
+    ordered_columns = sorted(columns.values(), key=lambda c: (c['date'] is not None, c['date']), reverse=True)
+    return {
+        'students': [
+            {'id': s.id, 'name': s.display_name, 'stats': _finish_stats(stats[s.id])}
+            for s in students
+        ],
+        'columns': ordered_columns,
+        'cells': cells,
+    }
@@ -0,0 +1,96 @@
+# 自由練習用の熟語クイズのランダム出題
+# 問題のIDだけをカテゴリ別にプロセス内へキャッシュしておき、
+# 出題のたびに全件を読み込まずに、選んだ1問だけを主キーで取得する。
+# 問題を追加・削除する処理では invalidate_quiz_pool() を呼び、古いID一覧を使わないようにする。
+# （無効化は同じプロセス内のみ。他ワーカーでの追加は最大で有効期間だけ遅れて出題対象になる。
+#  他ワーカーで削除された問題を引いた場合は、その場でID一覧を読み直して選び直す）
+
+import random
+import threading
+import time
+
+from flask import current_app
+
+from models import db, JapaneseQuiz
+
+# ID一覧のキャッシュの有効期間（秒）の既定値。設定 QUIZ_POOL_TTL で変更できる
+DEFAULT_TTL = 300
+
+_lock = threading.Lock()
+_pool = None  # (有効期限, バージョン, {カテゴリ: (ID, ...)})
+_version = 0  # 無効化の回数（読み込み中に無効化されたID一覧を保存しないため）
+
+
+def _ttl():
+    return current_app.config.get('QUIZ_POOL_TTL', DEFAULT_TTL)
+
+
+def _load_ids():
+    """カテゴリ別の問題IDを読む（IDとカテゴリのみ。問題本体は読まない）"""
+    by_category = {}
+    for quiz_id, category in db.session.query(JapaneseQuiz.id, JapaneseQuiz.category).order_by(JapaneseQuiz.id):
+        by_category.setdefault(category or 'general', []).append(quiz_id)
+    return {category: tuple(ids) for category, ids in by_category.items()}
+
+
+def get_quiz_pool():
+    """カテゴリ別の問題ID {カテゴリ: (ID, ...)}（有効期間内ならキャッシュから）"""
+    global _pool
+    now = time.monotonic()
+    with _lock:
+        pool = _pool
+        version = _version
+    if pool and pool[0] > now and pool[1] == version:
+        return pool[2]
+
+    ids = _load_ids()
+    ttl = _ttl()
+    if ttl > 0:
+        with _lock:
+            # 読み込み中に invalidate_quiz_pool() された場合は古い一覧を保存しない
+            if _version == version:
+                _pool = (now + ttl, version, ids)
+    return ids
+
+
+def invalidate_quiz_pool():
+    """問題の追加・削除のコミット後に呼び出し、ID一覧のキャッシュを破棄する"""
+    global _pool, _version
+    with _lock:
+        _pool = None
+        _version += 1
+
+
+def _pick_id(pool, category_weights=None):
+    """ID一覧から1問選ぶ
+
+    category_weights: {カテゴリ: 重み}。指定がなければ全問から均等に選ぶ。
+    重みは1問あたりの出やすさの倍率で、指定のないカテゴリは1として扱う（0で出題しない）
+    """
+    categories = [category for category, ids in pool.items() if ids]
+    if not categories:
+        return None
+    weights = [len(pool[category]) * (category_weights or {}).get(category, 1) for category in categories]
+    if sum(weights) <= 0:
+        return None
+    category = random.choices(categories, weights=weights)[0]
+    return random.choice(pool[category])
+
+
+def sample_quiz(category_weights=None):
+    """ランダムに1問取得（問題がなければ None）
+
+    category_weights は _pick_id() を参照。未指定の場合は設定 QUIZ_CATEGORY_WEIGHTS を使う
+    """
+    if category_weights is None:
+        category_weights = current_app.config.get('QUIZ_CATEGORY_WEIGHTS') or None
+    for _ in range(2):
+        quiz_id = _pick_id(get_quiz_pool(), category_weights)
+        if quiz_id is None:
+            return None
+        quiz = db.session.get(JapaneseQuiz, quiz_id)
+        if quiz is not None:
+            return quiz
+        # 他のワーカーで削除された問題：ID一覧を読み直して選び直す
+        invalidate_quiz_pool()
+    return None
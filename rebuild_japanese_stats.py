@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+日本語学習統計の再集計スクリプト
+生徒ごと・熟語ごとの回答数・正解数・連続正解数を回答履歴から作り直します。
+実行方法: python rebuild_japanese_stats.py
+"""
+
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from japanese_stats import rebuild_japanese_stats
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        count = rebuild_japanese_stats()
+        print(f'✅ {count}人分の日本語学習統計を再集計しました')
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+全文検索インデックスの再構築スクリプト
+問題・再利用コンポーネント・連絡事項から検索用のドキュメントを作り直します。
+実行方法: python rebuild_search_index.py
+"""
+
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from search_index import rebuild_search_index
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        counts = rebuild_search_index()
+        print(f"✅ 検索インデックスを作成しました（問題 {counts['problem']}件 / "
+              f"コンポーネント {counts['component']}件 / 連絡事項 {counts['announcement']}件）")
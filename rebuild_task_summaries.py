@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+日本語課題グループ集計の再構築スクリプト
+既存の課題データから生徒ダッシュボード用の集計テーブルを作り直します。
+実行方法: python rebuild_task_summaries.py
+"""
+
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from task_summary import rebuild_task_summaries
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        created = rebuild_task_summaries()
+        print(f'✅ {created}件の課題グループ集計を作成しました。')
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+先生ダッシュボード集計の再集計スクリプト
+問題数・生徒数・未確認の回答数を数え直し、ディスク使用量とDBサイズを計測します。
+実行方法: python reconcile_dashboard_stats.py
+"""
+
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from dashboard_stats import reconcile_stats, sample_system_metrics
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        row = reconcile_stats()
+        sample_system_metrics()
+        print(f'✅ 再集計しました（問題 {row.problems}件 / 生徒 {row.students}人 / 未確認の回答 {row.pending_answers}件）')
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+書き取り画像の復元スクリプト
+BLOB_KEEP_DB_COPY でDBに残したBase64から、BLOBストアにない（壊れた）画像ファイルを書き戻します。
+--clear を付けると、ファイルを確認できた行のBase64を消してDBにはキーのみ残します
+（永続ディスクに移ったあと、BLOB_KEEP_DB_COPY を止めるときに1回だけ実行する）。
+実行方法: python restore_writing_blobs.py [--clear]
+"""
+
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import JapaneseWritingAssignment
+from blob_store import save_data_url, verify_blob
+
+# 1回に読み込む行数（Base64画像は1件数百KBになるため小さめ）
+BATCH_SIZE = 50
+
+
+def restore_writing_blobs(clear=False):
+    """戻り値: (書き戻したファイル数, Base64を消した行数)"""
+    restored = 0
+    cleared = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(
+            JapaneseWritingAssignment.id, JapaneseWritingAssignment.result_image,
+            JapaneseWritingAssignment.result_image_key
+        ).filter(
+            JapaneseWritingAssignment.id > last_id,
+            JapaneseWritingAssignment.result_image_key.isnot(None),
+            JapaneseWritingAssignment.result_image.isnot(None)
+        ).order_by(JapaneseWritingAssignment.id).limit(BATCH_SIZE).all()
+        if not rows:
+            break
+        confirmed = []
+        for row_id, data_url, key in rows:
+            last_id = row_id
+            if not verify_blob(key):
+                try:
+                    if save_data_url(data_url) != key:
+                        print(f'  skip id={row_id}: Base64の内容がキー {key} と一致しません')
+                        continue
+                except (ValueError, OSError) as e:
+                    print(f'  skip id={row_id}: {e}')
+                    continue
+                restored += 1
+            confirmed.append(row_id)
+        if clear and confirmed:
+            db.session.query(JapaneseWritingAssignment).filter(
+                JapaneseWritingAssignment.id.in_(confirmed)
+            ).update({'result_image': None}, synchronize_session=False)
+            db.session.commit()
+            cleared += len(confirmed)
+    return restored, cleared
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        restored, cleared = restore_writing_blobs(clear='--clear' in sys.argv[1:])
+        print(f'✅ {restored}件の画像ファイルを書き戻しました。')
+        if cleared:
+            print(f'✅ {cleared}件の行のBase64を削除しました。')
@@ -0,0 +1,154 @@
+# 先生用 日本語課題レビューキュー
+# 完了済み課題を (配信バッチ, 生徒) の新しい順に keyset ページングで取得する。
+# 課題タイプごとに「一覧に必要なカラムだけ」を問題・生徒とJOINして LIMIT 付きで読み、
+# Python側で1ページ分にマージする（履歴が増えても1ページの読み込み量は一定）
+
+from flask import url_for
+from sqlalchemy import case, literal, null, or_
+
+from models import db, User
+from task_summary import ASSIGNMENT_MODELS
+from japanese_delivery import ITEM_COLUMNS
+from pagination import encode_cursor, decode_cursor, keyset_after
+
+# グループ内での課題タイプの表示順
+TYPE_RANKS = {'quiz': 0, 'flashcard': 1, 'writing': 2}
+
+# 課題タイプごとのタイトルの接頭辞
+TITLE_PREFIXES = {'quiz': 'クイズ', 'flashcard': 'カード', 'writing': '書き取り'}
+
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+
+def _sort_key(row):
+    """ソートキー (batch_id, student_id, タイプ順, id)
+
+    配信バッチ・生徒は新しい順（降順）、グループ内は配信順（昇順）
+    """
+    return (row['batch_id'], row['student_id'], TYPE_RANKS[row['type']], row['id'])
+
+
+def _python_order(row):
+    batch_id, student_id, rank, row_id = _sort_key(row)
+    return (-batch_id, -student_id, rank, row_id)
+
+
+def _fetch_type(task_type, limit, cursor=None, needs_feedback=False, student_id=None):
+    """1種類の課題をソート順に limit 件取得"""
+    model = ASSIGNMENT_MODELS[task_type]
+    item_model = getattr(model, task_type).property.mapper.class_
+    item_column = getattr(model, ITEM_COLUMNS[task_type])
+
+    if task_type == 'quiz':
+        is_correct = model.is_correct
+    else:
+        is_correct = null()
+    if task_type == 'writing':
+        image_key = model.result_image_key
+        # BLOBストア未移行の行だけ旧形式のデータURLを読む
+        legacy_image = case((model.result_image_key.is_(None), model.result_image), else_=null())
+    else:
+        image_key = null()
+        legacy_image = null()
+
+    query = db.session.query(
+        model.id, model.batch_id, model.student_id, User.display_name, item_model.word,
+        model.assigned_at, model.completed_at, model.teacher_feedback,
+        is_correct, image_key, legacy_image
+    ).join(User, User.id == model.student_id).join(
+        item_model, item_model.id == item_column
+    ).filter(
+        model.completed == True,
+        model.batch_id.isnot(None)
+    )
+
+    if needs_feedback:
+        query = query.filter(or_(model.teacher_feedback.is_(None), model.teacher_feedback == ''))
+    if student_id is not None:
+        query = query.filter(model.student_id == student_id)
+
+    order = [
+        (model.batch_id, True),
+        (model.student_id, True),
+        (literal(TYPE_RANKS[task_type]), False),
+        (model.id, False),
+    ]
+    if cursor is not None:
+        query = query.filter(keyset_after(order, cursor))
+    query = query.order_by(model.batch_id.desc(), model.student_id.desc(), model.id)
+
+    rows = []
+    for (row_id, batch_id, sid, student_name, word, assigned_at, completed_at,
+         feedback, correct, key, legacy) in query.limit(limit).all():
+        rows.append({
+            'type': task_type,
+            'id': row_id,
+            'batch_id': batch_id,
+            'student_id': sid,
+            'student_name': student_name,
+            'title': f"{TITLE_PREFIXES[task_type]}: {word}",
+            'assigned_at': assigned_at,
+            'completed_at': completed_at,
+            'feedback': feedback,
+            'is_correct': correct,
+            'result_image_key': key,
+            'legacy_image': legacy,
+        })
+    return rows
+
+
+def _status(row):
+    """テンプレートで使う状態コード"""
+    if row['type'] == 'quiz':
+        return 'correct' if row['is_correct'] else 'incorrect'
+    if row['type'] == 'flashcard':
+        return 'learned'
+    return 'completed'
+
+
+def _image_urls(row):
+    """書き取り画像の (原寸URL, サムネイルURL)"""
+    if row['result_image_key']:
+        return (url_for('serve_blob', key=row['result_image_key']),
+                url_for('serve_blob_derivative', key=row['result_image_key'], variant='thumb'))
+    return row['legacy_image'], None
+
+
+def get_review_queue(cursor=None, limit=DEFAULT_PAGE_SIZE, needs_feedback=False, student_id=None):
+    """レビューキューの1ページを取得
+
+    cursor: 前ページの next_cursor（最初のページはNone）
+    戻り値: {'items': [...], 'next_cursor': 次ページのカーソル（最後のページはNone）}
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    cursor_values = decode_cursor(cursor, 4) if cursor else None
+
+    rows = []
+    for task_type in ASSIGNMENT_MODELS:
+        rows.extend(_fetch_type(task_type, limit + 1, cursor_values, needs_feedback, student_id))
+    rows.sort(key=_python_order)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        image, thumbnail = _image_urls(row)
+        items.append({
+            'type': row['type'],
+            'id': row['id'],
+            'batch_id': row['batch_id'],
+            'student_id': row['student_id'],
+            'student_name': row['student_name'],
+            'title': row['title'],
+            'assigned_at': row['assigned_at'],
+            'completed_at': row['completed_at'],
+            'feedback': row['feedback'],
+            'status': _status(row),
+            'result_image': image,
+            'result_thumbnail': thumbnail,
+        })
+
+    next_cursor = encode_cursor(_sort_key(rows[-1])) if has_more else None
+    return {'items': items, 'next_cursor': next_cursor}
@@ -0,0 +1,338 @@
+# 全文検索（問題・再利用コンポーネント・連絡事項）
+# 書き込み時に search_documents の行を作成・更新・削除し、問題エディタの検索APIから
+# スコア順・ページ単位で検索する。
+#
+# 日本語は単語の区切りがないため、かな・漢字の連続は文字2-gram（「漢字練習」→ 漢字 字練 練習）、
+# 英数字は単語単位に分割し、空白区切りの語として保存する。
+# SQLite では FTS5（search_fts）、PostgreSQL では tsvector の GIN インデックスで検索し、
+# どちらも使えない場合は LIKE で検索する（件数が少ない開発環境向け）。
+
+import json
+import re
+import unicodedata
+from datetime import datetime
+from itertools import groupby
+
+from bs4 import BeautifulSoup
+from sqlalchemy import text
+from sqlalchemy.orm import load_only
+
+from models import db, Problem, Announcement, ProblemComponent, SearchDocument, SEARCH_TSVECTOR
+
+DOC_TYPES = ('problem', 'component', 'announcement')
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+# 検索結果に表示する本文の文字数
+SNIPPET_LENGTH = 120
+# タイトル・本文の重み（SQLite の bm25。PostgreSQL は setweight の A / B）
+TITLE_WEIGHT = 3.0
+BODY_WEIGHT = 1.0
+
+_WORD = re.compile(r'[^\W_]+')
+_SPACES = re.compile(r'\s+')
+
+# FTS5 表の有無（プロセスごとに1回だけ確認する）
+_sqlite_fts = None
+
+
+def _is_cjk(ch):
+    code = ord(ch)
+    return (0x3040 <= code <= 0x30FF      # ひらがな・カタカナ
+            or 0x3400 <= code <= 0x4DBF   # CJK統合漢字拡張A
+            or 0x4E00 <= code <= 0x9FFF   # CJK統合漢字
+            or 0xF900 <= code <= 0xFAFF)  # CJK互換漢字
+
+
+def tokenize(value):
+    """文字列を検索語に分割
+
+    NFKC正規化・小文字化した上で、かな・漢字の連続は文字2-gram（1文字だけならその文字）、
+    それ以外の英数字は単語のまま返す
+    """
+    value = unicodedata.normalize('NFKC', value or '').lower()
+    tokens = []
+    for word in _WORD.findall(value):
+        for is_cjk, run in groupby(word, key=_is_cjk):
+            run = ''.join(run)
+            if is_cjk and len(run) > 1:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            else:
+                tokens.append(run)
+    return tokens
+
+
+def _query_terms(query):
+    """検索語を (語, 前方一致か) の一覧にする
+
+    2-gram 以外の語（1文字のかな・漢字、英数字の単語）は入力途中でも見つかるよう前方一致にする
+    """
+    terms = []
+    for token in dict.fromkeys(tokenize(query)):
+        bigram = len(token) == 2 and all(_is_cjk(ch) for ch in token)
+        terms.append((token, not bigram))
+    return terms
+
+
+def html_text(html_content):
+    if not html_content:
+        return ''
+    return _SPACES.sub(' ', BeautifulSoup(html_content, 'html.parser').get_text(' ')).strip()
+
+
+def _choices_text(choices_json):
+    # JSONカラムの値はリストとして読み込まれる（移行前の文字列の値も受け付ける）
+    choices = choices_json or []
+    if isinstance(choices, str):
+        try:
+            choices = json.loads(choices)
+        except ValueError:
+            return ''
+    if not isinstance(choices, list):
+        return ''
+    return ' '.join(html_text(str(c)) for c in choices if c is not None)
+
+
+# ===== ドキュメントの作成 =====
+
+def _problem_document(problem):
+    body = html_text(problem.content)
+    return problem.title, body
+
+
+def _announcement_document(announcement):
+    body = html_text(announcement.content)
+    return announcement.title, body
+
+
+_COMPONENT_LABELS = {
+    'text': '📝 テキスト',
+    'widget-text': '✏️ 記述回答欄',
+    'widget-choice': '🔴 選択回答欄 (単一)',
+    'widget-checkbox': '☑️ 選択回答欄 (複数)',
+}
+
+
+def _component_document(component):
+    description = (component.description or '').strip()
+    label = _COMPONENT_LABELS.get(component.component_type, component.component_type)
+    title = f"{label}: {description.splitlines()[0]}" if description else label
+    if component.component_type == 'text':
+        body = html_text(component.content)
+    else:
+        body = ' '.join(filter(None, [description, _choices_text(component.choices_json)]))
+    return title, body
+
+
+_BUILDERS = {
+    'problem': _problem_document,
+    'component': _component_document,
+    'announcement': _announcement_document,
+}
+
+
+def _row(doc_type, obj):
+    title, body = _BUILDERS[doc_type](obj)
+    title = (title or '')[:200]
+    return {
+        'doc_type': doc_type,
+        'doc_id': obj.id,
+        'title': title,
+        'snippet': body[:SNIPPET_LENGTH],
+        'title_tokens': ' '.join(tokenize(title)),
+        'body_tokens': ' '.join(tokenize(body)),
+        'updated_at': datetime.utcnow(),
+    }
+
+
+def index_documents(doc_type, objects):
+    """問題・コンポーネント・連絡事項を検索インデックスに登録（既存なら置き換え）
+
+    呼び出し元のトランザクション内で実行し、コミットは呼び出し元で行う。
+    新規作成したオブジェクトはIDを確定させるためにflushする。
+    """
+    objects = [obj for obj in objects if obj is not None]
+    if not objects:
+        return
+    if any(obj.id is None for obj in objects):
+        db.session.flush()
+    rows = [_row(doc_type, obj) for obj in objects]
+    remove_documents(doc_type, [row['doc_id'] for row in rows])
+    db.session.execute(db.insert(SearchDocument), rows)
+
+
+def remove_documents(doc_type, doc_ids):
+    """削除した問題・コンポーネント・連絡事項を検索インデックスから除く（コミットは呼び出し元）"""
+    doc_ids = [int(doc_id) for doc_id in doc_ids]
+    if not doc_ids:
+        return
+    db.session.execute(
+        db.delete(SearchDocument).where(
+            SearchDocument.doc_type == doc_type, SearchDocument.doc_id.in_(doc_ids)
+        ).execution_options(synchronize_session=False)
+    )
+
+
+def index_problem(problem):
+    index_documents('problem', [problem])
+
+
+def index_announcement(announcement):
+    index_documents('announcement', [announcement])
+
+
+def index_components(components):
+    index_documents('component', components)
+
+
+_SOURCES = {
+    'problem': (Problem, ('id', 'title', 'content')),
+    'component': (ProblemComponent, ('id', 'content', 'component_type', 'description', 'choices_json')),
+    'announcement': (Announcement, ('id', 'title', 'content')),
+}
+
+
+def rebuild_search_index(batch_size=200):
+    """検索インデックスを元データから作り直す（導入時・不整合の修復用）
+
+    戻り値: 種類ごとの登録件数
+    """
+    counts = {}
+    db.session.execute(db.delete(SearchDocument))
+    if db.session.get_bind().dialect.name == 'sqlite' and _has_sqlite_fts():
+        db.session.execute(text("INSERT INTO search_fts(search_fts) VALUES ('rebuild')"))
+    for doc_type, (model, columns) in _SOURCES.items():
+        counts[doc_type] = 0
+        last_id = 0
+        while True:
+            objects = model.query.options(load_only(*(getattr(model, c) for c in columns))).filter(
+                model.id > last_id
+            ).order_by(model.id).limit(batch_size).all()
+            if not objects:
+                break
+            db.session.execute(db.insert(SearchDocument), [_row(doc_type, obj) for obj in objects])
+            counts[doc_type] += len(objects)
+            last_id = objects[-1].id
+            db.session.expunge_all()
+    db.session.commit()
+    return counts
+
+
+# ===== 検索 =====
+
+def _has_sqlite_fts():
+    global _sqlite_fts
+    if _sqlite_fts is None:
+        _sqlite_fts = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_fts'"
+        )).first() is not None
+    return _sqlite_fts
+
+
+def _fts5_query(terms):
+    # 各語を引用符で囲んで AND 検索（引用符内の " は "" でエスケープ）
+    return ' '.join('"{}"{}'.format(term.replace('"', '""'), '*' if prefix else '') for term, prefix in terms)
+
+
+def _tsquery(terms):
+    # 語は英数字・かな・漢字のみなので引用符で囲めば演算子として解釈されない
+    return ' & '.join("'{}'{}".format(term, ':*' if prefix else '') for term, prefix in terms)
+
+
+def _type_filter(doc_types, params):
+    if not doc_types:
+        return ''
+    names = []
+    for i, doc_type in enumerate(doc_types):
+        params[f'type_{i}'] = doc_type
+        names.append(f':type_{i}')
+    return f" AND d.doc_type IN ({', '.join(names)})"
+
+
+def _search_sqlite(terms, doc_types, limit, offset):
+    params = {'q': _fts5_query(terms), 'limit': limit, 'offset': offset,
+              'title_weight': TITLE_WEIGHT, 'body_weight': BODY_WEIGHT}
+    sql = (
+        "SELECT d.doc_type, d.doc_id, d.title, d.snippet, "
+        "bm25(search_fts, :title_weight, :body_weight) AS rank "
+        "FROM search_fts JOIN search_documents d ON d.id = search_fts.rowid "
+        "WHERE search_fts MATCH :q" + _type_filter(doc_types, params) +
+        " ORDER BY rank, d.id DESC LIMIT :limit OFFSET :offset"
+    )
+    # bm25 は小さいほど一致度が高いので、符号を反転してスコアにする
+    return [(row.doc_type, row.doc_id, row.title, row.snippet, -row.rank)
+            for row in db.session.execute(text(sql), params)]
+
+
+def _search_postgresql(terms, doc_types, limit, offset):
+    params = {'q': _tsquery(terms), 'limit': limit, 'offset': offset}
+    sql = (
+        f"SELECT d.doc_type, d.doc_id, d.title, d.snippet, ts_rank({SEARCH_TSVECTOR}, q.query) AS rank "
+        f"FROM search_documents d, to_tsquery('simple', :q) AS q(query) "
+        f"WHERE {SEARCH_TSVECTOR} @@ q.query" + _type_filter(doc_types, params) +
+        " ORDER BY rank DESC, d.id DESC LIMIT :limit OFFSET :offset"
+    )
+    return [(row.doc_type, row.doc_id, row.title, row.snippet, float(row.rank))
+            for row in db.session.execute(text(sql), params)]
+
+
+def _search_like(terms, doc_types, limit, offset):
+    query = SearchDocument.query
+    for term, _prefix in terms:
+        # 部分一致なので前方一致の語（例: 「漢」→「漢字」）もそのまま見つかる
+        pattern = f'%{term}%'
+        query = query.filter(db.or_(SearchDocument.title_tokens.like(pattern),
+                                    SearchDocument.body_tokens.like(pattern)))
+    if doc_types:
+        query = query.filter(SearchDocument.doc_type.in_(doc_types))
+    rows = query.order_by(SearchDocument.updated_at.desc(), SearchDocument.id.desc()).offset(offset).limit(limit).all()
+    return [(row.doc_type, row.doc_id, row.title, row.snippet, 0.0) for row in rows]
+
+
+def _attach_components(items):
+    """コンポーネントの結果にはエディタへそのまま挿入できるよう本文HTMLを付ける"""
+    ids = [item['id'] for item in items if item['type'] == 'component']
+    if not ids:
+        return
+    components = {c.id: c for c in ProblemComponent.query.options(
+        load_only(ProblemComponent.id, ProblemComponent.content, ProblemComponent.component_type)
+    ).filter(ProblemComponent.id.in_(ids))}
+    for item in items:
+        component = components.get(item['id']) if item['type'] == 'component' else None
+        if component:
+            item['component_type'] = component.component_type
+            item['content'] = component.content
+
+
+def search(query, doc_types=None, page=1, limit=DEFAULT_PAGE_SIZE):
+    """全文検索（スコアの高い順）
+
+    query: 検索語（空白区切りの語はすべて含むものを検索）
+    doc_types: 'problem' / 'component' / 'announcement' の一覧（None なら全種類）
+    戻り値: {'items': [{'type', 'id', 'title', 'snippet', 'score', ...}], 'page': ページ番号, 'has_more': 次ページの有無}
+    """
+    doc_types = [t for t in (doc_types or []) if t in DOC_TYPES]
+    page = max(1, int(page))
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    terms = _query_terms(query)
+    if not terms:
+        return {'items': [], 'page': page, 'has_more': False}
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        run = _search_postgresql
+    elif dialect == 'sqlite' and _has_sqlite_fts():
+        run = _search_sqlite
+    else:
+        run = _search_like
+    rows = run(terms, doc_types, limit + 1, (page - 1) * limit)
+
+    items = [{
+        'type': doc_type,
+        'id': doc_id,
+        'title': title,
+        'snippet': snippet or '',
+        'score': round(score, 4),
+    } for doc_type, doc_id, title, snippet, score in rows[:limit]]
+    _attach_components(items)
+    return {'items': items, 'page': page, 'has_more': len(rows) > limit}
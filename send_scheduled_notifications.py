@@ -10,6 +10,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import app
 from models import db, ScheduledNotification, Announcement, Problem, Feedback, User
+from live_events import publish_problem, publish_announcement, publish_feedback
 
 
 def send_scheduled_notifications():
@@ -61,6 +62,7 @@ def send_announcement_notification(scheduled):
         recipients = list(announcement.recipients)
     
     sent_count = send_push(announcement, recipients)
+    publish_announcement(announcement, None if announcement.is_global else [r.id for r in recipients])
     print(f"    連絡事項「{announcement.title}」を{sent_count}人に送信")
 
 
@@ -75,6 +77,7 @@ def send_problem_notification(scheduled):
     
     recipients = list(problem.assigned_students)
     sent_count = send_push(problem, recipients)
+    publish_problem(problem, [r.id for r in recipients])
     print(f"    問題「{problem.title}」を{sent_count}人に送信")
 
 
@@ -89,6 +92,8 @@ def send_feedback_notification(scheduled):
     
     student = feedback.answer.student if feedback.answer else None
     send_push(feedback, student)
+    if student:
+        publish_feedback(student.id, feedback.answer.problem.title, f"/problem/{feedback.answer.problem_id}")
     print(f"    フィードバックを{student.display_name if student else '不明'}に送信")
 
 
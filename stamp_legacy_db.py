@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+マイグレーション履歴の初期化スクリプト
+db.create_all() だけで作成されたデータベース（alembic_version がない）に、
+初期スキーマ（04f6311a912a: GradeKanji追加）まで適用済みと記録します。
+以降の変更は flask db upgrade で適用されます（既にあるテーブル・列は各マイグレーションでスキップ）。
+実行方法: python stamp_legacy_db.py
+"""
+
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask_migrate import stamp
+
+from app import app, db
+
+# db.create_all() で作成されるスキーマに相当するリビジョン
+LEGACY_REVISION = '04f6311a912a'
+
+if __name__ == '__main__':
+    with app.app_context():
+        inspector = db.inspect(db.engine)
+        if inspector.has_table('alembic_version') and db.session.execute(
+            db.text('SELECT version_num FROM alembic_version')
+        ).first():
+            print('マイグレーション履歴は記録済みです。')
+        else:
+            db.session.remove()
+            stamp(revision=LEGACY_REVISION)
+            print(f'✅ マイグレーション履歴を {LEGACY_REVISION} として記録しました。')
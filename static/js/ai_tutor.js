@@ -0,0 +1,103 @@
+// 七夢学習アプリ - AIチューターの回答のストリーミング表示
+// data-stream-url を持つフォームの送信を横取りし、回答を /api/japanese/ai-tutor/stream から
+// 受け取ったそばから表示する（SSE形式: text イベントの連続のあと done または error）。
+// ストリームを読めないブラウザや接続に失敗した場合は、通常のフォーム送信で回答ページを表示する。
+
+(function () {
+    const form = document.querySelector('form[data-stream-url]');
+    if (!form || !window.fetch || !window.ReadableStream || !window.TextDecoder) return;
+
+    const container = document.getElementById('ai-stream');
+    const output = container.querySelector('[data-stream-output]');
+    const loading = document.getElementById('ai-loading');
+    const errorBox = document.getElementById('ai-stream-error');
+    const button = form.querySelector('button[type="submit"]');
+    let busy = false;
+
+    function removeRendered() {
+        // 通常送信で表示した回答・エラーはストリーミング表示に置き換える
+        document.querySelectorAll('[data-ai-rendered]').forEach(el => el.remove());
+    }
+
+    function showError(message) {
+        errorBox.textContent = message;
+        errorBox.style.display = '';
+    }
+
+    function handle(event, data) {
+        if (event === 'text') {
+            loading.style.display = 'none';
+            container.style.display = '';
+            output.textContent += data.text;
+        } else if (event === 'error') {
+            loading.style.display = 'none';
+            showError(data.error);
+        }
+        return event === 'done' || event === 'error';
+    }
+
+    // SSE形式のテキストからイベントを取り出す（戻り値: 終了イベントを受け取ったか）
+    function parse(block) {
+        let event = 'message';
+        const lines = [];
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) lines.push(line.slice(5).trimStart());
+        });
+        if (!lines.length) return false;
+        return handle(event, JSON.parse(lines.join('\n')));
+    }
+
+    async function stream() {
+        const response = await fetch(form.dataset.streamUrl, {
+            method: 'POST',
+            body: new FormData(form),
+            headers: { 'Accept': 'text/event-stream' },
+            credentials: 'same-origin'
+        });
+        if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finished = false;
+        while (!finished) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let end;
+            while (!finished && (end = buffer.indexOf('\n\n')) !== -1) {
+                finished = parse(buffer.slice(0, end));
+                buffer = buffer.slice(end + 2);
+            }
+        }
+        if (!finished) showError('回答の受信が途中で終わりました。もう一度お試しください。');
+    }
+
+    form.addEventListener('submit', async function (event) {
+        event.preventDefault();
+        if (busy) return;
+        busy = true;
+        button.disabled = true;
+        removeRendered();
+        output.textContent = '';
+        container.style.display = 'none';
+        errorBox.style.display = 'none';
+        loading.style.display = '';
+        try {
+            await stream();
+        } catch (e) {
+            console.error('回答のストリーミングに失敗しました:', e);
+            if (!output.textContent) {
+                // 何も表示できていなければ通常の送信でやり直す
+                form.submit();
+                return;
+            }
+            showError('回答の受信が途中で終わりました。もう一度お試しください。');
+        } finally {
+            loading.style.display = 'none';
+            button.disabled = false;
+            busy = false;
+        }
+    });
+})();
@@ -0,0 +1,103 @@
+// 七夢学習アプリ - 自由練習のデッキ移動（フラッシュカード・漢字書き取り）
+// data-deck="デッキの種類" の要素に現在の位置・総数・カードを持たせ、
+// 次の数枚を /api/japanese/deck/<種類> から先読みしておく。
+// 「前」「次」のリンク（data-deck-nav="prev" / "next"）は、先読み済みのカードなら
+// ページを読み込まずに表示を切り替える（先読みしていなければ通常どおりページを移動する）。
+// 表示の切り替えは各ページが 'deck:show' イベント（detail.card）を受けて行う。
+
+(function () {
+    const root = document.querySelector('[data-deck]');
+    if (!root) return;
+
+    const deck = root.dataset.deck;
+    const total = parseInt(root.dataset.total, 10);
+    const prefetchCount = parseInt(root.dataset.prefetch || '5', 10);
+    const cards = new Map();  // 位置 -> カード
+    let current = parseInt(root.dataset.index, 10);
+    let loading = false;
+    let enabled = total > 1;
+
+    cards.set(current, JSON.parse(root.dataset.card));
+
+    function wrap(index) {
+        return ((index % total) + total) % total;
+    }
+
+    function cardUrl(index) {
+        const card = cards.get(index);
+        const params = new URLSearchParams(card && card.id ? { id: card.id } : { index: index });
+        return `${location.pathname}?${params}`;
+    }
+
+    function updateNav() {
+        document.querySelectorAll('[data-deck-nav]').forEach(link => {
+            const step = link.dataset.deckNav === 'prev' ? -1 : 1;
+            link.href = cardUrl(wrap(current + step));
+        });
+        document.querySelectorAll('[data-deck-position]').forEach(el => {
+            el.textContent = current + 1;
+        });
+    }
+
+    async function prefetch() {
+        if (loading || !enabled) return;
+        // 先読み済みの先のカードを探し、その次から読み込む
+        let start = wrap(current + 1);
+        let ahead = 0;
+        while (cards.has(start) && ahead < total - 1) {
+            start = wrap(start + 1);
+            ahead++;
+        }
+        // 全カード読み込み済み、または先読みが十分残っている
+        if (ahead >= total - 1 || ahead >= Math.ceil(prefetchCount / 2)) return;
+
+        loading = true;
+        try {
+            const params = new URLSearchParams({ index: start, count: prefetchCount });
+            const response = await fetch(`/api/japanese/deck/${encodeURIComponent(deck)}?${params}`, {
+                headers: { 'Accept': 'application/json' },
+                credentials: 'same-origin'
+            });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const data = await response.json();
+            if (data.total !== total) {
+                // デッキが変わった：以降は通常のページ移動にする
+                enabled = false;
+                return;
+            }
+            data.cards.forEach(card => cards.set(card.index, card));
+            updateNav();
+        } catch (e) {
+            console.error('カードの先読みに失敗しました:', e);
+        } finally {
+            loading = false;
+        }
+    }
+
+    function show(index, push) {
+        const card = cards.get(index);
+        if (!enabled || !card) return false;
+        current = index;
+        updateNav();
+        document.dispatchEvent(new CustomEvent('deck:show', { detail: { card: card } }));
+        if (push) history.pushState({ deckIndex: index }, '', cardUrl(index));
+        prefetch();
+        return true;
+    }
+
+    document.addEventListener('click', function (event) {
+        const link = event.target.closest('[data-deck-nav]');
+        if (!link) return;
+        const step = link.dataset.deckNav === 'prev' ? -1 : 1;
+        if (show(wrap(current + step), true)) event.preventDefault();
+    });
+
+    window.addEventListener('popstate', function (event) {
+        const index = event.state && event.state.deckIndex;
+        if (index === undefined || index === null || !show(index, false)) location.reload();
+    });
+
+    history.replaceState({ deckIndex: current }, '', location.href);
+    updateNav();
+    prefetch();
+})();
@@ -0,0 +1,64 @@
+// 七夢学習アプリ - AI生成ジョブの状態表示
+// data-generation-job='ジョブの状態(JSON)' の要素に状態を表示し、
+// 生成待ち・生成中のジョブは /api/generation-jobs/<id> を定期的に問い合わせて完了を待つ。
+
+(function () {
+    const POLL_INTERVAL = 2000;
+
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text == null ? '' : String(text);
+        return div.innerHTML;
+    }
+
+    function render(el, job) {
+        el.classList.remove('alert-info', 'alert-success', 'alert-error');
+        let html;
+        if (job.status === 'queued') {
+            el.classList.add('alert-info');
+            html = `⏳ ${escapeHtml(job.label)}の生成を待っています...`;
+        } else if (job.status === 'running') {
+            el.classList.add('alert-info');
+            html = `⏳ AIが${escapeHtml(job.label)}を生成中です...（この画面を離れても生成は続きます）`;
+        } else if (job.status === 'succeeded') {
+            el.classList.add('alert-success');
+            html = `✅ ${job.count}件の${escapeHtml(job.label)}を生成しました！`;
+            if (job.cached) html += '（以前の同じ条件の生成結果を再利用しました）';
+            if (job.delivered) html += `（${job.delivered}人の生徒に配信しました）`;
+            if (job.error) html += `<br>⚠️ ${escapeHtml(job.error)}`;
+            if (job.items && job.items.length) {
+                html += '<ul style="margin: 8px 0 0 20px;">' + job.items.map(item => {
+                    const reading = item.correct_reading || item.reading || '';
+                    return `<li><strong>${escapeHtml(item.word)}</strong>${reading ? `（${escapeHtml(reading)}）` : ''}</li>`;
+                }).join('') + '</ul>';
+            }
+            html += `<div style="margin-top: 8px;"><a href="${location.pathname}" class="btn btn-secondary btn-sm">🔄 一覧を更新</a></div>`;
+        } else {
+            el.classList.add('alert-error');
+            html = `❌ ${escapeHtml(job.error || '生成に失敗しました')}`;
+        }
+        el.innerHTML = html;
+    }
+
+    function poll(el, job) {
+        render(el, job);
+        if (job.status !== 'queued' && job.status !== 'running') return;
+        setTimeout(async function () {
+            try {
+                const response = await fetch(`/api/generation-jobs/${job.id}`, {
+                    headers: { 'Accept': 'application/json' },
+                    credentials: 'same-origin'
+                });
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                poll(el, await response.json());
+            } catch (e) {
+                console.error('生成ジョブの状態の取得に失敗しました:', e);
+                poll(el, job);
+            }
+        }, POLL_INTERVAL);
+    }
+
+    document.querySelectorAll('[data-generation-job]').forEach(el => {
+        poll(el, JSON.parse(el.dataset.generationJob));
+    });
+})();
@@ -0,0 +1,83 @@
+// 七夢学習アプリ - リアルタイム更新（Server-Sent Events）
+// /api/events に接続し、新しい問題・連絡事項・フィードバック・回答を受け取ったら
+// アプリ内バナーを表示してページを更新する。
+// 接続が切れた場合はブラウザが Last-Event-ID を付けて自動で再接続する。
+// サーバーの同時接続数が上限に達している場合や EventSource が使えない場合は、
+// /api/check-new を定期的に確認して新着を知らせる。
+
+(function () {
+    const EVENT_TYPES = ['problem', 'announcement', 'feedback', 'answer'];
+    // ポーリングの間隔（ミリ秒）
+    const POLL_INTERVAL = 60000;
+
+    function notify(data) {
+        // 各ページが独自に反映できるようにイベントを通知
+        window.dispatchEvent(new CustomEvent('nanami:live-event', { detail: data }));
+
+        // プッシュ通知が有効な場合はFCM側でバナー表示・更新するので重複させない
+        if (window.Notification && Notification.permission === 'granted') return;
+
+        if (typeof showInAppNotification === 'function') {
+            showInAppNotification(data.title, data.body, data.url || '/dashboard');
+        }
+        if (typeof autoRefreshPage === 'function') {
+            autoRefreshPage(data.type, data.url || '/dashboard');
+        }
+    }
+
+    function handleEvent(event) {
+        let data;
+        try {
+            data = JSON.parse(event.data);
+        } catch (e) {
+            return;
+        }
+        notify(data);
+    }
+
+    // ===== フォールバック: /api/check-new のポーリング =====
+
+    let version = null;
+
+    function newItemType(result) {
+        if (result.new_problems) return 'problem';
+        if (result.new_announcements) return 'announcement';
+        if (result.new_feedback) return 'feedback';
+        return null;
+    }
+
+    function checkNew() {
+        const url = version === null ? '/api/check-new' : '/api/check-new?since=' + version;
+        fetch(url, { credentials: 'same-origin' })
+            .then(response => response.ok ? response.json() : null)
+            .then(result => {
+                if (!result) return;
+                const type = result.has_new ? newItemType(result) : null;
+                version = result.version;
+                if (type) {
+                    notify({ type: type, title: '🔔 新着があります', body: 'ダッシュボードを確認してください', url: '/dashboard' });
+                }
+            })
+            .catch(() => {});
+    }
+
+    function startPolling() {
+        checkNew();
+        setInterval(checkNew, POLL_INTERVAL);
+    }
+
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    const source = new EventSource('/api/events');
+    EVENT_TYPES.forEach(type => source.addEventListener(type, handleEvent));
+
+    // 503（同時接続数の上限）などで接続を断られるとブラウザは再接続しないので、ポーリングに切り替える
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED) {
+            startPolling();
+        }
+    });
+})();
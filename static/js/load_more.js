@@ -0,0 +1,66 @@
+// 七夢学習アプリ - 一覧の「もっと見る」
+// data-load-more="一覧の種類" のボタンを押すと /api/lists/<種類> から次のページを読み込み、
+// data-target で指定した要素の末尾に追加する。
+// 追加後は 'list:loaded' イベントを発行するので、各ページはチェックボックス等を再設定できる。
+
+(function () {
+    async function loadMore(button) {
+        const view = button.dataset.loadMore;
+        const target = document.getElementById(button.dataset.target);
+        if (!target || button.disabled) return;
+
+        const label = button.textContent;
+        button.disabled = true;
+        button.textContent = '読み込み中...';
+        try {
+            const params = new URLSearchParams({ cursor: button.dataset.cursor || '' });
+            const response = await fetch(`/api/lists/${encodeURIComponent(view)}?${params}`, {
+                headers: { 'Accept': 'application/json' },
+                credentials: 'same-origin'
+            });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const data = await response.json();
+
+            target.insertAdjacentHTML('beforeend', data.html);
+            if (data.next_cursor) {
+                button.dataset.cursor = data.next_cursor;
+                button.disabled = false;
+                button.textContent = label;
+            } else {
+                (button.parentElement || button).remove();
+            }
+            document.dispatchEvent(new CustomEvent('list:loaded', {
+                detail: { view: view, target: target, items: data.items }
+            }));
+        } catch (e) {
+            console.error('一覧の読み込みに失敗しました:', e);
+            button.disabled = false;
+            button.textContent = label;
+            alert('読み込みに失敗しました。もう一度お試しください。');
+        }
+    }
+
+    document.addEventListener('click', function (event) {
+        const button = event.target.closest('[data-load-more]');
+        if (!button) return;
+        event.preventDefault();
+        loadMore(button);
+    });
+
+    // 一覧の項目から POST 送信する（項目ごとに隠しフォームを置かずに済むように）
+    window.postAction = function (url, fields) {
+        const form = document.createElement('form');
+        form.method = 'POST';
+        form.action = url;
+        form.style.display = 'none';
+        Object.entries(fields || {}).forEach(([name, value]) => {
+            const input = document.createElement('input');
+            input.type = 'hidden';
+            input.name = name;
+            input.value = value;
+            form.appendChild(input);
+        });
+        document.body.appendChild(form);
+        form.submit();
+    };
+})();
@@ -0,0 +1,203 @@
+# 日本語課題グループ集計モジュール
+# 生徒ダッシュボードは JapaneseTaskSummary を1回読むだけで済むように、
+# 課題の配信・完了・フィードバック時にグループ単位で集計を更新する
+
+from itertools import groupby
+
+from models import (
+    db, JapaneseTaskSummary, JapaneseAssignment,
+    JapaneseFlashcardAssignment, JapaneseWritingAssignment
+)
+
+# 課題タイプごとのモデル
+ASSIGNMENT_MODELS = {
+    'quiz': JapaneseAssignment,
+    'flashcard': JapaneseFlashcardAssignment,
+    'writing': JapaneseWritingAssignment,
+}
+
+# 課題タイプごとの表示ラベル（タイトル, 単位）
+TASK_LABELS = {
+    'quiz': ('熟語クイズ', '問'),
+    'flashcard': ('フラッシュカード', '枚'),
+    'writing': ('書き取り練習', '問'),
+}
+
+def summary_key(task_type, assignment):
+    """課題から集計キー (student_id, task_type, batch_id) を作成"""
+    return (assignment.student_id, task_type, assignment.batch_id)
+
+
+def _build_summary_values(items):
+    """グループ内の課題行から集計値を計算
+
+    items: (id, assigned_at, completed, teacher_feedback, feedback_seen) のリスト
+    """
+    items = sorted(items, key=lambda x: x[0])
+    completed_count = sum(1 for item in items if item[2])
+    # 未完了のものがあれば最初の未完了を、なければ最初の課題を次の課題にする
+    next_item = next((item for item in items if not item[2]), items[0])
+    return {
+        'group_date': max(item[1] for item in items),
+        'count': len(items),
+        'completed_count': completed_count,
+        'has_feedback': any(bool(item[3]) for item in items),
+        'has_unseen_feedback': any(bool(item[3]) and not item[4] for item in items),
+        'next_assignment_id': next_item[0],
+    }
+
+
+def _summary_columns(model):
+    return (model.id, model.assigned_at, model.completed,
+            model.teacher_feedback, model.feedback_seen)
+
+
+def refresh_task_summary(student_id, task_type, batch_id):
+    """1グループ分の集計を再計算（コミットは呼び出し側で行う）"""
+    if batch_id is None:
+        return None
+    model = ASSIGNMENT_MODELS[task_type]
+    items = db.session.query(*_summary_columns(model)).filter(
+        model.student_id == student_id,
+        model.batch_id == batch_id
+    ).all()
+
+    summary = JapaneseTaskSummary.query.filter_by(
+        student_id=student_id,
+        task_type=task_type,
+        batch_id=batch_id
+    ).first()
+
+    if not items:
+        # グループの課題がすべて削除された
+        if summary:
+            db.session.delete(summary)
+        return None
+
+    if not summary:
+        summary = JapaneseTaskSummary(
+            student_id=student_id,
+            task_type=task_type,
+            batch_id=batch_id
+        )
+        db.session.add(summary)
+
+    for field, value in _build_summary_values(items).items():
+        setattr(summary, field, value)
+    return summary
+
+
+def refresh_task_summaries(keys):
+    """複数グループの集計を更新してコミット
+
+    keys: (student_id, task_type, batch_id) のイテラブル
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    db.session.flush()
+    for student_id, task_type, batch_id in keys:
+        refresh_task_summary(student_id, task_type, batch_id)
+    db.session.commit()
+
+
+def collect_summary_keys(task_type, assignments):
+    """削除前の課題リストから集計キーを集める"""
+    return {summary_key(task_type, a) for a in assignments}
+
+
+def rebuild_task_summaries(student_id=None):
+    """集計を課題テーブルから作り直す（初回導入・整合性チェック用）"""
+    summary_query = JapaneseTaskSummary.query
+    if student_id is not None:
+        summary_query = summary_query.filter_by(student_id=student_id)
+    summary_query.delete()
+
+    created = 0
+    for task_type, model in ASSIGNMENT_MODELS.items():
+        query = db.session.query(
+            model.student_id, model.batch_id, *_summary_columns(model)
+        ).filter(model.batch_id.isnot(None))
+        if student_id is not None:
+            query = query.filter(model.student_id == student_id)
+        rows = query.order_by(model.student_id, model.batch_id).all()
+
+        for (sid, batch_id), group in groupby(rows, key=lambda row: (row[0], row[1])):
+            summary = JapaneseTaskSummary(
+                student_id=sid,
+                task_type=task_type,
+                batch_id=batch_id,
+                **_build_summary_values([row[2:] for row in group])
+            )
+            db.session.add(summary)
+            created += 1
+
+    db.session.commit()
+    return created
+
+
+def get_student_japanese_tasks(student_id):
+    """生徒ダッシュボード用の日本語課題グループ一覧を取得（新しい順）"""
+    summaries = JapaneseTaskSummary.query.filter_by(
+        student_id=student_id
+    ).order_by(JapaneseTaskSummary.group_date.desc()).all()
+
+    japanese_tasks = []
+    for s in summaries:
+        label, unit = TASK_LABELS[s.task_type]
+        if s.all_completed:
+            title = f"{label} ({s.completed_count}/{s.count}{unit}完了)"
+        else:
+            title = f"{label} ({s.count}{unit})"
+        japanese_tasks.append({
+            'type': f"{s.task_type}_group",
+            'title': title,
+            'assignment_id': s.next_assignment_id,
+            'created_at': s.group_date,
+            'completed': s.all_completed,
+            'feedback': s.has_feedback,
+            'unseen_feedback': s.has_unseen_feedback,
+            'count': s.count
+        })
+    return japanese_tasks
+
+
+def get_group_navigation(task_type, assignment):
+    """同じ配信バッチ内の課題一覧と前後の課題IDを取得"""
+    model = ASSIGNMENT_MODELS[task_type]
+    # 問題本体へのリレーション名は課題タイプと同じ（quiz / flashcard / writing）
+    relation = getattr(model, task_type)
+    same_group = model.query.options(db.joinedload(relation)).filter(
+        model.student_id == assignment.student_id,
+        model.batch_id == assignment.batch_id
+    ).order_by(model.id).all()
+
+    # 現在位置と前後のIDを計算
+    current_index = next((i for i, a in enumerate(same_group) if a.id == assignment.id), 0)
+    total_count = len(same_group)
+    prev_id = same_group[current_index - 1].id if current_index > 0 else None
+    next_id = same_group[current_index + 1].id if current_index < total_count - 1 else None
+
+    return {
+        'current': current_index + 1,
+        'total': total_count,
+        'prev_id': prev_id,
+        'next_id': next_id,
+        'group_items': same_group
+    }
+
+
+def find_next_pending(task_type, assignment, same_group_only=False):
+    """次の未完了課題を探す（同じ配信バッチを優先、ID順）"""
+    model = ASSIGNMENT_MODELS[task_type]
+    pending = model.query.filter(
+        model.student_id == assignment.student_id,
+        model.completed == False,
+        model.id != assignment.id
+    )
+    next_assignment = pending.filter(
+        model.batch_id == assignment.batch_id
+    ).order_by(model.id).first()
+    if next_assignment or same_group_only:
+        return next_assignment
+    return pending.order_by(model.id).first()
@@ -0,0 +1,116 @@
+# ログインユーザーのキャッシュ
+# Flask-Login の load_user は認証済みリクエストのたびに users テーブルを読むため、
+# ユーザーのカラム値をプロセス内に短時間だけ保持して再利用する。
+# ユーザー情報を変更する処理では invalidate_user() を呼び、古い値を使わないようにする。
+#
+# 他のワーカー・プロセスでの変更も反映するため、user_cache_versions テーブルの世代（1行）を共有する。
+# User の変更・削除をフラッシュすると同じトランザクション内で世代を加算し、
+# キャッシュを使う前に毎回この世代を主キー1回で読んで、保存時の世代と違えばDBから読み直す。
+# （権限に関わる role・is_chinese_student やユーザーの存在が、変更のコミット後に古い値で返ることはない）
+#
+# キャッシュから復元したインスタンスは merge(load=False) でセッションに結び付けるので、
+# 通常の User と同様にリレーションの参照や変更のコミットができる。
+
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from models import db, User, UserCacheVersion
+from db_utils import insert_ignore
+
+# キャッシュの有効期間（秒）の既定値。設定 USER_CACHE_TTL で変更できる
+DEFAULT_TTL = 30
+
+_lock = threading.Lock()
+_cache = {}  # user_id -> (有効期限, 共有の世代, カラム値の辞書)
+_generations = {}  # user_id -> 無効化の回数（読み込み中に無効化された値を保存しないため）
+
+
+def _ttl():
+    return current_app.config.get('USER_CACHE_TTL', DEFAULT_TTL)
+
+
+def _snapshot(user):
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+def _restore(values):
+    """カラム値から User を作り、DBを読まずに現在のセッションへ結び付ける"""
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def _shared_version():
+    """全ワーカーで共有するキャッシュの世代（行がまだなければ0）"""
+    return db.session.execute(
+        db.select(UserCacheVersion.version).where(UserCacheVersion.id == 1)
+    ).scalar() or 0
+
+
+def _bump_shared_version(connection):
+    """共有の世代を加算（行がなければ作成してから加算する）"""
+    connection.execute(insert_ignore(UserCacheVersion.__table__).values(id=1, version=0))
+    connection.execute(
+        db.update(UserCacheVersion.__table__).where(UserCacheVersion.__table__.c.id == 1)
+        .values(version=UserCacheVersion.__table__.c.version + 1)
+    )
+
+
+def get_user(user_id):
+    """ユーザーを取得（有効期間内で世代が同じならキャッシュから、なければDBから）"""
+    now = time.monotonic()
+    version = _shared_version()
+    with _lock:
+        entry = _cache.get(user_id)
+        generation = _generations.get(user_id, 0)
+    if entry and entry[0] > now and entry[1] == version:
+        return _restore(entry[2])
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    ttl = _ttl()
+    if ttl > 0:
+        with _lock:
+            # 読み込み中に invalidate_user() された場合は古い値を保存しない
+            if _generations.get(user_id, 0) == generation:
+                _cache[user_id] = (now + ttl, version, _snapshot(user))
+    return user
+
+
+def _invalidate_local(user_id):
+    with _lock:
+        _cache.pop(user_id, None)
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+
+
+def invalidate_user(user_id):
+    """ユーザー情報の変更後に呼び出し、キャッシュを破棄する（他のワーカーのキャッシュも無効にする）
+
+    ORMでの変更はフラッシュ時に自動で無効化されるので、これはORMを通さない変更のための保険
+    """
+    _invalidate_local(user_id)
+    with db.engine.begin() as connection:
+        _bump_shared_version(connection)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_changed_users(session, flush_context):
+    """User の変更・削除をフラッシュしたら、同じトランザクション内で共有の世代を加算する"""
+    changed = [obj.id for obj in session.dirty if isinstance(obj, User) and session.is_modified(obj, include_collections=False)]
+    changed += [obj.id for obj in session.deleted if isinstance(obj, User)]
+    if not changed:
+        return
+    for user_id in changed:
+        _invalidate_local(user_id)
+    _bump_shared_version(session.connection())
+
+
+def clear_user_cache():
+    with _lock:
+        _cache.clear()
+        _generations.clear()